@@ -0,0 +1,165 @@
+# benchmarks/fakes.py
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from db.connection import _decode_vector, encode_vector
+from routes.kafka_client import VideoEmbedding, VideoInteraction
+from services.embedding_engine import EMBEDDING_DIMENSION
+
+# Synthetic data
+
+def synthetic_embeddings(n: int, rng: np.random.Generator, dimension: int = EMBEDDING_DIMENSION) -> np.ndarray:
+    """(n, dimension) float32 unit vectors"""
+    embeddings = rng.standard_normal((n, dimension), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+def synthetic_interactions(
+    n_users: int,
+    per_user: int,
+    video_ids: Sequence[str],
+    rng: np.random.Generator
+) -> List[VideoInteraction]:
+    """Interactions spread over the last 90 days, per_user for each of n_users"""
+    now = datetime.now(timezone.utc)
+    interactions = []
+    for user in range(n_users):
+        for _ in range(per_user):
+            age = timedelta(seconds=int(rng.integers(0, 90 * 86400)))
+            interactions.append(VideoInteraction(
+                userId=f"user_{user}",
+                videoId=video_ids[int(rng.integers(len(video_ids)))],
+                viewDuration=int(rng.integers(1, 120)),
+                liked=bool(rng.random() < 0.2),
+                commented=bool(rng.random() < 0.05),
+                shared=bool(rng.random() < 0.02),
+                timestamp=(now - age).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+                weightedScore=float(rng.random() * 5),
+            ))
+    return interactions
+
+def synthetic_video(video_id: str, embedding: np.ndarray) -> VideoEmbedding:
+    """A ready video with a small metadata payload"""
+    return VideoEmbedding(
+        id=video_id,
+        userId="creator_0",
+        title=f"Video {video_id}",
+        description="Synthetic benchmark video",
+        fileUrl=f"https://example.com/{video_id}.mp4",
+        createdAt="2024-01-01T00:00:00.000Z",
+        metadata={"labels": ["cat", "outdoor", "music"], "shots": 12},
+        status="ready",
+        duration=42,
+        embedding=embedding.tolist(),
+        trendingScore=1.0,
+    )
+
+# Postgres
+
+class FakeConnection:
+    """
+    Answers the queries issued by ml_processor and ml_consumer from memory
+    Vectors are held pgvector-encoded and decoded on every read, so the cost
+    of the binary codec is part of each measurement.
+    """
+
+    def __init__(self, database: "FakeDatabase"):
+        self.database = database
+
+    async def fetch(self, query: str, *args) -> List[Dict[str, Any]]:
+        if "FROM analytics" in query:
+            return [{"video_id": video_id} for video_id in self.database.seen.get(args[0], [])[:args[1]]]
+        if "ORDER BY trending_score" in query:
+            return [{"id": video_id} for video_id in list(self.database.videos)[:args[0]]]
+        if "extract(epoch FROM created_at)" in query:
+            # Ranking attributes spread over 50 creators and the last 30 days
+            now = datetime.now(timezone.utc).timestamp()
+            return [
+                {"id": video_id, "user_id": f"creator_{i % 50}", "trending_score": float(i % 97), "created_at": now - (i % 30) * 86400}
+                for i, video_id in enumerate(self.database.videos)
+            ]
+        if "FROM videos" in query:
+            return [
+                {"id": video_id, "embedding": _decode_vector(self.database.videos[video_id])}
+                for video_id in args[0] if video_id in self.database.videos
+            ]
+        if "INSERT INTO user_embeddings" in query:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            rows = []
+            for user_id, encoded in zip(args[0], args[1]):
+                self.database.users[user_id] = (encode_vector(encoded), now)
+                rows.append({"user_id": user_id, "updated_at": now, "pg_notify": ""})
+            return rows
+        if "FROM user_embeddings" in query:
+            return [
+                {"user_id": user_id, "embedding": _decode_vector(encoded), "updated_at": updated_at}
+                for user_id in args[0] if user_id in self.database.users
+                for encoded, updated_at in [self.database.users[user_id]]
+            ]
+        raise NotImplementedError(f"Unexpected query: {query}")
+
+    async def fetchval(self, query: str, *args) -> Any:
+        if "FROM analytics" in query:
+            return min(self.database.interaction_counts.get(args[0], 0), args[1])
+        raise NotImplementedError(f"Unexpected query: {query}")
+
+    async def execute(self, query: str, *args) -> str:
+        return "UPDATE 0"
+
+class FakeDatabase:
+    """In-memory stand-in for the asyncpg pool"""
+
+    def __init__(self):
+        self.videos: Dict[str, bytes] = {}
+        self.users: Dict[str, tuple] = {}
+        self.interaction_counts: Dict[str, int] = {}  # analytics rows per user
+        self.seen: Dict[str, List[str]] = {}  # Distinct videos per user in analytics
+
+    def add_videos(self, video_ids: Sequence[str], embeddings: np.ndarray) -> None:
+        for video_id, embedding in zip(video_ids, embeddings):
+            self.videos[video_id] = encode_vector(embedding)
+
+    def add_users(self, user_ids: Sequence[str], embeddings: np.ndarray, days_old: int = 3) -> None:
+        updated_at = (datetime.now(timezone.utc) - timedelta(days=days_old)).replace(tzinfo=None)
+        for user_id, embedding in zip(user_ids, embeddings):
+            self.users[user_id] = (encode_vector(embedding), updated_at)
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None):
+        yield FakeConnection(self)
+
+# Kafka
+
+class FakeMessage:
+    def __init__(self, topic: str, value: bytes, offset: int):
+        self._topic = topic
+        self._value = value
+        self._offset = offset
+
+    def error(self):
+        return None
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return 0
+
+    def offset(self) -> int:
+        return self._offset
+
+    def value(self) -> bytes:
+        return self._value
+
+class FakeConsumer:
+    """Replays the same encoded batch on every consume() call"""
+
+    def __init__(self, topic: str, values: Sequence[bytes]):
+        self.messages = [FakeMessage(topic, value, offset) for offset, value in enumerate(values)]
+
+    def consume(self, num_messages: int = 1, timeout: float = -1):
+        return self.messages[:num_messages]
+
+    def assignment(self):
+        return []
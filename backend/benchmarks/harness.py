@@ -0,0 +1,128 @@
+# benchmarks/harness.py
+import asyncio
+import gc
+import inspect
+import json
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import numpy as np
+
+class Benchmark(NamedTuple):
+    name: str
+    fn: Callable[[], Any]  # One call is one iteration, awaited if it returns a coroutine
+    ops_per_call: int = 1  # Items handled per call, for per-item throughput
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    iterations: int
+    ops_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    peak_kib_per_call: float  # Peak traced memory above the starting point
+
+async def _invoke(fn: Callable[[], Any]) -> None:
+    """Call fn, awaiting the result when it returns a coroutine"""
+    result = fn()
+    if inspect.isawaitable(result):
+        await result
+
+def _timed_calls(fn: Callable[[], Any], min_time: float, min_iterations: int) -> List[float]:
+    """Per-call latencies in seconds, after one warmup call"""
+    async def run() -> List[float]:
+        await _invoke(fn)
+        latencies = []
+        started = time.perf_counter()
+        while len(latencies) < min_iterations or time.perf_counter() - started < min_time:
+            start = time.perf_counter()
+            await _invoke(fn)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    return asyncio.run(run())
+
+def _peak_memory(fn: Callable[[], Any], iterations: int) -> float:
+    """Mean peak traced bytes per call, NumPy buffers included"""
+    async def run() -> List[int]:
+        peaks = []
+        for _ in range(iterations):
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await _invoke(fn)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        return peaks
+
+    tracemalloc.start()
+    try:
+        peaks = asyncio.run(run())
+    finally:
+        tracemalloc.stop()
+    return float(np.mean(peaks))
+
+def run_benchmark(benchmark: Benchmark, min_time: float = 1.0, min_iterations: int = 5, memory_iterations: int = 3) -> BenchmarkResult:
+    """
+    Time a benchmark, then measure its memory in a separate traced pass
+    Tracing slows allocation down, so it never overlaps the timed calls.
+    """
+    gc.collect()
+    latencies = np.array(_timed_calls(benchmark.fn, min_time, min_iterations))
+    gc.collect()
+    peak = _peak_memory(benchmark.fn, memory_iterations)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return BenchmarkResult(
+        name=benchmark.name,
+        iterations=len(latencies),
+        ops_per_second=benchmark.ops_per_call * len(latencies) / float(latencies.sum()),
+        p50_ms=float(p50),
+        p95_ms=float(p95),
+        p99_ms=float(p99),
+        peak_kib_per_call=peak / 1024,
+    )
+
+def format_results(results: List[BenchmarkResult], baseline: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    """Table of results, with the change against the baseline when one is given"""
+    header = f"{'benchmark':<36} {'ops/s':>12} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak KiB':>10}"
+    if baseline is not None:
+        header += f" {'p50 vs base':>12} {'mem vs base':>12}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        line = (
+            f"{result.name:<36} {result.ops_per_second:>12.1f} {result.p50_ms:>10.3f} "
+            f"{result.p95_ms:>10.3f} {result.p99_ms:>10.3f} {result.peak_kib_per_call:>10.1f}"
+        )
+        if baseline is not None:
+            base = baseline.get(result.name)
+            if base is None:
+                line += f" {'new':>12} {'new':>12}"
+            else:
+                line += f" {_change(result.p50_ms, base['p50_ms']):>12} {_change(result.peak_kib_per_call, base['peak_kib_per_call']):>12}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def _change(current: float, base: float) -> str:
+    if base == 0:
+        return "n/a"
+    return f"{(current - base) / base * 100:+.1f}%"
+
+def regressions(results: List[BenchmarkResult], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Benchmarks whose p50 latency or peak memory grew by more than threshold (a fraction)"""
+    regressed = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        for field in ("p50_ms", "peak_kib_per_call"):
+            current = getattr(result, field)
+            if base[field] > 0 and (current - base[field]) / base[field] > threshold:
+                regressed.append(f"{result.name} {field}: {base[field]:.3f} -> {current:.3f}")
+    return regressed
+
+def save_results(results: List[BenchmarkResult], path: Path) -> None:
+    path.write_text(json.dumps({result.name: result._asdict() for result in results}, indent=2) + "\n")
+
+def load_results(path: Path) -> Optional[Dict[str, Dict[str, float]]]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
@@ -0,0 +1,178 @@
+# benchmarks/recall.py
+"""
+Recall and query latency of compressed vector store settings
+
+    cd backend && python -m benchmarks.recall [--source db] [--dimensions 512,256] [--quantizations none,float16,int8]
+
+Every combination of PCA dimension and quantization is indexed in its own
+LocalVectorStore in a temporary directory, with the configured nlist and
+nprobe, and queried with the same vectors. Recall@k is measured against exact
+float32 top-k over the full-dimension embeddings, so the none/full row shows
+what the IVF probe alone loses and every other row adds its compression loss
+on top.
+
+--source db samples ready videos and user embeddings on the admin pool
+(DIRECT_URL), which is what to check before setting EMBEDDING_PCA_PATH or
+EMBEDDING_QUANTIZATION. The default synthetic corpus is clustered and low
+rank like real embeddings, so it runs without a database but only shows
+relative costs.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+os.environ.setdefault('DATABASE_URL', 'postgresql://benchmark@localhost/benchmark')
+
+import numpy as np
+from db.connection import get_admin_db, init_postgres
+from services.embedding_compression import QUANTIZATIONS, EmbeddingCompressor, PCAProjection, fit_projection, sample_video_embeddings
+from services.embedding_engine import EMBEDDING_DIMENSION
+from services.vector_store import LocalVectorStore
+
+UPSERT_BATCH = 1000
+
+class RecallResult(NamedTuple):
+    quantization: str
+    dimension: int
+    bytes_per_vector: int
+    recall: float
+    p50_ms: float
+    p95_ms: float
+    build_seconds: float
+
+def _normalized(values: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(values, axis=1, keepdims=True)
+    return (values / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+def synthetic_corpus(n_videos: int, n_queries: int, rng: np.random.Generator, rank: int = 64, clusters: int = 200) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Clustered videos on a low-rank subspace, and queries averaging a few videos of a cluster like user embeddings
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (n_videos, d) videos and (n_queries, d) queries, normalized
+    """
+    basis = rng.standard_normal((rank, EMBEDDING_DIMENSION)).astype(np.float32) / np.sqrt(rank)
+    centers = rng.standard_normal((clusters, rank)).astype(np.float32)
+    cluster_of = rng.integers(0, clusters, n_videos)
+    latent = centers[cluster_of] + 0.6 * rng.standard_normal((n_videos, rank)).astype(np.float32)
+    videos = _normalized(latent @ basis + 0.02 * rng.standard_normal((n_videos, EMBEDDING_DIMENSION)).astype(np.float32))
+
+    by_cluster = [np.flatnonzero(cluster_of == cluster) for cluster in range(clusters)]
+    queries = []
+    for cluster in rng.integers(0, clusters, n_queries):
+        members = by_cluster[cluster] if len(by_cluster[cluster]) else np.arange(n_videos)
+        watched = rng.choice(members, min(20, len(members)), replace=False)
+        queries.append(videos[watched].mean(axis=0))
+    return videos, _normalized(np.stack(queries))
+
+async def database_corpus(n_videos: int, n_queries: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sampled ready videos and user embeddings, normalized"""
+    await init_postgres(("admin",))
+    videos = await sample_video_embeddings(n_videos)
+    db_pool = await get_admin_db()
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch("SELECT embedding FROM user_embeddings ORDER BY random() LIMIT $1", n_queries)
+    if not rows:
+        raise SystemExit("No user embeddings to query with")
+    queries = np.stack([np.asarray(row['embedding'], dtype=np.float32) for row in rows])
+    return videos, _normalized(queries)
+
+def exact_top_k(videos: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """(n_queries, k) row indices of the exact float32 nearest videos"""
+    scores = queries @ videos.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+def evaluate(
+    workdir: Path,
+    videos: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    compressor: EmbeddingCompressor,
+    k: int
+) -> RecallResult:
+    """Index the videos with one setting and measure recall@k and per-query latency"""
+    quantizer = compressor.quantizer
+    name = f"{quantizer.mode}_{compressor.dimension}"
+    started = time.perf_counter()
+    store = LocalVectorStore(workdir / name, compressor=compressor)
+    for start in range(0, len(videos), UPSERT_BATCH):
+        store.upsert_sync([
+            {'id': str(i), 'values': videos[i]}
+            for i in range(start, min(start + UPSERT_BATCH, len(videos)))
+        ])
+    build_seconds = time.perf_counter() - started
+
+    store.query_sync(queries[0], k)  # Warm the mapping and list caches
+    hits = 0
+    latencies = []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        matches = store.query_sync(query, k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(expected.tolist()) & {int(match.id) for match in matches})
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    return RecallResult(
+        quantization=quantizer.mode,
+        dimension=compressor.dimension,
+        bytes_per_vector=compressor.dimension * quantizer.dtype.itemsize + (4 if quantizer.scaled else 0),
+        recall=hits / (len(queries) * k),
+        p50_ms=float(p50),
+        p95_ms=float(p95),
+        build_seconds=build_seconds,
+    )
+
+def format_results(results: List[RecallResult], k: int) -> str:
+    header = f"{'quantization':<13}{'dimension':>10}{'bytes/vec':>11}{f'recall@{k}':>11}{'p50 ms':>9}{'p95 ms':>9}{'build s':>9}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        lines.append(
+            f"{result.quantization:<13}{result.dimension:>10}{result.bytes_per_vector:>11,}{result.recall:>11.3f}"
+            f"{result.p50_ms:>9.2f}{result.p95_ms:>9.2f}{result.build_seconds:>9.1f}"
+        )
+    return "\n".join(lines)
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure recall@k and latency of vector store compression settings")
+    parser.add_argument("--source", choices=("synthetic", "db"), default="synthetic", help="Where the videos and queries come from")
+    parser.add_argument("--videos", type=int, default=20000, help="Videos to index")
+    parser.add_argument("--queries", type=int, default=500, help="Queries to run per setting")
+    parser.add_argument("--k", type=int, default=10, help="Matches per query")
+    parser.add_argument("--dimensions", type=_int_list, default=[512, 256, 128], help="Comma-separated PCA dimensions, full dimension always runs")
+    parser.add_argument("--quantizations", default=",".join(QUANTIZATIONS), help="Comma-separated quantizations")
+    args = parser.parse_args()
+
+    if args.source == "db":
+        videos, queries = asyncio.run(database_corpus(args.videos, args.queries))
+    else:
+        videos, queries = synthetic_corpus(args.videos, args.queries, np.random.default_rng(0))
+    k = min(args.k, len(videos))
+    truth = exact_top_k(videos, queries, k)
+    print(f"{len(videos):,} videos, {len(queries):,} queries, exact float32 top-{k} as ground truth", file=sys.stderr)
+
+    projections: List[Optional[PCAProjection]] = [None]
+    for dimension in sorted(set(args.dimensions), reverse=True):
+        if dimension >= videos.shape[1]:
+            continue
+        projection = fit_projection(videos, dimension)
+        print(f"PCA {dimension}: {projection.explained_variance:.1%} of the energy kept", file=sys.stderr)
+        projections.append(projection)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for projection in projections:
+            for quantization in args.quantizations.split(','):
+                compressor = EmbeddingCompressor(quantization, projection, videos.shape[1])
+                print(f"Evaluating {quantization} at {compressor.dimension}...", file=sys.stderr)
+                results.append(evaluate(Path(workdir), videos, queries, truth, compressor, k))
+    print(format_results(results, k))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
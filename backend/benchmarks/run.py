@@ -0,0 +1,230 @@
+# benchmarks/run.py
+"""
+Offline microbenchmarks for the embedding, Kafka and recommendation hot paths
+
+    cd backend && python -m benchmarks.run [--filter NAME] [--save-baseline]
+
+Postgres and Kafka are replaced by the in-memory fakes in benchmarks/fakes.py
+and the vector store is a LocalVectorStore in a temporary directory, so no
+service has to be running. Results are compared against
+benchmarks/baseline.json when it exists.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Configure the modules under test before they are imported
+os.environ.setdefault('DATABASE_URL', 'postgresql://benchmark@localhost/benchmark')
+os.environ.setdefault('LOG_SAMPLE_RATE', '0')
+os.environ['VECTOR_STORE_BACKEND'] = 'local'
+
+import numpy as np
+import db.connection
+import services.vector_store
+from benchmarks.fakes import (
+    FakeConsumer,
+    FakeDatabase,
+    synthetic_embeddings,
+    synthetic_interactions,
+    synthetic_video,
+)
+from benchmarks.harness import Benchmark, format_results, load_results, regressions, run_benchmark, save_results
+from routes import kafka_codec
+from routes.kafka_client import KafkaClient, Topics
+from routes.recommendations import get_recommendations
+from services import embedding_engine
+from services.backfill import VideoMatrix, user_embeddings_from_rows
+from services.interaction_window import InteractionWindow
+from services.ml_consumer import flush_interaction_window, get_video_embeddings
+from services.recommendation_cache import get_recommendation_cache
+from services.reranker import rerank
+from services.seen_filter import SeenFilter
+from services.user_embedding_cache import get_user_embedding_cache
+from services.video_attributes import VideoAttributes
+from services.video_embedding_cache import get_video_embedding_cache
+from services.vector_store import LocalVectorStore
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# Workload sizes
+N_VIDEOS = 5000  # Catalog in the vector store and the videos table
+N_USERS = 200  # Users per interaction window
+INTERACTIONS_PER_USER = 25  # 200 x 25 fills a default 5000 interaction window
+KAFKA_BATCH_SIZE = 500  # Matches KAFKA_CONSUMER_MAX_BATCH_SIZE
+
+def build_benchmarks(workdir: Path) -> list[Benchmark]:
+    rng = np.random.default_rng(0)
+    video_ids = [f"video_{i}" for i in range(N_VIDEOS)]
+    video_embeddings = synthetic_embeddings(N_VIDEOS, rng)
+    user_ids = [f"user_{i}" for i in range(N_USERS)]
+
+    database = FakeDatabase()
+    database.add_videos(video_ids, video_embeddings)
+    database.add_users(user_ids, synthetic_embeddings(N_USERS, rng))
+    database.interaction_counts = {user_id: 1000 for user_id in user_ids}
+    database.interaction_counts[user_ids[1]] = 5  # Low history, blended with the cold-start feed
+    database.seen = {user_id: video_ids[:1000] for user_id in user_ids}
+    db.connection.pools.update(api=database, consumer=database, admin=database)
+
+    store = LocalVectorStore(workdir / "vector_store")
+    store.upsert_sync([
+        {'id': video_id, 'values': embedding}
+        for video_id, embedding in zip(video_ids, video_embeddings)
+    ])
+    services.vector_store._vector_store = store
+
+    # One window of interactions, as the consumer receives them
+    interactions = synthetic_interactions(N_USERS, INTERACTIONS_PER_USER, video_ids, rng)
+
+    window = InteractionWindow(max_size=len(interactions) + 1)
+    window.add(interactions)
+    weights_by_user = window.drain()
+    window_video_ids = list({interaction.videoId for interaction in interactions})
+
+    # Backfill chunk: the same interactions as analytics rows in cursor order
+    backfill_videos = VideoMatrix()
+    backfill_videos.add(video_ids, video_embeddings)
+    backfill_rows = sorted(interactions, key=lambda interaction: interaction.userId)
+    backfill_chunk = (
+        [interaction.userId for interaction in backfill_rows],
+        backfill_videos.rows([interaction.videoId for interaction in backfill_rows]),
+        np.array([interaction.weightedScore for interaction in backfill_rows]),
+        embedding_engine.timestamps_to_epoch([interaction.timestamp for interaction in backfill_rows]),
+        backfill_videos.matrix,
+        time.time(),
+    )
+
+    current = synthetic_embeddings(N_USERS, rng)
+    deltas = synthetic_embeddings(N_USERS, rng)
+    days = rng.integers(0, 120, N_USERS).astype(np.float64)
+
+    # Kafka payloads
+    client = KafkaClient()
+    videos = [synthetic_video(video_ids[i], video_embeddings[i]) for i in range(KAFKA_BATCH_SIZE)]
+    binary_consumer = FakeConsumer(Topics.VIDEO_EMBEDDINGS, [client._encode(video) for video in videos])
+    json_consumer = FakeConsumer(Topics.VIDEO_EMBEDDINGS, [kafka_codec.encode_json(video.dict()) for video in videos])
+    interaction_consumer = FakeConsumer(
+        Topics.VIDEO_INTERACTIONS,
+        [client._encode(interaction) for interaction in interactions[:KAFKA_BATCH_SIZE]]
+    )
+
+    # Rerank input: an over-fetched candidate set with clustered creators
+    n_candidates = 1000
+    attributes = VideoAttributes(
+        rows={video_id: row for row, video_id in enumerate(video_ids)},
+        trending_score=rng.exponential(5.0, N_VIDEOS).astype(np.float32),
+        created_at=time.time() - rng.uniform(0, 60 * 86400, N_VIDEOS),
+        creator=rng.integers(0, 100, N_VIDEOS).astype(np.int32),
+    )
+    candidate_ids = video_ids[:n_candidates]
+    similarities = np.sort(rng.uniform(0.2, 0.9, n_candidates))[::-1]
+
+    seen_filter = SeenFilter()
+    seen_filter.add(video_ids[:2000])
+
+    def fresh_window():
+        fresh = InteractionWindow(max_size=len(interactions) + 1)
+        fresh.add(interactions)
+        return fresh
+
+    async def recommendations_uncached():
+        get_recommendation_cache().invalidate(user_ids[0])
+        await get_recommendations(user_id=user_ids[0], limit=20, offset=0, cursor=None)
+
+    async def recommendations_blended():
+        get_recommendation_cache().invalidate(user_ids[1])
+        await get_recommendations(user_id=user_ids[1], limit=20, offset=0, cursor=None)
+
+    async def recommendations_cold_start():
+        # No embedding, served from the in-memory feed
+        get_recommendation_cache().invalidate("new_user")
+        await get_recommendations(user_id="new_user", limit=20, offset=0, cursor=None)
+
+    async def recommendations_cached():
+        await get_recommendations(user_id=user_ids[0], limit=20, offset=0, cursor=None)
+
+    async def user_update_window():
+        # Cold user cache so current embeddings are read and decoded too
+        get_user_embedding_cache().clear()
+        await flush_interaction_window(weights_by_user)
+
+    async def user_update_window_cold():
+        # Every video embedding read from the database as well
+        get_video_embedding_cache().clear()
+        await user_update_window()
+
+    return [
+        Benchmark("merge_embeddings", lambda: embedding_engine.merge_embeddings(current[0], deltas[0])),
+        Benchmark(
+            "merge_decayed_matrix",
+            lambda: embedding_engine.merge_embeddings(embedding_engine.decay_embeddings(current, days), deltas),
+            N_USERS
+        ),
+        Benchmark("interaction_window_add", fresh_window, len(interactions)),
+        Benchmark("get_video_embeddings", lambda: get_video_embeddings(window_video_ids), len(window_video_ids)),
+        Benchmark("user_update_window", user_update_window, len(interactions)),
+        Benchmark("user_update_window_cold", user_update_window_cold, len(interactions)),
+        Benchmark("backfill_user_chunk", lambda: user_embeddings_from_rows(*backfill_chunk), len(interactions)),
+        Benchmark("kafka_encode_video_embedding", lambda: [client._encode(video) for video in videos], len(videos)),
+        Benchmark(
+            "kafka_decode_video_embedding",
+            lambda: client._consume_video_embeddings(binary_consumer, KAFKA_BATCH_SIZE, 0),
+            KAFKA_BATCH_SIZE
+        ),
+        Benchmark(
+            "kafka_decode_video_embedding_json",
+            lambda: client._consume_video_embeddings(json_consumer, KAFKA_BATCH_SIZE, 0),
+            KAFKA_BATCH_SIZE
+        ),
+        Benchmark(
+            "kafka_decode_interactions",
+            lambda: client._consume_interactions(interaction_consumer, KAFKA_BATCH_SIZE, 0),
+            KAFKA_BATCH_SIZE
+        ),
+        Benchmark("seen_filter_unseen", lambda: seen_filter.unseen(video_ids[:1000]), 1000),
+        Benchmark("rerank_candidates", lambda: rerank(candidate_ids, similarities, attributes), n_candidates),
+        Benchmark("recommendations_uncached", recommendations_uncached),
+        Benchmark("recommendations_blended", recommendations_blended),
+        Benchmark("recommendations_cold_start", recommendations_cold_start),
+        Benchmark("recommendations_cached", recommendations_cached),
+    ]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the offline microbenchmarks")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds to spend timing each benchmark")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression threshold as a fraction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        benchmarks = build_benchmarks(Path(workdir))
+        if args.filter:
+            benchmarks = [benchmark for benchmark in benchmarks if args.filter in benchmark.name]
+        results = []
+        for benchmark in benchmarks:
+            print(f"Running {benchmark.name}...", file=sys.stderr)
+            results.append(run_benchmark(benchmark, min_time=args.min_time))
+
+    baseline = None if args.save_baseline else load_results(args.baseline)
+    print(format_results(results, baseline))
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if baseline is not None:
+        regressed = regressions(results, baseline, args.threshold)
+        if regressed:
+            print(f"\nRegressions over {args.threshold:.0%}:")
+            for line in regressed:
+                print(f"  {line}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,14 @@
+import asyncio
 import asyncpg
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, NamedTuple, Optional, Sequence
 import os
+import struct
+import time
+import uuid
+import numpy as np
 from dotenv import load_dotenv
+from services.metrics import DB_POOL_CONNECTIONS, DB_POOL_WAIT_SECONDS
 
 load_dotenv()
 
@@ -10,28 +17,184 @@ if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is required")
     
 DIRECT_URL = os.getenv('DIRECT_URL', DATABASE_URL)
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')  # Optional read replica for analytics and feed reads
+PGVECTOR_SCHEMA = os.getenv('PGVECTOR_SCHEMA', 'public')  # Schema the vector extension is installed in
 
-conn_pool: Optional[asyncpg.Pool] = None
+# Identifies this process in NOTIFY payloads so it can skip its own notifications
+INSTANCE_ID = uuid.uuid4().hex
 
-async def init_postgres() -> None:
-    global conn_pool
+class PoolConfig(NamedTuple):
+    dsn: str
+    min_size: int
+    max_size: int
+    max_inactive_connection_lifetime: float  # 0 keeps idle connections open
+    statement_cache_size: int  # 0 behind PgBouncer in transaction mode
+
+def _pool_config(
+    name: str,
+    dsn: str,
+    min_size: int,
+    max_size: int,
+    max_inactive_connection_lifetime: float,
+    statement_cache_size: int = 256
+) -> PoolConfig:
+    """Pool settings, each overridable as DB_<NAME>_POOL_<SETTING>"""
+    prefix = f"DB_{name.upper()}_POOL_"
+    return PoolConfig(
+        dsn=os.getenv(prefix + 'URL', dsn),
+        min_size=int(os.getenv(prefix + 'MIN_SIZE', str(min_size))),
+        max_size=int(os.getenv(prefix + 'MAX_SIZE', str(max_size))),
+        max_inactive_connection_lifetime=float(os.getenv(prefix + 'MAX_INACTIVE_LIFETIME', str(max_inactive_connection_lifetime))),
+        statement_cache_size=int(os.getenv(prefix + 'STATEMENT_CACHE_SIZE', str(statement_cache_size))),
+    )
+
+# One pool per workload so a consumer burst cannot starve API requests
+POOL_CONFIGS: Dict[str, PoolConfig] = {
+    # Request path, kept warm so the first requests after a deploy skip connecting
+    'api': _pool_config('api', DATABASE_URL, 4, 10, 0),
+    # Consumer reads and writes
+    'consumer': _pool_config('consumer', DATABASE_URL, 1, 5, 300),
+    # Webhooks, backfills and other low-volume writes, direct to the primary
+    'admin': _pool_config('admin', DIRECT_URL, 0, 2, 60),
+}
+if DATABASE_REPLICA_URL:
+    POOL_CONFIGS['replica'] = _pool_config('replica', DATABASE_REPLICA_URL, 2, 10, 0)
+
+class InstrumentedPool:
+    """asyncpg pool that records how long acquire() waits for a connection"""
+
+    def __init__(self, name: str, pool: asyncpg.Pool):
+        self.name = name
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None) -> AsyncIterator[asyncpg.Connection]:
+        start = time.perf_counter()
+        async with self._pool.acquire(timeout=timeout) as conn:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, pool=self.name)
+            yield conn
+
+pools: Dict[str, InstrumentedPool] = {}
+
+def encode_vector(value) -> bytes:
+    """
+    Encode an array-like as a pgvector binary value (dim, unused, big-endian float32s)
+    Bytes are passed through as already encoded. Send vector[] parameters as a
+    list of encoded values, asyncpg would treat each array as a nested dimension.
+    """
+    if isinstance(value, bytes):
+        return value
+    array = np.asarray(value, dtype='>f4')
+    if array.ndim != 1:
+        raise ValueError(f"Expected a 1-dimensional vector, got shape {array.shape}")
+    return struct.pack('>HH', array.shape[0], 0) + array.tobytes()
+
+def _decode_vector(data: bytes) -> np.ndarray:
+    """Decode a pgvector binary value into a native float32 array"""
+    dim, _ = struct.unpack_from('>HH', data)
+    return np.frombuffer(data, dtype='>f4', count=dim, offset=4).astype(np.float32)
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Move vector columns in binary format straight to and from NumPy arrays"""
+    await conn.set_type_codec(
+        'vector',
+        schema=PGVECTOR_SCHEMA,
+        encoder=encode_vector,
+        decoder=_decode_vector,
+        format='binary',
+    )
+
+async def _create_pool(name: str, config: PoolConfig) -> InstrumentedPool:
+    return InstrumentedPool(name, await asyncpg.create_pool(
+        dsn=config.dsn,
+        min_size=config.min_size,
+        max_size=config.max_size,
+        max_inactive_connection_lifetime=config.max_inactive_connection_lifetime,
+        # Hot queries are a handful of fixed statements, keep them prepared for the connection's life
+        statement_cache_size=config.statement_cache_size,
+        max_cached_statement_lifetime=0,
+        init=_init_connection,
+    ))
+
+async def init_postgres(names: Sequence[str] = ('api', 'replica', 'consumer', 'admin')) -> None:
+    """
+    Create the connection pools for the workloads this process runs
+    Args:
+        names: Pools to create, unconfigured ones (e.g. replica) are skipped
+    """
+    names = [name for name in names if name in POOL_CONFIGS and name not in pools]
     try:
-        conn_pool = await asyncpg.create_pool(
-            dsn=DATABASE_URL,
-            min_size=1,
-            max_size=10,
-            max_inactive_connection_lifetime=300,
-        )
+        created = await asyncio.gather(*(_create_pool(name, POOL_CONFIGS[name]) for name in names))
     except Exception as e:
         print(f"Error initializing PostgreSQL connection pool: {e}")
         raise
+    pools.update(zip(names, created))
+
+def _pool_connections() -> Dict[tuple, float]:
+    counts = {}
+    for name, pool in pools.items():
+        idle = pool.get_idle_size()
+        counts[(name, 'idle')] = idle
+        counts[(name, 'in_use')] = pool.get_size() - idle
+    return counts
+
+DB_POOL_CONNECTIONS.set_function(_pool_connections)
+
+def _get_pool(name: str) -> InstrumentedPool:
+    pool = pools.get(name)
+    if pool is None:
+        print(f"{name.upper()} CONN POOL IS NONE")
+    return pool
+
+async def get_db() -> InstrumentedPool:
+    """Pool for the API request path"""
+    return _get_pool('api')
+
+async def get_replica_db() -> InstrumentedPool:
+    """Pool for reads that tolerate replica lag, the API pool when no replica is configured"""
+    return pools.get('replica') or _get_pool('api')
+
+async def get_consumer_db() -> InstrumentedPool:
+    """Pool for the Kafka consumers"""
+    return _get_pool('consumer')
+
+async def get_admin_db() -> InstrumentedPool:
+    """Pool for webhooks and maintenance jobs"""
+    return _get_pool('admin')
+
+async def listen(channel: str, callback: Callable[[str], None], on_connect: Optional[Callable[[], None]] = None) -> None:
+    """
+    Call callback with the payload of every NOTIFY on channel, reconnecting on loss
+    Uses DIRECT_URL since LISTEN does not survive transaction pooling.
+    Args:
+        channel: Channel to LISTEN on
+        callback: Called on the event loop with each payload
+        on_connect: Called after every (re)connect, e.g. to drop state that
+            notifications missed while disconnected would have invalidated
+    """
+    while True:
+        try:
+            conn = await asyncpg.connect(dsn=DIRECT_URL)
+        except Exception as e:
+            print(f"Error connecting listener for {channel}: {e}")
+            await asyncio.sleep(5)
+            continue
+
+        closed = asyncio.Event()
+        conn.add_termination_listener(lambda _: closed.set())
+        try:
+            await conn.add_listener(channel, lambda _conn, _pid, _channel, payload: callback(payload))
+            if on_connect is not None:
+                on_connect()
+            await closed.wait()
+        except asyncio.CancelledError:
+            await conn.close()
+            raise
+        except Exception as e:
+            print(f"Listener for {channel} failed: {e}")
+            await conn.close()
+        await asyncio.sleep(1)
 
-async def get_db() -> asyncpg.Pool:
-    global conn_pool
-    if conn_pool is None:
-        print("CONN POOL IS NONE")
-    try:
-        return conn_pool
-    except Exception as e:
-        print(f"Error getting database connection: {e}")
-        raise
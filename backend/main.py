@@ -3,17 +3,35 @@ from fastapi.middleware.cors import CORSMiddleware
 from routes.webhook import webhook_router
 from routes.kafka_producer import router as kafka_router
 from routes.recommendations import router as recommendations_router
-from db.connection import get_db, init_postgres
-from fastapi import Depends, HTTPException
+from db.connection import get_db, init_postgres, listen
+from fastapi import Depends, HTTPException, Response
 import asyncpg
 import os
 from dotenv import load_dotenv
 import asyncio
 from services.ml_consumer import run_consumers
+from services.ml_processor import (
+    USER_EMBEDDINGS_CHANNEL,
+    VIDEO_EMBEDDINGS_CHANNEL,
+    clear_user_caches,
+    handle_user_embedding_notification,
+    handle_video_embedding_notification,
+)
+from services.user_embedding_cache import get_user_embedding_cache
+from services.metrics import get_metrics_registry
+from services.cold_start_feed import get_cold_start_feed
+from services.seen_filter import get_seen_filter_cache
+from services.video_embedding_cache import get_video_embedding_cache
+from services.video_attributes import get_video_attribute_cache
+from services.vector_store import get_vector_store
 
 load_dotenv()
 
+# Consumers run as standalone workers (services/ml_consumer.py), set to run them in the web process too
+RUN_EMBEDDED_CONSUMERS = os.getenv('RUN_EMBEDDED_CONSUMERS', 'false').lower() == 'true'
+
 app = FastAPI()
+background_tasks = set()  # Keeps startup tasks referenced
 
 # Frontend URL (in production and development)
 FRONTEND_URLS = [
@@ -24,9 +42,25 @@ FRONTEND_URLS = [
 
 @app.on_event("startup")
 async def startup_event():
-    await init_postgres()
-    # Start Kafka consumers in the background
-    asyncio.create_task(run_consumers())
+    # The consumer pool is only needed when the consumers run in this process
+    await init_postgres(('api', 'replica', 'admin') + (('consumer',) if RUN_EMBEDDED_CONSUMERS else ()))
+    # Fail now, not on the first query, if the index was built for another projection
+    await asyncio.to_thread(get_vector_store)
+    # Drop cached user state when a consumer worker rewrites an embedding
+    background_tasks.add(asyncio.create_task(
+        listen(USER_EMBEDDINGS_CHANNEL, handle_user_embedding_notification, clear_user_caches)
+    ))
+    # Keep the cold-start feed for new users in memory
+    background_tasks.add(asyncio.create_task(get_cold_start_feed().run()))
+    # And the attributes recommendations are reranked by
+    background_tasks.add(asyncio.create_task(get_video_attribute_cache().run()))
+    if RUN_EMBEDDED_CONSUMERS:
+        # Start Kafka consumers in the background
+        background_tasks.add(asyncio.create_task(run_consumers()))
+        # Their video embedding cache must see changes made by other processes
+        background_tasks.add(asyncio.create_task(
+            listen(VIDEO_EMBEDDINGS_CHANNEL, handle_video_embedding_notification, get_video_embedding_cache().clear)
+        ))
 
 # Add CORS middleware with specific configuration
 app.add_middleware(
@@ -59,4 +93,18 @@ async def ping(db_pool: asyncpg.Pool = Depends(get_db)):
         result = await db_pool.fetchval("SELECT 1")
         return {"status": "success", "result": result}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cache-stats")
+async def cache_stats():
+    return {
+        "userEmbeddings": get_user_embedding_cache().stats(),
+        "seenFilters": get_seen_filter_cache().stats(),
+        "videoEmbeddings": get_video_embedding_cache().stats(),
+        "videoAttributes": get_video_attribute_cache().stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    registry = get_metrics_registry()
+    return Response(content=registry.render(), media_type=registry.CONTENT_TYPE)
\ No newline at end of file
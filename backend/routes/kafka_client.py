@@ -1,12 +1,40 @@
-import json
-from typing import Dict, Any, List, Union, Literal
-from confluent_kafka import Producer, Consumer, KafkaError
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, TypeVar, Union, Literal
+from confluent_kafka import OFFSET_BEGINNING, Producer, Consumer, KafkaError, KafkaException
 from pathlib import Path
+import numpy as np
 from pydantic import BaseModel
+from . import kafka_codec
+from services.event_log import log_event
+from services.metrics import CONSUMER_BATCH_SIZE, CONSUMER_LAG, CONSUMER_MESSAGES, PRODUCER_MESSAGES, PRODUCER_QUEUE_DEPTH
+
+T = TypeVar("T")
+
+# Consumer batching limits
+CONSUMER_MAX_BATCH_SIZE = int(os.getenv('KAFKA_CONSUMER_MAX_BATCH_SIZE', '500'))
+CONSUMER_MAX_WAIT_SECONDS = float(os.getenv('KAFKA_CONSUMER_MAX_WAIT_SECONDS', '1.0'))
+
+# Async producer backpressure
+PRODUCER_MAX_IN_FLIGHT = int(os.getenv('KAFKA_PRODUCER_MAX_IN_FLIGHT', '10000'))  # Undelivered messages per client
+PRODUCER_ENQUEUE_TIMEOUT_SECONDS = float(os.getenv('KAFKA_PRODUCER_ENQUEUE_TIMEOUT_SECONDS', '5.0'))
+
+# Set to 'json' while consumers that predate the binary format are still running
+EMBEDDING_WIRE_FORMAT = os.getenv('KAFKA_EMBEDDING_WIRE_FORMAT', 'binary')
+
 # Topic names
 class Topics:
     VIDEO_INTERACTIONS = "video-interactions"
     VIDEO_EMBEDDINGS = "video_embedding"
+    # Items that kept failing after retries, reprocessed by python -m services.ml_consumer --replay
+    VIDEO_INTERACTIONS_DLQ = "video-interactions-dlq"
+    VIDEO_EMBEDDINGS_DLQ = "video_embedding-dlq"
+    # Dead-lettered items that still failed on replay, kept for inspection
+    VIDEO_INTERACTIONS_PARKED = "video-interactions-parked"
+    VIDEO_EMBEDDINGS_PARKED = "video_embedding-parked"
 
 # Message type definitions
 class VideoInteraction(BaseModel):
@@ -29,9 +57,14 @@ class VideoEmbedding(BaseModel):
     metadata: Dict[str, Any]  # Google Video Intelligence API results
     status: Literal["processing", "ready", "failed"]
     duration: int | None  # in seconds
-    embedding: List[float] | None  # Vector embedding from video content
+    embedding: List[float] | None  # Vector embedding from video content, a float32 array when consumed
     trendingScore: float
 
+class UserInteractionWeights(BaseModel):
+    """A user's aggregated interaction window, dead-lettered when the update kept failing"""
+    userId: str
+    weights: Dict[str, float]  # videoId -> aggregated interaction weight
+
 class KafkaClient:
     """Confluent Cloud Kafka client"""
     
@@ -39,6 +72,11 @@ class KafkaClient:
         self.producer_config = self._read_config("producer")
         self.consumer_config = self._read_config("consumer")
         self.producer = None  # Lazy initialization
+        self._poll_thread: threading.Thread | None = None
+        self._poll_stop = threading.Event()
+        self._in_flight: asyncio.Semaphore | None = None  # Bounds undelivered async messages
+        # Blocking consumer calls run here so they never stall the event loop
+        self._consumer_executor = ThreadPoolExecutor(thread_name_prefix="kafka-consumer")
         
     def _read_config(self, config_type: Literal["producer", "consumer"]) -> Dict[str, str]:
         """Read the client configuration from client.properties"""
@@ -69,8 +107,17 @@ class KafkaClient:
         """Lazy initialization of producer"""
         if self.producer is None:
             self.producer = Producer(self.producer_config)
+            PRODUCER_QUEUE_DEPTH.set_function(lambda: len(self.producer))
+            # Serve delivery callbacks in the background instead of flushing
+            self._poll_thread = threading.Thread(target=self._poll_loop, name="kafka-producer-poll", daemon=True)
+            self._poll_thread.start()
         return self.producer
 
+    def _poll_loop(self):
+        """Drive delivery callbacks until the client is closed"""
+        while not self._poll_stop.is_set():
+            self.producer.poll(0.1)
+
     def produce_interaction(self, interaction: VideoInteraction) -> bool:
         """
         Produce a video interaction event
@@ -91,22 +138,157 @@ class KafkaClient:
         """
         return self.produce(Topics.VIDEO_EMBEDDINGS, [embedding])
 
+    async def produce_interaction_async(self, interaction: VideoInteraction) -> bool:
+        """
+        Produce a video interaction event without blocking the event loop
+        Args:
+            interaction: The interaction event to produce
+        Returns:
+            bool: True if message was delivered successfully
+        """
+        return await self.produce_async(Topics.VIDEO_INTERACTIONS, [interaction])
+
+    async def produce_interactions_async(self, interactions: List[VideoInteraction]) -> bool:
+        """
+        Produce a batch of video interaction events without blocking the event loop
+        Args:
+            interactions: The interaction events to produce
+        Returns:
+            bool: True if all messages were delivered successfully
+        """
+        return await self.produce_async(Topics.VIDEO_INTERACTIONS, interactions)
+
+    async def produce_video_embedding_async(self, embedding: VideoEmbedding) -> bool:
+        """
+        Produce a video embedding event without blocking the event loop
+        Args:
+            embedding: The video embedding to produce
+        Returns:
+            bool: True if message was delivered successfully
+        """
+        return await self.produce_async(Topics.VIDEO_EMBEDDINGS, [embedding])
+
+    async def produce_async(
+        self,
+        topic: str,
+        messages: List[Union[Dict[str, Any], BaseModel]],
+        headers: Optional[Dict[str, str]] = None
+    ) -> bool:
+        """
+        Produce messages to a Confluent Cloud topic without flushing
+        Messages are enqueued and resolved by the background poll thread. At most
+        PRODUCER_MAX_IN_FLIGHT messages may be undelivered at once, and enqueueing
+        waits while the limit is reached or the local queue is full, up to
+        PRODUCER_ENQUEUE_TIMEOUT_SECONDS per message.
+        Args:
+            topic: The topic to produce to
+            messages: Models or dictionaries to encode
+            headers: Headers added to every message
+        Returns:
+            bool: True if all messages were delivered successfully
+        """
+        try:
+            producer = self._get_producer()
+            loop = asyncio.get_running_loop()
+            if self._in_flight is None:
+                self._in_flight = asyncio.Semaphore(PRODUCER_MAX_IN_FLIGHT)
+
+            deliveries = []
+            for msg in messages:
+                value = self._encode(msg)
+                deadline = loop.time() + PRODUCER_ENQUEUE_TIMEOUT_SECONDS
+                await asyncio.wait_for(self._in_flight.acquire(), timeout=PRODUCER_ENQUEUE_TIMEOUT_SECONDS)
+                delivery = loop.create_future()
+                try:
+                    while True:
+                        try:
+                            producer.produce(
+                                topic,
+                                key=self._message_key(msg),
+                                value=value,
+                                headers=headers,
+                                on_delivery=self._delivery_callback(loop, delivery)
+                            )
+                            break
+                        except BufferError:
+                            # Local queue is full, wait for the poll thread to drain it
+                            if loop.time() >= deadline:
+                                raise
+                            await asyncio.sleep(0.005)
+                except BaseException:
+                    # Not enqueued, no delivery callback will release the permit
+                    self._in_flight.release()
+                    raise
+                deliveries.append(delivery)
+
+            results = await asyncio.gather(*deliveries, return_exceptions=True)
+            failures = [result for result in results if isinstance(result, Exception)]
+            if failures:
+                print(f"Warning: {len(failures)} messages were not delivered: {failures[0]}")
+                return False
+            return True
+        except Exception as e:
+            print(f"Error producing to Confluent Cloud: {e!r}")
+            return False
+
+    def _encode(self, msg: Union[Dict[str, Any], BaseModel]) -> bytes:
+        """
+        Encode a message value
+        Video embeddings use the binary format with a packed float32 embedding,
+        everything else is JSON.
+        """
+        if isinstance(msg, VideoEmbedding) and EMBEDDING_WIRE_FORMAT == 'binary':
+            return kafka_codec.encode_embedding_message(msg.dict(exclude={'embedding'}), msg.embedding)
+        msg_dict = msg.dict() if isinstance(msg, BaseModel) else msg.copy()
+        if isinstance(msg_dict.get('embedding'), np.ndarray):
+            msg_dict['embedding'] = msg_dict['embedding'].tolist()
+        return kafka_codec.encode_json(msg_dict)
+
+    def _message_key(self, msg: Union[Dict[str, Any], BaseModel]) -> bytes | None:
+        """
+        Partition key for a message
+        Interactions and dead-lettered windows are keyed by userId so each user's
+        updates stay ordered on one partition, video embeddings by video id.
+        """
+        if isinstance(msg, (VideoInteraction, UserInteractionWeights)):
+            return msg.userId.encode('utf-8')
+        if isinstance(msg, VideoEmbedding):
+            return msg.id.encode('utf-8')
+        return None
+
+    def _delivery_callback(self, loop: asyncio.AbstractEventLoop, delivery: asyncio.Future):
+        """Build a delivery callback that resolves delivery on its event loop"""
+        def resolve(err):
+            self._in_flight.release()
+            if delivery.done():
+                return
+            if err is not None:
+                delivery.set_exception(RuntimeError(f"Message delivery failed: {err}"))
+            else:
+                delivery.set_result(None)
+
+        def on_delivery(err, msg):
+            # Runs on the poll thread
+            PRODUCER_MESSAGES.inc(topic=msg.topic(), result="failed" if err is not None else "delivered")
+            loop.call_soon_threadsafe(resolve, err)
+        return on_delivery
+
     def produce(self, topic: str, messages: List[Union[Dict[str, Any], BaseModel]]) -> bool:
         """
         Produce messages to a Confluent Cloud topic
         Args:
             topic: The topic to produce to
-            messages: List of dictionaries to be converted to JSON
+            messages: Models or dictionaries to encode
         Returns:
             bool: True if all messages were delivered successfully
         """
         try:
             producer = self._get_producer()
             for msg in messages:
-                msg_dict = msg.dict() if isinstance(msg, BaseModel) else msg.copy()
                 producer.produce(
                     topic,
-                    value=json.dumps(msg_dict).encode('utf-8'),
+                    key=self._message_key(msg),
+                    value=self._encode(msg),
                     callback=self._delivery_report
                 )
             remaining = producer.flush(timeout=10)  # 10 seconds
@@ -132,81 +314,186 @@ class KafkaClient:
         }
         return Consumer(consumer_config)
 
-    def consume_interactions_by_user(self, consumer: Consumer, timeout: float = 1.0) -> Dict[str, List[VideoInteraction]]:
+    async def _run_in_consumer_thread(self, fn: Callable[..., T], *args) -> T:
+        """Run a blocking consumer call on the consumer thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._consumer_executor, fn, *args)
+
+    async def consume_interactions(
+        self,
+        consumer: Consumer,
+        max_messages: int = CONSUMER_MAX_BATCH_SIZE,
+        timeout: float = CONSUMER_MAX_WAIT_SECONDS
+    ) -> List[VideoInteraction]:
         """
-        Consume video interactions and group them by userId
+        Consume a batch of video interactions in arrival order
         Args:
             consumer: The consumer instance to use
-            timeout: How long to wait for messages in seconds
+            max_messages: Maximum number of messages in the batch
+            timeout: Maximum time to wait for the batch in seconds
         Returns:
-            Dict[str, List[VideoInteraction]]: Dictionary of userId -> list of interactions
+            List[VideoInteraction]: List of interactions
         """
-        messages = self.consume_batch(consumer, timeout)
-        interactions_by_user: Dict[str, List[VideoInteraction]] = {}
-        
-        for msg in messages:
-            interaction = VideoInteraction(**msg)
-            user_id = interaction.userId
-            if user_id not in interactions_by_user:
-                interactions_by_user[user_id] = []
-            print(f"Appending interaction to user {user_id}: {interaction}")
-            interactions_by_user[user_id].append(interaction)
-        
-        return interactions_by_user
+        return await self._run_in_consumer_thread(self._consume_interactions, consumer, max_messages, timeout)
 
-    def consume_video_embeddings(self, consumer: Consumer, timeout: float = 1.0) -> List[VideoEmbedding]:
+    def _consume_interactions(self, consumer: Consumer, max_messages: int, timeout: float) -> List[VideoInteraction]:
+        messages = self.consume_batch(consumer, max_messages, timeout)
+        return [VideoInteraction(**msg) for msg in messages]
+
+    async def consume_interaction_weights(
+        self,
+        consumer: Consumer,
+        max_messages: int = CONSUMER_MAX_BATCH_SIZE,
+        timeout: float = CONSUMER_MAX_WAIT_SECONDS
+    ) -> List[UserInteractionWeights]:
+        """
+        Consume a batch of dead-lettered interaction windows
+        Args:
+            consumer: The consumer instance to use
+            max_messages: Maximum number of messages in the batch
+            timeout: Maximum time to wait for the batch in seconds
+        Returns:
+            List[UserInteractionWeights]: List of interaction windows
+        """
+        return await self._run_in_consumer_thread(self._consume_interaction_weights, consumer, max_messages, timeout)
+
+    def _consume_interaction_weights(self, consumer: Consumer, max_messages: int, timeout: float) -> List[UserInteractionWeights]:
+        messages = self.consume_batch(consumer, max_messages, timeout)
+        return [UserInteractionWeights(**msg) for msg in messages]
+
+    async def commit_async(self, consumer: Consumer) -> None:
+        """Synchronously commit consumed offsets without blocking the event loop"""
+        await self._run_in_consumer_thread(self._commit, consumer)
+
+    def _commit(self, consumer: Consumer) -> None:
+        try:
+            consumer.commit(asynchronous=False)
+        except KafkaException as e:
+            # Nothing consumed since the last commit, there is nothing to move
+            if e.args[0].code() != KafkaError._NO_OFFSET:
+                raise
+
+    async def rewind_async(self, consumer: Consumer) -> None:
+        """Seek every assigned partition back to its committed offset, so uncommitted messages are consumed again"""
+        await self._run_in_consumer_thread(self._rewind, consumer)
+
+    def _rewind(self, consumer: Consumer) -> None:
+        for partition in consumer.committed(consumer.assignment(), timeout=10):
+            if partition.offset < 0:
+                # Nothing committed yet, start over like auto.offset.reset=earliest
+                partition.offset = OFFSET_BEGINNING
+            consumer.seek(partition)
+
+    async def close_consumer_async(self, consumer: Consumer) -> None:
+        """Leave the consumer group without blocking the event loop, running any revoke callback"""
+        await self._run_in_consumer_thread(consumer.close)
+
+    async def consume_video_embeddings(
+        self,
+        consumer: Consumer,
+        max_messages: int = CONSUMER_MAX_BATCH_SIZE,
+        timeout: float = CONSUMER_MAX_WAIT_SECONDS
+    ) -> List[VideoEmbedding]:
         """
-        Consume video embedding messages
+        Consume a batch of video embedding messages
         Args:
             consumer: The consumer instance to use
-            timeout: How long to wait for messages in seconds
+            max_messages: Maximum number of messages in the batch
+            timeout: Maximum time to wait for the batch in seconds
         Returns:
             List[VideoEmbedding]: List of video embeddings
         """
-        messages = self.consume_batch(consumer, timeout)
-        return [VideoEmbedding(**msg) for msg in messages]
+        return await self._run_in_consumer_thread(
+            self._consume_video_embeddings, consumer, max_messages, timeout
+        )
 
-    def consume_batch(self, consumer: Consumer, timeout: float = 1.0) -> List[Dict[str, Any]]:
+    def _consume_video_embeddings(self, consumer: Consumer, max_messages: int, timeout: float) -> List[VideoEmbedding]:
+        return self.consume_batch(consumer, max_messages, timeout, decode=self._decode_video_embedding)
+
+    def _decode_video_embedding(self, value: bytes) -> VideoEmbedding:
+        """Decode a binary or legacy JSON video embedding message"""
+        if not kafka_codec.is_binary(value):
+            return VideoEmbedding(**kafka_codec.decode_json(value))
+        fields, embedding = kafka_codec.decode_embedding_message(value)
+        # Fields were validated before encoding, skip rebuilding the model
+        return VideoEmbedding.model_construct(**fields, embedding=embedding)
+
+    def consume_batch(
+        self,
+        consumer: Consumer,
+        max_messages: int = CONSUMER_MAX_BATCH_SIZE,
+        timeout: float = CONSUMER_MAX_WAIT_SECONDS,
+        decode: Callable[[bytes], T] = kafka_codec.decode_json
+    ) -> List[T]:
         """
         Consume a batch of messages from Confluent Cloud
+        Blocks until max_messages have arrived or timeout has passed, so async
+        code calls it through the consume_* coroutines, which run it on the
+        consumer thread.
         Args:
             consumer: The consumer instance to use
-            timeout: How long to wait for messages in seconds
+            max_messages: Maximum number of messages in the batch
+            timeout: Maximum time to wait for the batch in seconds
+            decode: Decodes each message value, JSON by default
         Returns:
-            List[Dict]: List of decoded messages
+            List: List of decoded messages, undecodable messages are skipped
         """
         messages = []
+        batch_sizes: Dict[str, int] = {}
         try:
-            msg = consumer.poll(timeout)
-            if msg is None:
-                return messages
-            if msg.error():
-                if msg.error().code() != KafkaError._PARTITION_EOF:
-                    print(f"Confluent Cloud consumer error: {msg.error()}")
-                return messages
-            
-            try:
-                messages.append(json.loads(msg.value().decode('utf-8')))
-            except json.JSONDecodeError as e:
-                print(f"Error decoding message from Confluent Cloud: {e}")
+            for msg in consumer.consume(num_messages=max_messages, timeout=timeout):
+                if msg.error():
+                    if msg.error().code() != KafkaError._PARTITION_EOF:
+                        print(f"Confluent Cloud consumer error: {msg.error()}")
+                    continue
                 
+                topic = msg.topic()
+                batch_sizes[topic] = batch_sizes.get(topic, 0) + 1
+                try:
+                    messages.append(decode(msg.value()))
+                except ValueError as e:
+                    CONSUMER_MESSAGES.inc(topic=topic, result="decode_error")
+                    log_event("message_decode_failed", level=logging.WARNING, topic=topic,
+                              partition=msg.partition(), offset=msg.offset(), error=str(e))
+                    continue
+                CONSUMER_MESSAGES.inc(topic=topic, result="ok")
+
+            for topic, size in batch_sizes.items():
+                CONSUMER_BATCH_SIZE.observe(size, topic=topic)
+            self._record_lag(consumer)
         except Exception as e:
             print(f"Error consuming from Confluent Cloud: {e}")
         
         return messages
 
+    def _record_lag(self, consumer: Consumer) -> None:
+        """Set the lag gauge for every assigned partition from locally cached watermarks"""
+        partitions = consumer.assignment()
+        if not partitions:
+            return
+        for partition in consumer.position(partitions):
+            if partition.offset < 0:
+                continue  # Nothing consumed from this partition yet
+            _, high = consumer.get_watermark_offsets(partition, cached=True)
+            if high < 0:
+                continue
+            CONSUMER_LAG.set(max(high - partition.offset, 0), topic=partition.topic, partition=partition.partition)
+
     def _delivery_report(self, err, msg):
         """Callback for Confluent Cloud message delivery reports"""
+        PRODUCER_MESSAGES.inc(topic=msg.topic(), result="failed" if err is not None else "delivered")
         if err is not None:
-            print(f'Message delivery failed: {err}')
-        else:
-            print(f'Message delivered to {msg.topic()} [{msg.partition()}]')
+            log_event("message_delivery_failed", level=logging.WARNING, topic=msg.topic(), error=str(err))
 
     def close(self):
-        """Close the Confluent Cloud producer"""
+        """Close the Confluent Cloud producer and the consumer thread pool"""
+        self._poll_stop.set()
+        if self._poll_thread is not None:
+            self._poll_thread.join()
         if self.producer:
             self.producer.flush()
             self.producer.close()
+        self._consumer_executor.shutdown(wait=False)
 
 # Singleton instance
 _kafka_client: KafkaClient | None = None
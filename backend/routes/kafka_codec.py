@@ -0,0 +1,80 @@
+# routes/kafka_codec.py
+import json
+import struct
+from typing import Any, Dict, Optional, Sequence, Tuple
+import numpy as np
+
+# Binary message layout, all little-endian:
+#   header    magic b'PR', format version, flags, envelope length (uint32)
+#   envelope  compact UTF-8 JSON of every field except the embedding
+#   embedding packed float32 values filling the rest of the message
+# JSON messages start with '{', so the magic tells the two formats apart
+MAGIC = b'PR'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<2sBBI')
+FLAG_HAS_EMBEDDING = 0x01
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+def is_binary(value: bytes) -> bool:
+    """Whether a message value uses the binary format rather than legacy JSON"""
+    return value[:len(MAGIC)] == MAGIC
+
+def encode_json(fields: Dict[str, Any]) -> bytes:
+    """Encode a message as legacy JSON"""
+    return json.dumps(fields).encode('utf-8')
+
+def decode_json(value: bytes) -> Dict[str, Any]:
+    """Decode a legacy JSON message"""
+    return json.loads(value.decode('utf-8'))
+
+def encode_embedding_message(fields: Dict[str, Any], embedding: Optional[Sequence[float]]) -> bytes:
+    """
+    Encode a message carrying an embedding in the binary format
+    Args:
+        fields: Every other field of the message, JSON serializable
+        embedding: The embedding, or None
+    Returns:
+        bytes: Encoded message value
+    """
+    envelope = json.dumps(fields, separators=(',', ':')).encode('utf-8')
+    flags = 0
+    packed = b''
+    if embedding is not None:
+        flags |= FLAG_HAS_EMBEDDING
+        packed = np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+    return HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(envelope)) + envelope + packed
+
+def decode_embedding_message(value: bytes) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """
+    Decode a binary message produced by encode_embedding_message
+    The embedding is read straight from the message buffer.
+    Args:
+        value: Encoded message value
+    Returns:
+        Tuple[Dict[str, Any], Optional[np.ndarray]]: The other fields and the
+            float32 embedding, or None if the message carried none
+    Raises:
+        ValueError: If the message is truncated or uses an unknown version
+    """
+    if len(value) < HEADER.size:
+        raise ValueError("Truncated message header")
+    magic, version, flags, envelope_size = HEADER.unpack_from(value)
+    if magic != MAGIC:
+        raise ValueError("Not a binary message")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported message format version {version}")
+
+    embedding_offset = HEADER.size + envelope_size
+    if embedding_offset > len(value):
+        raise ValueError("Truncated message envelope")
+    fields = json.loads(memoryview(value)[HEADER.size:embedding_offset].tobytes())
+
+    embedding = None
+    if flags & FLAG_HAS_EMBEDDING:
+        embedding_size = len(value) - embedding_offset
+        if embedding_size % EMBEDDING_DTYPE.itemsize:
+            raise ValueError("Truncated message embedding")
+        # Zero-copy view of the message, converted to native order only if needed
+        embedding = np.frombuffer(value, dtype=EMBEDDING_DTYPE, offset=embedding_offset)
+        embedding = embedding.astype(np.float32, copy=False)
+    return fields, embedding
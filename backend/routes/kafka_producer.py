@@ -1,21 +1,35 @@
 # routes/kafka_producer.py
+from typing import List
 from fastapi import APIRouter, HTTPException
 from .kafka_client import get_kafka_client, VideoEmbedding, VideoInteraction
+from services.seen_filter import get_seen_filter_cache
 
 router = APIRouter(prefix="/api/kafka")
 
 @router.post("/video")
 async def produce_video(video: VideoEmbedding):
     client = get_kafka_client()
-    success = client.produce_video_embedding(video)
+    success = await client.produce_video_embedding_async(video)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to produce message")
     return {"status": "success"}
 
 @router.post("/interaction")
 async def produce_interaction(interaction: VideoInteraction):
+    # Watched regardless of delivery, keep it out of this replica's next feed
+    get_seen_filter_cache().mark_interactions([interaction])
     client = get_kafka_client()
-    success = client.produce_interaction(interaction)
+    success = await client.produce_interaction_async(interaction)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to produce message")
-    return {"status": "success"}
\ No newline at end of file
+    return {"status": "success"}
+
+@router.post("/interactions")
+async def produce_interactions(interactions: List[VideoInteraction]):
+    """Produce a batch of interactions, e.g. several view events at once"""
+    get_seen_filter_cache().mark_interactions(interactions)
+    client = get_kafka_client()
+    success = await client.produce_interactions_async(interactions)
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to produce messages")
+    return {"status": "success", "count": len(interactions)}
\ No newline at end of file
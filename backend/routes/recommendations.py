@@ -1,52 +1,119 @@
 from fastapi import APIRouter, HTTPException, Query
-from services.ml_processor import get_pinecone_client
-from db.connection import get_db
-from fastapi import Depends
-import asyncpg
-from typing import List
+import numpy as np
+from services.ml_processor import fetch_user_embedding
+from services.vector_store import get_vector_store
+from services.metrics import RECOMMENDATION_SECONDS
+from services.cold_start_feed import COLD_START_BLEND_HISTORY, blend, count_interactions, get_cold_start_feed
+from services.seen_filter import SEEN_FILTER_OVERFETCH, get_seen_filter_cache
+from services.reranker import rerank
+from services.video_attributes import get_video_attribute_cache
+from services.recommendation_cache import (
+    RECOMMENDATION_CANDIDATE_DEPTH,
+    decode_cursor,
+    encode_cursor,
+    get_recommendation_cache,
+)
+from typing import Optional, Sequence
 
 router = APIRouter(prefix="/api/recommendations")
 
+async def rank_candidates(user_id: str, top_k: int) -> Sequence[str]:
+    """
+    Rank the user's top_k unseen videos
+    Users without an embedding get the cold-start feed, and users with little
+    history get it blended into their nearest videos. Videos in the user's
+    seen filter are dropped, so the vector query over-fetches to make up for
+    them, and the rest are reranked by similarity, trending score, freshness
+    and creator diversity.
+    """
+    # Get user's embedding, from the cache for active users
+    with RECOMMENDATION_SECONDS.time(stage="user_embedding"):
+        user_embedding = await fetch_user_embedding(user_id)
+    seen = await get_seen_filter_cache().get(user_id)
+    if user_embedding is None:
+        # New user, serve trending videos from memory
+        feed = await get_cold_start_feed().get()
+        return seen.unseen(feed)[:top_k]
+
+    # Get recommendations from the vector store
+    with RECOMMENDATION_SECONDS.time(stage="vector_query"):
+        matches = await get_vector_store().query(
+            user_embedding.embedding,
+            top_k=int(top_k * SEEN_FILTER_OVERFETCH)
+        )
+    was_seen = seen.contains([match.id for match in matches]).tolist()
+    candidates = [match for match, skip in zip(matches, was_seen) if not skip]
+    attributes = await get_video_attribute_cache().get()
+    with RECOMMENDATION_SECONDS.time(stage="rerank"):
+        video_ids = rerank(
+            [match.id for match in candidates],
+            np.fromiter((match.score for match in candidates), dtype=np.float64, count=len(candidates)),
+            attributes
+        )
+
+    history = await count_interactions(user_id)
+    if history < COLD_START_BLEND_HISTORY:
+        # Too little history to trust the embedding alone
+        feed = await get_cold_start_feed().get()
+        return blend(video_ids, seen.unseen(feed), history / COLD_START_BLEND_HISTORY)[:top_k]
+    return video_ids[:top_k]
+
 @router.get("")
 async def get_recommendations(
     user_id: str = Query(..., description="User ID to get recommendations for"),
     limit: int = Query(20, description="Number of recommendations to return"),
     offset: int = Query(0, description="Offset for pagination"),
-    db_pool: asyncpg.Pool = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page, overrides offset")
 ):
-    """Get personalized video recommendations for a user"""
-    try:
-        # Get user's embedding
-        async with db_pool.acquire() as conn:
-            user_embedding = await conn.fetchrow(
-                """
-                SELECT embedding 
-                FROM user_embeddings 
-                WHERE user_id = $1
-                """,
-                user_id
-            )
-
-        if not user_embedding or not user_embedding['embedding']:
-            # Return empty list if no user embedding
-            return {"videoIds": []}
+    """
+    Get personalized video recommendations for a user, trending videos for new users
+    A cursor continues the list its first page came from, even after the
+    user's list was rebuilt. If that list has expired, pagination restarts
+    at the top of the current list and the response says restarted.
+    """
+    generation = 0
+    if cursor is not None:
+        try:
+            generation, offset = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        # Get recommendations from Pinecone
-        pc = get_pinecone_client()
-        if not pc:
-            raise HTTPException(status_code=500, detail="Pinecone client not available")
+    try:
+        with RECOMMENDATION_SECONDS.time(stage="total"):
+            return await _page_recommendations(user_id, limit, offset, generation)
+    except Exception as e:
+        print(f"Error getting recommendations: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        index = pc.Index("video-embeddings")
-        query_response = index.query(
-            vector=user_embedding['embedding'],
-            top_k=limit + offset,  # Get extra for offset
-            include_metadata=True
-        )
+async def _page_recommendations(user_id: str, limit: int, offset: int, generation: int = 0) -> dict:
+    """Serve one page of recommendations starting at offset in the list of the given generation"""
+    cache = get_recommendation_cache()
+    candidates = cache.get_generation(user_id, generation) if generation else None
+    restarted = False
+    if generation and candidates is None:
+        # The list the previous pages came from is gone, offsets into another would repeat or skip videos
+        offset = 0
+        restarted = True
 
-        # Extract video IDs, respecting offset and limit
-        video_ids = [match.id for match in query_response.matches[offset:offset + limit]]
+    # Every ranking asks for one video more than it serves, to learn whether another page exists
+    if candidates is None and offset + limit > RECOMMENDATION_CANDIDATE_DEPTH:
+        # Deeper than the cached list, query directly
+        video_ids = await rank_candidates(user_id, offset + limit + 1)
+        page = video_ids[offset:offset + limit]
+        has_more = len(video_ids) > offset + limit
+        next_generation = 0
+    else:
+        if candidates is None:
+            # Rank once with generous depth and serve pages from the cache
+            candidates = await cache.get_or_build(
+                user_id,
+                lambda: rank_candidates(user_id, RECOMMENDATION_CANDIDATE_DEPTH + 1),
+                RECOMMENDATION_CANDIDATE_DEPTH
+            )
+        page = candidates.video_ids[offset:offset + limit]
+        has_more = len(candidates.video_ids) > offset + limit or candidates.truncated
+        # Pages past the cached depth are ranked directly and carry no generation
+        next_generation = candidates.generation if offset + 2 * limit <= len(candidates.video_ids) else 0
 
-        return {"videoIds": video_ids}
-    except Exception as e:
-        print(f"Error getting recommendations: {e}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+    next_cursor = encode_cursor(offset + limit, next_generation) if has_more else None
+    return {"videoIds": page, "nextCursor": next_cursor, "restarted": restarted}
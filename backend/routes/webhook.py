@@ -1,24 +1,27 @@
-from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi import APIRouter, Header, HTTPException, Request, Response, status
 from services.user_service import create_user, delete_user, update_user
-from schemas.user import UserCreate
+from services.user_sync import get_webhook_delivery_cache, sync_records, user_from_record
 from svix.webhooks import Webhook, WebhookVerificationError
-from db.connection import get_db
+from db.connection import get_admin_db
 from fastapi import Depends
 import asyncpg
+import hmac
 import os
+from typing import Any, Dict, List
 from dotenv import load_dotenv
 from services.ml_processor import delete_from_pinecone
 
 load_dotenv()
 
 WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', "whsec_8SXPTXJqi/en1TIU3UbPtklzklkbKlhP")
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN')  # Required by the bulk sync endpoint, unset disables it
 webhook_router = APIRouter(prefix="/webhook")
 
 @webhook_router.post("")
 async def handle_webhook(
     request: Request,
     response: Response,
-    db_pool: asyncpg.Pool = Depends(get_db)
+    db_pool: asyncpg.Pool = Depends(get_admin_db)
 ):
     headers = request.headers
     payload = await request.body()
@@ -31,54 +34,61 @@ async def handle_webhook(
         response.status_code = status.HTTP_400_BAD_REQUEST
         return
 
+    # svix redelivers until it sees a 2xx, skip deliveries already handled
+    delivery_id = headers.get("svix-id")
+    deliveries = get_webhook_delivery_cache()
+    if delivery_id and deliveries.seen(delivery_id):
+        return {"status": "success", "message": "Duplicate delivery"}
+
     event_type = msg.get("type")
     data = msg.get("data", {})
 
     async with db_pool.acquire() as db:
         try:
-            if event_type == "user.created":
-                user_id = data.get("id")
-                email_addresses = data.get("email_addresses", [])
-                username = data.get("username")
-                
-                primary_email_id = data.get("primary_email_address_id")
-                primary_email = next(
-                    (email["email_address"] for email in email_addresses if email["id"] == primary_email_id),
-                    None
-                )
-                
-                if not primary_email:
+            if event_type in ("user.created", "user.updated"):
+                user_data = user_from_record(data)
+                if user_data is not None:
+                    # Single upsert, an update also repairs a missed create
+                    await create_user(db, user_data)
+                elif event_type == "user.updated":
+                    await update_user(db, data.get("id"), data.get("username"))
+                else:
                     print("No primary email found")
                     raise HTTPException(status_code=400, detail="No primary email found")
-                
-                if not username:
-                    username = primary_email.split("@")[0]
-                    
-                user_data = UserCreate(
-                    id=user_id,
-                    username=username,
-                    email=primary_email
-                )
-                await create_user(db, user_data)
-                return {"status": "success", "message": "User created"}
+                result = {"status": "success", "message": "User created" if event_type == "user.created" else "User updated"}
                 
             elif event_type == "user.deleted":
                 user_id = data.get("id")
-                await delete_user(db, user_id)
-                return {"status": "success", "message": "User deleted"}
-                
-            elif event_type == "user.updated":
-                user_id = data.get("id")
-                username = data.get("username")
-                await update_user(db, user_id, username)
-                return {"status": "success", "message": "User updated"}
+                deleted = await delete_user(db, user_id)
+                result = {"status": "success", "message": "User deleted" if deleted else "User not found"}
             
-            return {"status": "success", "message": f"Received event: {event_type}"}
+            else:
+                result = {"status": "success", "message": f"Received event: {event_type}"}
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error: {e}")
-            await db.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
+    if delivery_id:
+        deliveries.mark(delivery_id)
+    return result
+
+@webhook_router.post("/users/sync")
+async def sync_users_export(
+    records: List[Dict[str, Any]],
+    x_admin_token: str | None = Header(default=None)
+):
+    """Insert or update users from an identity provider export"""
+    if not ADMIN_API_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    try:
+        totals = await sync_records(records)
+        return {"status": "success", **totals}
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @webhook_router.delete("/video/{video_id}")
 async def delete_video_embedding(
     video_id: str,
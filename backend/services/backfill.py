@@ -0,0 +1,443 @@
+# services/backfill.py
+"""
+Offline rebuild of the user embeddings and the video vector index
+
+    cd backend && PYTHONPATH=. python -m services.backfill users [--resume]
+    cd backend && PYTHONPATH=. python -m services.backfill videos [--resume]
+
+users recomputes every user embedding from the full analytics history: rows
+are streamed through a server-side cursor ordered by user, joined to video
+embeddings held in one id-indexed matrix, reduced with the vectorized engine
+math in chunks on a thread pool, and written back with COPY into a staging
+table merged into user_embeddings. videos re-upserts every ready video into
+the vector store.
+
+Both modes run on the admin pool (DIRECT_URL), save a checkpoint after every
+written chunk and pick up after it with --resume. Not part of the Procfile,
+run it as a one-off job.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import asyncpg
+import numpy as np
+from db.connection import INSTANCE_ID, PGVECTOR_SCHEMA, get_admin_db, init_postgres
+from routes.kafka_client import VideoEmbedding
+from services import embedding_engine
+from services.embedding_engine import EMBEDDING_DIMENSION
+from services.ml_processor import USER_EMBEDDINGS_ALL, USER_EMBEDDINGS_CHANNEL, VECTOR_UPSERT_BATCH_SIZE, video_vector
+from services.vector_store import get_vector_store
+
+# Chunking and parallelism
+BACKFILL_CHUNK_ROWS = int(os.getenv('BACKFILL_CHUNK_ROWS', '20000'))  # Analytics rows per compute chunk, ~120 MB of gathered embeddings
+BACKFILL_FETCH_ROWS = int(os.getenv('BACKFILL_FETCH_ROWS', '5000'))  # Rows per cursor round trip
+BACKFILL_VIDEO_BATCH = int(os.getenv('BACKFILL_VIDEO_BATCH', '1000'))  # Videos read per cursor round trip in videos mode
+BACKFILL_JOBS = int(os.getenv('BACKFILL_JOBS', str(min(os.cpu_count() or 1, 4))))  # Chunks computed or upserts in flight at once
+# Reporting and resuming
+BACKFILL_PROGRESS_SECONDS = float(os.getenv('BACKFILL_PROGRESS_SECONDS', '10'))
+BACKFILL_CHECKPOINT_DIR = os.getenv('BACKFILL_CHECKPOINT_DIR', 'data')
+
+STAGING_TABLE = "user_embeddings_backfill"
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+class VideoMatrix:
+    """
+    Video embeddings loaded so far, one float32 row per video
+    Grows by doubling as chunks reference new videos, so each video is read
+    from the database once per run. Rows are never moved within a buffer, a
+    matrix handed to a worker thread stays valid while later rows are added.
+    """
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, capacity: int = 1024):
+        self._rows: Dict[str, int] = {}
+        self._missing: set[str] = set()
+        self._matrix = np.empty((capacity, dimension), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """(n, d) view of the loaded rows"""
+        return self._matrix[:len(self._rows)]
+
+    def unknown(self, video_ids: Sequence[str]) -> List[str]:
+        """Distinct ids neither loaded nor known to have no embedding"""
+        return [
+            video_id for video_id in dict.fromkeys(video_ids)
+            if video_id not in self._rows and video_id not in self._missing
+        ]
+
+    def add(self, video_ids: Sequence[str], embeddings: Sequence[np.ndarray]) -> None:
+        needed = len(self._rows) + len(video_ids)
+        if needed > len(self._matrix):
+            grown = np.empty((max(needed, 2 * len(self._matrix)), self._matrix.shape[1]), dtype=np.float32)
+            grown[:len(self._rows)] = self.matrix
+            self._matrix = grown
+        for video_id, embedding in zip(video_ids, embeddings):
+            row = len(self._rows)
+            self._matrix[row] = embedding
+            self._rows[video_id] = row
+
+    def mark_missing(self, video_ids: Sequence[str]) -> None:
+        self._missing.update(video_ids)
+
+    def rows(self, video_ids: Sequence[str]) -> np.ndarray:
+        """Row of each video, -1 where it has no embedding"""
+        return np.fromiter((self._rows.get(video_id, -1) for video_id in video_ids), dtype=np.intp, count=len(video_ids))
+
+class UserChunk(NamedTuple):
+    """Analytics rows for a run of whole users, in cursor order"""
+    user_ids: List[str]
+    video_rows: np.ndarray
+    scores: np.ndarray
+    epochs: np.ndarray
+
+    @property
+    def last_user_id(self) -> str:
+        return self.user_ids[-1]
+
+def user_embeddings_from_rows(
+    user_ids: Sequence[str],
+    video_rows: np.ndarray,
+    scores: np.ndarray,
+    epochs: np.ndarray,
+    video_matrix: np.ndarray,
+    now: float
+) -> Tuple[List[str], np.ndarray]:
+    """
+    Recompute user embeddings from their whole interaction history
+    Each embedding is the decay-weighted average of every video the user
+    interacted with, the same delta the consumer computes for a window, taken
+    over all of history at once so it does not depend on batch boundaries.
+    Args:
+        user_ids: User of each interaction
+        video_rows: Row of each interaction's video in video_matrix, -1 if it has no embedding
+        scores: Weighted score of each interaction
+        epochs: Time of each interaction in epoch seconds
+        video_matrix: (n, d) video embeddings
+        now: Reference time for the decay, in epoch seconds
+    Returns:
+        Tuple[List[str], np.ndarray]: Users with a valid embedding and their (n, d) float32 embeddings
+    """
+    keep = video_rows >= 0
+    if not keep.any():
+        return [], np.empty((0, video_matrix.shape[1]), dtype=np.float32)
+    users, groups = np.unique(np.asarray(user_ids, dtype=object)[keep], return_inverse=True)
+    video_rows = video_rows[keep]
+    weights = embedding_engine.interaction_weights(scores[keep], epochs[keep], now)
+
+    # Sum repeat interactions with a video first, every video row is gathered once per user
+    pairs, pair_index = np.unique(groups.astype(np.int64) * len(video_matrix) + video_rows, return_inverse=True)
+    pair_weights = np.bincount(pair_index, weights=weights, minlength=len(pairs))
+    averages, valid = embedding_engine.grouped_weighted_average(
+        video_matrix[pairs % len(video_matrix)], pair_weights, pairs // len(video_matrix), len(users)
+    )
+    return users[valid].tolist(), averages[valid]
+
+def _checkpoint_path(mode: str) -> Path:
+    return Path(BACKFILL_CHECKPOINT_DIR) / f"backfill_{mode}.json"
+
+def load_checkpoint(path: Path) -> Dict[str, Any]:
+    """Read a checkpoint, empty if none was saved"""
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path: Path, state: Dict[str, Any]) -> None:
+    """Replace the checkpoint atomically, a crash mid-write keeps the previous one"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix('.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+class Progress:
+    """Periodic one-line progress report"""
+
+    def __init__(self, label: str, unit: str, done: int = 0, total: Optional[int] = None):
+        self.label = label
+        self.unit = unit
+        self.done = done
+        self.total = total
+        self._started = time.monotonic()
+        self._started_done = done
+        self._reported = self._started
+
+    def advance(self, count: int, **counters: int) -> None:
+        self.done += count
+        now = time.monotonic()
+        if now - self._reported >= BACKFILL_PROGRESS_SECONDS:
+            self._reported = now
+            self.report(**counters)
+
+    def report(self, **counters: int) -> None:
+        elapsed = time.monotonic() - self._started
+        rate = (self.done - self._started_done) / elapsed if elapsed > 0 else 0.0
+        line = f"{self.label}: {self.done:,} {self.unit}, {rate:,.0f}/s"
+        if self.total:
+            line += f", ~{min(self.done / self.total, 1.0):.0%} of {self.total:,}"
+        for name, value in counters.items():
+            line += f", {value:,} {name}"
+        print(line, flush=True)
+
+async def _estimated_rows(conn: asyncpg.Connection, table: str) -> Optional[int]:
+    """Planner row estimate, a count(*) would scan the whole table"""
+    estimate = await conn.fetchval("SELECT reltuples::bigint FROM pg_class WHERE oid = $1::regclass", table)
+    return estimate if estimate and estimate > 0 else None
+
+async def _load_videos(conn: asyncpg.Connection, videos: VideoMatrix, video_ids: Sequence[str]) -> None:
+    """Load the embeddings of videos the matrix has not seen yet"""
+    unknown = videos.unknown(video_ids)
+    if not unknown:
+        return
+    # analytics.video_id is free text, only well-formed ids can match videos.id
+    valid = []
+    for video_id in unknown:
+        try:
+            uuid.UUID(video_id)
+        except ValueError:
+            continue
+        valid.append(video_id)
+    rows = await conn.fetch(
+        "SELECT id::text AS id, embedding FROM videos WHERE id = ANY($1::uuid[]) AND embedding IS NOT NULL",
+        valid
+    ) if valid else []
+    videos.add([row['id'] for row in rows], [row['embedding'] for row in rows])
+    videos.mark_missing(unknown)
+
+async def _read_user_chunks(
+    conn: asyncpg.Connection,
+    after: str,
+    videos: VideoMatrix,
+    chunk_rows: int
+) -> AsyncIterator[UserChunk]:
+    """
+    Stream analytics through a server-side cursor, cut into chunks of whole users
+    Args:
+        conn: Connection the cursor runs on, also used to load video embeddings
+        after: Only users ordered after this id
+        videos: Matrix the chunk's video rows refer to, extended as needed
+        chunk_rows: Target rows per chunk, exceeded only by a single larger user
+    """
+    async def to_chunk(rows: List[asyncpg.Record]) -> UserChunk:
+        video_ids = [row['video_id'] for row in rows]
+        await _load_videos(conn, videos, video_ids)
+        return UserChunk(
+            user_ids=[row['user_id'] for row in rows],
+            video_rows=videos.rows(video_ids),
+            scores=np.fromiter((row['weighted_score'] for row in rows), dtype=np.float64, count=len(rows)),
+            epochs=np.fromiter((row['epoch'] for row in rows), dtype=np.float64, count=len(rows)),
+        )
+
+    async with conn.transaction(isolation='repeatable_read', readonly=True):
+        cursor = await conn.cursor(
+            """
+            SELECT user_id, video_id, weighted_score, extract(epoch FROM timestamp)::float8 AS epoch
+            FROM analytics
+            WHERE user_id > $1 AND weighted_score IS NOT NULL
+            ORDER BY user_id
+            """,
+            after
+        )
+        buffer: List[asyncpg.Record] = []
+        while True:
+            rows = await cursor.fetch(BACKFILL_FETCH_ROWS)
+            if not rows:
+                break
+            buffer.extend(rows)
+            if len(buffer) < chunk_rows:
+                continue
+            # Hold back the last user, more of their rows may follow
+            cut = len(buffer) - 1
+            last_user_id = buffer[-1]['user_id']
+            while cut > 0 and buffer[cut - 1]['user_id'] == last_user_id:
+                cut -= 1
+            if cut > 0:
+                yield await to_chunk(buffer[:cut])
+                buffer = buffer[cut:]
+        if buffer:
+            yield await to_chunk(buffer)
+
+async def _write_user_embeddings(conn: asyncpg.Connection, user_ids: List[str], embeddings: np.ndarray, now: float) -> int:
+    """
+    COPY embeddings into the staging table and merge them into user_embeddings
+    Returns:
+        int: Rows written, users missing from the users table are skipped
+    """
+    async with conn.transaction():
+        await conn.copy_records_to_table(STAGING_TABLE, records=zip(user_ids, embeddings), columns=('user_id', 'embedding'))
+        status = await conn.execute(
+            f"""
+            INSERT INTO user_embeddings (user_id, embedding, updated_at)
+            SELECT s.user_id, s.embedding, to_timestamp($1) AT TIME ZONE 'UTC'
+            FROM {STAGING_TABLE} AS s
+            JOIN users AS u ON u.id = s.user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET embedding = EXCLUDED.embedding, updated_at = EXCLUDED.updated_at
+            """,
+            now
+        )
+    return int(status.split()[-1])
+
+async def _wait_all(*coroutines) -> None:
+    """Run coroutines together, cancelling the rest as soon as one fails"""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def backfill_users(checkpoint_path: Path, resume: bool = False, chunk_rows: int = BACKFILL_CHUNK_ROWS, jobs: int = BACKFILL_JOBS) -> None:
+    """
+    Recompute every user embedding from analytics
+    Chunks are computed on a thread pool while the cursor keeps streaming and
+    the previous chunk is written, results are written in cursor order so the
+    checkpoint is always the last user whose embedding is stored.
+    Args:
+        checkpoint_path: Where progress is saved after every written chunk
+        resume: Continue after the saved checkpoint instead of starting over
+        chunk_rows: Analytics rows per compute chunk
+        jobs: Chunks computed at once
+    """
+    state = load_checkpoint(checkpoint_path) if resume else {}
+    # One reference time for the whole run, kept across resumes
+    state.setdefault('now', time.time())
+    state.setdefault('after', '')
+    state.setdefault('rows', 0)
+    state.setdefault('users', 0)
+    now = state['now']
+
+    db_pool = await get_admin_db()
+    videos = VideoMatrix()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=jobs)
+
+    async with db_pool.acquire() as reader, db_pool.acquire() as writer:
+        await writer.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+                user_id text NOT NULL,
+                embedding {PGVECTOR_SCHEMA}.vector NOT NULL
+            ) ON COMMIT DELETE ROWS
+            """
+        )
+        progress = Progress("users", "interactions", state['rows'], await _estimated_rows(reader, 'analytics'))
+
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="backfill") as executor:
+            async def produce():
+                async for chunk in _read_user_chunks(reader, state['after'], videos, chunk_rows):
+                    future = loop.run_in_executor(
+                        executor, user_embeddings_from_rows,
+                        chunk.user_ids, chunk.video_rows, chunk.scores, chunk.epochs, videos.matrix, now
+                    )
+                    await queue.put((chunk, future))
+                await queue.put(None)
+
+            async def consume():
+                while (item := await queue.get()) is not None:
+                    chunk, future = item
+                    user_ids, embeddings = await future
+                    written = await _write_user_embeddings(writer, user_ids, embeddings, now) if user_ids else 0
+                    state['after'] = chunk.last_user_id
+                    state['rows'] += len(chunk.user_ids)
+                    state['users'] += written
+                    save_checkpoint(checkpoint_path, state)
+                    progress.advance(len(chunk.user_ids), users=state['users'], videos=len(videos))
+
+            await _wait_all(produce(), consume())
+
+        # Every process drops its cached user embeddings and rankings
+        await writer.execute("SELECT pg_notify($1, $2)", USER_EMBEDDINGS_CHANNEL, f"{INSTANCE_ID}:{USER_EMBEDDINGS_ALL}")
+    progress.report(users=state['users'], videos=len(videos))
+
+async def backfill_videos(checkpoint_path: Path, resume: bool = False, batch_size: int = BACKFILL_VIDEO_BATCH, jobs: int = BACKFILL_JOBS) -> None:
+    """
+    Re-upsert every ready video into the vector store
+    Args:
+        checkpoint_path: Where progress is saved after every batch
+        resume: Continue after the saved checkpoint instead of starting over
+        batch_size: Videos read per cursor round trip
+        jobs: Upsert requests in flight at once
+    """
+    state = load_checkpoint(checkpoint_path) if resume else {}
+    state.setdefault('after', NIL_UUID)
+    state.setdefault('videos', 0)
+
+    store = get_vector_store()
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def upsert(vectors: List[Dict[str, Any]]) -> None:
+        async with semaphore:
+            await store.upsert(vectors)
+
+    db_pool = await get_admin_db()
+    async with db_pool.acquire() as conn:
+        progress = Progress("videos", "videos", state['videos'], await _estimated_rows(conn, 'videos'))
+        async with conn.transaction(isolation='repeatable_read', readonly=True):
+            cursor = await conn.cursor(
+                """
+                SELECT id::text AS id, user_id, title, description, duration, trending_score, embedding
+                FROM videos
+                WHERE status = 'ready' AND embedding IS NOT NULL AND id > $1::uuid
+                ORDER BY id
+                """,
+                state['after']
+            )
+            while rows := await cursor.fetch(batch_size):
+                vectors = [
+                    video_vector(VideoEmbedding.model_construct(
+                        id=row['id'],
+                        userId=row['user_id'],
+                        title=row['title'],
+                        description=row['description'],
+                        duration=row['duration'],
+                        trendingScore=row['trending_score'] or 0.0,
+                        embedding=row['embedding'],
+                    ))
+                    for row in rows
+                ]
+                # A failed upsert stops the run, --resume retries from the last full batch
+                await asyncio.gather(*(
+                    upsert(vectors[start:start + VECTOR_UPSERT_BATCH_SIZE])
+                    for start in range(0, len(vectors), VECTOR_UPSERT_BATCH_SIZE)
+                ))
+                state['after'] = rows[-1]['id']
+                state['videos'] += len(rows)
+                save_checkpoint(checkpoint_path, state)
+                progress.advance(len(rows))
+    progress.report()
+
+async def run(mode: str, checkpoint_path: Path, resume: bool, jobs: int, chunk_rows: int, batch_size: int) -> None:
+    await init_postgres(("admin",))
+    if mode == "users":
+        await backfill_users(checkpoint_path, resume, chunk_rows, jobs)
+    else:
+        await backfill_videos(checkpoint_path, resume, batch_size, jobs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild user embeddings or reindex videos in the vector store")
+    parser.add_argument("mode", choices=("users", "videos"), help="users: recompute user embeddings, videos: re-upsert ready videos")
+    parser.add_argument("--resume", action="store_true", help="Continue after the saved checkpoint")
+    parser.add_argument("--checkpoint", type=Path, help="Checkpoint file, defaults to BACKFILL_CHECKPOINT_DIR/backfill_<mode>.json")
+    parser.add_argument("--jobs", type=int, default=BACKFILL_JOBS, help="Chunks computed or upserts in flight at once")
+    parser.add_argument("--chunk-rows", type=int, default=BACKFILL_CHUNK_ROWS, help="Analytics rows per compute chunk (users)")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_VIDEO_BATCH, help="Videos per cursor round trip (videos)")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or _checkpoint_path(args.mode)
+    asyncio.run(run(args.mode, checkpoint_path, args.resume, max(args.jobs, 1), args.chunk_rows, args.batch_size))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# services/cold_start_feed.py
+import os
+from typing import Sequence, Tuple
+from db.connection import get_replica_db
+from services.periodic_snapshot import PeriodicSnapshot
+
+# Cold-start feed size and refresh cadence
+COLD_START_FEED_SIZE = int(os.getenv('COLD_START_FEED_SIZE', '1000'))
+COLD_START_REFRESH_SECONDS = float(os.getenv('COLD_START_REFRESH_SECONDS', '60'))
+# Users with fewer interactions than this get trending videos blended into their feed
+COLD_START_BLEND_HISTORY = int(os.getenv('COLD_START_BLEND_HISTORY', '20'))
+
+class ColdStartFeed(PeriodicSnapshot[Tuple[str, ...]]):
+    """
+    Ranked list of ready videos for users without enough history
+    Ordered by trending score, then recency, then likes, the same order the
+    frontend uses for its trending mode. get() returns the ranked video IDs.
+    """
+
+    name = "cold-start feed"
+
+    def __init__(self, size: int = COLD_START_FEED_SIZE, refresh_seconds: float = COLD_START_REFRESH_SECONDS):
+        super().__init__((), refresh_seconds)
+        self.size = size
+
+    async def load(self) -> Tuple[str, ...]:
+        """Rank the feed from the videos table"""
+        db_pool = await get_replica_db()
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT id
+                FROM videos
+                WHERE status = 'ready'
+                ORDER BY trending_score DESC NULLS LAST, created_at DESC, likes DESC
+                LIMIT $1
+                """,
+                self.size
+            )
+        return tuple(str(row['id']) for row in rows)
+
+def blend(personalized: Sequence[str], trending: Sequence[str], personalized_share: float) -> list[str]:
+    """
+    Interleave personalized and trending videos, skipping duplicates
+    Args:
+        personalized: Ranked personalized video IDs
+        trending: Ranked cold-start video IDs
+        personalized_share: Fraction of positions given to personalized videos, 0 to 1
+    Returns:
+        list[str]: Blended ranking, as long as both inputs combined allow
+    """
+    blended: list[str] = []
+    seen: set[str] = set()
+    sources = (iter(personalized), iter(trending))
+    exhausted = [False, False]
+    position = 0
+    while not all(exhausted):
+        # Personalized takes a position whenever its running share crosses a whole number
+        use_personalized = int((position + 1) * personalized_share) > int(position * personalized_share)
+        source = 0 if use_personalized else 1
+        if exhausted[source]:
+            source = 1 - source
+        for video_id in sources[source]:
+            if video_id not in seen:
+                seen.add(video_id)
+                blended.append(video_id)
+                break
+        else:
+            exhausted[source] = True
+            continue
+        position += 1
+    return blended
+
+async def count_interactions(user_id: str, cap: int = COLD_START_BLEND_HISTORY) -> int:
+    """
+    Count a user's interactions, stopping at cap
+    Args:
+        user_id: ID of the user
+        cap: Stop counting here, only whether history is below the blend threshold matters
+    Returns:
+        int: Number of interactions, at most cap
+    """
+    db_pool = await get_replica_db()
+    async with db_pool.acquire() as conn:
+        return await conn.fetchval(
+            "SELECT count(*) FROM (SELECT 1 FROM analytics WHERE user_id = $1 LIMIT $2) AS history",
+            user_id,
+            cap
+        )
+
+# Singleton instance
+_cold_start_feed: ColdStartFeed | None = None
+
+def get_cold_start_feed() -> ColdStartFeed:
+    """Get or create the cold-start feed singleton"""
+    global _cold_start_feed
+    if _cold_start_feed is None:
+        _cold_start_feed = ColdStartFeed()
+    return _cold_start_feed
@@ -0,0 +1,96 @@
+# services/dead_letters.py
+import asyncio
+import logging
+import os
+import random
+from typing import Awaitable, Callable, Dict, TypeVar
+from pydantic import BaseModel
+from routes.kafka_client import get_kafka_client
+from services.event_log import log_event
+from services.metrics import CONSUMER_RETRIES, DEAD_LETTERS
+
+T = TypeVar("T")
+
+# Per-item retries after a failed batch, bounded so a batch settles within ~10s
+RETRY_ATTEMPTS = int(os.getenv('CONSUMER_RETRY_ATTEMPTS', '4'))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv('CONSUMER_RETRY_BASE_DELAY_SECONDS', '0.5'))  # Doubles every attempt
+RETRY_MAX_DELAY_SECONDS = float(os.getenv('CONSUMER_RETRY_MAX_DELAY_SECONDS', '8'))
+RETRY_CONCURRENCY = int(os.getenv('CONSUMER_RETRY_CONCURRENCY', '16'))  # Item attempts in flight at once
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before a retry, spreads out the retries of a failed batch"""
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+async def retry_each(
+    items: Dict[str, T],
+    attempt: Callable[[str, T], Awaitable[bool]],
+    topic: str,
+    attempts: int = RETRY_ATTEMPTS
+) -> Dict[str, bool]:
+    """
+    Retry every item on its own backoff schedule, concurrently
+    An item that keeps failing only delays its own retries, not the others'.
+    Args:
+        items: key -> item to retry
+        attempt: Processes one item, True on success
+        topic: Topic the items came from, labels the retry metrics
+        attempts: Tries per item
+    Returns:
+        Dict[str, bool]: Whether each item eventually succeeded
+    """
+    semaphore = asyncio.Semaphore(RETRY_CONCURRENCY)
+
+    async def retry(key: str, item: T) -> bool:
+        for n in range(attempts):
+            await asyncio.sleep(backoff_delay(n))
+            async with semaphore:
+                try:
+                    success = await attempt(key, item)
+                except Exception as e:
+                    print(f"Error retrying {key} from {topic}: {e}")
+                    success = False
+            CONSUMER_RETRIES.inc(topic=topic, result="succeeded" if success else "failed")
+            if success:
+                return True
+        return False
+
+    results = await asyncio.gather(*(retry(key, item) for key, item in items.items()))
+    return dict(zip(items, results))
+
+async def settle_failures(
+    topic: str,
+    dead_letter_topic: str,
+    failed: Dict[str, T],
+    attempt: Callable[[str, T], Awaitable[bool]],
+    to_message: Callable[[str, T], BaseModel]
+) -> bool:
+    """
+    Retry the failed items of a batch and dead-letter the ones that keep failing
+    When this returns True every item is either processed or on the
+    dead-letter topic, so the batch offsets can be committed. False means the
+    dead-letter produce failed, the batch must not be committed.
+    Args:
+        topic: Topic the items came from
+        dead_letter_topic: Where items that exhaust their retries are produced
+        failed: key -> item that failed in the batch
+        attempt: Processes one item, True on success
+        to_message: Builds the dead-letter message for an item
+    Returns:
+        bool: Whether every item was processed or dead-lettered
+    """
+    if not failed:
+        return True
+    results = await retry_each(failed, attempt, topic)
+    dead = [key for key, success in results.items() if not success]
+    if dead:
+        delivered = await get_kafka_client().produce_async(
+            dead_letter_topic,
+            [to_message(key, failed[key]) for key in dead],
+            headers={'source-topic': topic, 'attempts': str(RETRY_ATTEMPTS + 1)}
+        )
+        if not delivered:
+            log_event("dead_letter_failed", level=logging.ERROR, topic=dead_letter_topic, keys=dead)
+            return False
+        DEAD_LETTERS.inc(len(dead), topic=dead_letter_topic)
+        print(f"Dead-lettered {len(dead)} items from {topic} to {dead_letter_topic}")
+    return True
@@ -0,0 +1,222 @@
+# services/embedding_compression.py
+"""
+PCA projection and quantization of the serving copies of embeddings
+
+    cd backend && PYTHONPATH=. python -m services.embedding_compression --dimension 256
+
+Fits a projection on a sample of ready video embeddings and saves it to
+EMBEDDING_PCA_PATH. Postgres keeps full-precision embeddings, the projection
+and EMBEDDING_QUANTIZATION only shape what the vector store and the video
+embedding cache hold. Changing either invalidates a local index, reindex with
+`python -m services.backfill videos` into a fresh LOCAL_VECTOR_STORE_PATH.
+Measure a setting with `python -m benchmarks.recall` before rolling it out.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+import numpy as np
+from db.connection import get_admin_db, init_postgres
+from services.embedding_engine import EMBEDDING_DIMENSION
+
+EMBEDDING_QUANTIZATION = os.getenv('EMBEDDING_QUANTIZATION', 'none')  # none, float16 or int8
+EMBEDDING_PCA_PATH = os.getenv('EMBEDDING_PCA_PATH')  # Projection saved by this module, unset for full dimension
+EMBEDDING_PCA_SAMPLE = int(os.getenv('EMBEDDING_PCA_SAMPLE', '50000'))  # Videos the projection is fitted on
+
+QUANTIZATIONS = ('none', 'float16', 'int8')
+
+class Quantizer:
+    """
+    Storage encoding for float32 embedding rows
+    float16 halves the bytes per row. int8 quarters them and keeps one float32
+    scale per row, the row's largest magnitude over 127, so short and long
+    vectors keep the same relative precision.
+    """
+
+    def __init__(self, mode: str = EMBEDDING_QUANTIZATION):
+        if mode not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {mode!r}, expected one of {', '.join(QUANTIZATIONS)}")
+        self.mode = mode
+        self.dtype = np.dtype({'none': np.float32, 'float16': np.float16, 'int8': np.int8}[mode])
+
+    @property
+    def scaled(self) -> bool:
+        """Whether rows carry a separate scale"""
+        return self.mode == 'int8'
+
+    def encode(self, values: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Encode float rows
+        Args:
+            values: (..., d) embeddings
+        Returns:
+            Tuple[np.ndarray, Optional[np.ndarray]]: Codes in self.dtype and,
+                for int8, the (...,) float32 scales
+        """
+        values = np.asarray(values, dtype=np.float32)
+        if not self.scaled:
+            return values.astype(self.dtype, copy=False), None
+        scales = np.abs(values).max(axis=-1) / 127
+        codes = np.rint(values / np.where(scales > 0, scales, 1)[..., None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def decode(self, codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+        """Float32 rows back from codes and scales"""
+        values = codes.astype(np.float32)
+        if scales is not None:
+            values *= scales[..., None]
+        return values
+
+    def dot(self, codes: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        """Dot products of encoded rows with a float32 query, without decoding the rows first"""
+        scores = codes.astype(np.float32, copy=False) @ query
+        if scales is not None:
+            scores *= scales
+        return scores
+
+class PCAProjection(NamedTuple):
+    """
+    Linear projection onto the top principal directions of a sample
+    The directions come from the uncentered second moment, so dot products
+    and cosine similarities between projected vectors approximate the
+    original ones instead of those of mean-shifted vectors.
+    """
+    components: np.ndarray  # (k, d) orthonormal rows
+    explained_variance: float  # Share of the sample's energy kept
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def signature(self) -> str:
+        """Short hash identifying the projection in a stored index"""
+        return hashlib.sha1(self.components.tobytes()).hexdigest()[:12]
+
+    def project(self, values: np.ndarray) -> np.ndarray:
+        """(..., d) embeddings -> (..., k) float32"""
+        return np.asarray(values, dtype=np.float32) @ self.components.T
+
+    def save(self, path: str | Path) -> None:
+        with open(path, 'wb') as fh:
+            np.savez(fh, components=self.components, explained_variance=np.array(self.explained_variance))
+
+    @classmethod
+    def load(cls, path: str | Path) -> "PCAProjection":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(np.ascontiguousarray(data['components'], dtype=np.float32), float(data['explained_variance']))
+
+def fit_projection(samples: np.ndarray, dimension: int) -> PCAProjection:
+    """
+    Fit a projection to the given dimension
+    Args:
+        samples: (n, d) embeddings, normalized rows weigh every video equally
+    Returns:
+        PCAProjection: The top dimension eigenvectors of samples.T @ samples
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if not 0 < dimension <= samples.shape[1]:
+        raise ValueError(f"Projection dimension must be in 1..{samples.shape[1]}, got {dimension}")
+    eigenvalues, eigenvectors = np.linalg.eigh(samples.T @ samples)
+    top = np.argsort(eigenvalues)[::-1][:dimension]
+    explained = float(eigenvalues[top].sum() / max(eigenvalues.sum(), 1e-12))
+    return PCAProjection(np.ascontiguousarray(eigenvectors[:, top].T, dtype=np.float32), explained)
+
+class EmbeddingCompressor:
+    """
+    Projection and quantization applied to every vector the index stores or is queried with
+    Stored and query vectors go through the same projection so their
+    similarities stay comparable. Quantization only applies to stored rows,
+    queries stay float32.
+    """
+
+    def __init__(self, quantization: str = 'none', projection: Optional[PCAProjection] = None, input_dimension: int = EMBEDDING_DIMENSION):
+        if projection is not None and projection.components.shape[1] != input_dimension:
+            raise ValueError(f"Projection expects dimension {projection.components.shape[1]}, embeddings have {input_dimension}")
+        self.quantizer = Quantizer(quantization)
+        self.projection = projection
+        self.input_dimension = input_dimension
+
+    @property
+    def dimension(self) -> int:
+        """Dimension of projected vectors"""
+        return self.projection.dimension if self.projection is not None else self.input_dimension
+
+    def project(self, values: np.ndarray) -> np.ndarray:
+        """Project (..., input_dimension) embeddings, a no-op without a projection"""
+        values = np.asarray(values, dtype=np.float32)
+        if values.shape[-1] != self.input_dimension:
+            raise ValueError(f"Expected dimension {self.input_dimension}, got {values.shape[-1]}")
+        return self.projection.project(values) if self.projection is not None else values
+
+    def layout(self) -> Dict[str, Any]:
+        """What a stored index was built with, compared when it is reopened"""
+        return {
+            'dimension': self.dimension,
+            'quantization': self.quantizer.mode,
+            'projection': self.projection.signature if self.projection is not None else None,
+        }
+
+# Singleton instance
+_embedding_compressor: EmbeddingCompressor | None = None
+
+def get_embedding_compressor() -> EmbeddingCompressor:
+    """Get or create the embedding compressor singleton configured by EMBEDDING_QUANTIZATION and EMBEDDING_PCA_PATH"""
+    global _embedding_compressor
+    if _embedding_compressor is None:
+        projection = PCAProjection.load(EMBEDDING_PCA_PATH) if EMBEDDING_PCA_PATH else None
+        _embedding_compressor = EmbeddingCompressor(EMBEDDING_QUANTIZATION, projection)
+    return _embedding_compressor
+
+async def sample_video_embeddings(sample_size: int) -> np.ndarray:
+    """
+    Read a random sample of ready video embeddings on the admin pool
+    Args:
+        sample_size: Videos to read at most
+    Returns:
+        np.ndarray: (n, d) float32 embeddings, normalized
+    """
+    db_pool = await get_admin_db()
+    async with db_pool.acquire() as conn:
+        total = await conn.fetchval("SELECT reltuples::bigint FROM pg_class WHERE oid = 'videos'::regclass")
+        # Bernoulli sampling reads a share of the table instead of sorting all of it
+        percent = min(100.0, 100.0 * 2 * sample_size / total) if total and total > 0 else 100.0
+        rows = await conn.fetch(
+            f"""
+            SELECT embedding FROM videos TABLESAMPLE BERNOULLI ({percent:.6f})
+            WHERE status = 'ready' AND embedding IS NOT NULL
+            LIMIT $1
+            """,
+            sample_size
+        )
+    if not rows:
+        return np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+    samples = np.stack([np.asarray(row['embedding'], dtype=np.float32) for row in rows])
+    norms = np.linalg.norm(samples, axis=1, keepdims=True)
+    return samples / np.where(norms > 0, norms, 1)
+
+async def run(dimension: int, sample_size: int, output: Path) -> None:
+    await init_postgres(("admin",))
+    samples = await sample_video_embeddings(sample_size)
+    if len(samples) < dimension:
+        raise SystemExit(f"Need at least {dimension} videos with embeddings to fit, found {len(samples)}")
+    projection = fit_projection(samples, dimension)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    projection.save(output)
+    print(
+        f"Fitted {EMBEDDING_DIMENSION} -> {dimension} projection on {len(samples):,} videos, "
+        f"{projection.explained_variance:.1%} of the energy kept, saved to {output}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit a PCA projection for the vector store")
+    parser.add_argument("--dimension", type=int, required=True, help="Projected dimension")
+    parser.add_argument("--sample", type=int, default=EMBEDDING_PCA_SAMPLE, help="Videos to fit on")
+    parser.add_argument("--output", type=Path, default=Path(EMBEDDING_PCA_PATH or 'data/embedding_pca.npz'), help="Where to save the projection")
+    args = parser.parse_args()
+    asyncio.run(run(args.dimension, args.sample, args.output))
+
+if __name__ == "__main__":
+    main()
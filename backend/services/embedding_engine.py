@@ -0,0 +1,148 @@
+# services/embedding_engine.py
+from datetime import datetime, timezone
+from typing import Optional, Sequence, Tuple
+import numpy as np
+
+# Constants for embedding calculations
+EMBEDDING_DIMENSION = 1536  # OpenAI embedding dimension
+TIME_DECAY_FACTOR = 0.5  # Halves importance every 30 days
+DECAY_PERIOD_DAYS = 30
+SECONDS_PER_DAY = 86400
+
+def timestamps_to_epoch(timestamps: Sequence[str]) -> np.ndarray:
+    """
+    Parse ISO 8601 timestamps into epoch seconds
+    Args:
+        timestamps: ISO 8601 strings, naive values are treated as UTC
+    Returns:
+        np.ndarray: float64 seconds since the epoch
+    """
+    if all(ts.endswith('Z') for ts in timestamps):
+        # Fast path for the UTC strings produced by toISOString()
+        parsed = np.array([ts[:-1] for ts in timestamps], dtype='datetime64[us]')
+        return parsed.astype(np.int64) / 1e6
+
+    epochs = np.empty(len(timestamps), dtype=np.float64)
+    for i, ts in enumerate(timestamps):
+        parsed = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        epochs[i] = parsed.timestamp()
+    return epochs
+
+def days_since(epochs: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+    """
+    Whole days elapsed since each epoch, floored like timedelta.days
+    Args:
+        epochs: Seconds since the epoch
+        now: Reference time in epoch seconds, defaults to the current time
+    Returns:
+        np.ndarray: Elapsed whole days
+    """
+    if now is None:
+        now = datetime.now(timezone.utc).timestamp()
+    return np.floor((now - np.asarray(epochs, dtype=np.float64)) / SECONDS_PER_DAY)
+
+def decay_factors(days: np.ndarray) -> np.ndarray:
+    """Time decay multiplier for each elapsed day count"""
+    return np.power(TIME_DECAY_FACTOR, np.asarray(days, dtype=np.float64) / DECAY_PERIOD_DAYS)
+
+def interaction_weights(scores: np.ndarray, epochs: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+    """
+    Weight of each interaction: its weighted score decayed by its age
+    Args:
+        scores: Pre-calculated interaction scores
+        epochs: Interaction times in epoch seconds
+        now: Reference time in epoch seconds, defaults to the current time
+    Returns:
+        np.ndarray: float64 interaction weights
+    """
+    return np.asarray(scores, dtype=np.float64) * decay_factors(days_since(epochs, now))
+
+def weighted_average(embeddings: np.ndarray, weights: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Weighted average of the rows of an embedding matrix
+    Args:
+        embeddings: (n, d) matrix of embeddings
+        weights: (n,) weights
+    Returns:
+        Optional[np.ndarray]: (d,) float32 average, or None if the weights sum to zero
+    """
+    total_weight = float(np.sum(weights))
+    if len(weights) == 0 or total_weight == 0:
+        return None
+    normalized = (weights / total_weight).astype(np.float32)
+    return normalized @ np.asarray(embeddings, dtype=np.float32)
+
+def grouped_weighted_average(
+    embeddings: np.ndarray,
+    weights: np.ndarray,
+    groups: np.ndarray,
+    n_groups: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Weighted average of embedding rows for many groups (e.g. users) at once
+    Args:
+        embeddings: (n, d) matrix of embeddings
+        weights: (n,) weights
+        groups: (n,) group index of each row in [0, n_groups)
+        n_groups: Number of groups
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (n_groups, d) float32 averages and a
+            boolean mask of groups whose weights sum to a non-zero value
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    weights = np.asarray(weights, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.intp)
+
+    totals = np.bincount(groups, weights=weights, minlength=n_groups)
+    valid = totals != 0
+    averages = np.zeros((n_groups, embeddings.shape[1]), dtype=np.float32)
+    if not valid.any():
+        return averages, valid
+
+    # Normalize per group up front so one reduction gives the averages
+    normalized = np.zeros_like(weights)
+    row_valid = valid[groups]
+    normalized[row_valid] = weights[row_valid] / totals[groups[row_valid]]
+
+    # Rows usually arrive grouped already, skip the reordering copy then
+    if np.all(groups[1:] >= groups[:-1]):
+        sorted_groups, scaled = groups, embeddings * normalized[:, None].astype(np.float32)
+    else:
+        order = np.argsort(groups, kind='stable')
+        sorted_groups = groups[order]
+        scaled = embeddings[order] * normalized[order, None].astype(np.float32)
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    averages[sorted_groups[starts]] = np.add.reduceat(scaled, starts, axis=0)
+    return averages, valid
+
+def merge_embeddings(current: np.ndarray, delta: np.ndarray, alpha: float = 0.7) -> np.ndarray:
+    """
+    Exponential moving average of current and delta embeddings
+    Works on single vectors or on (m, d) matrices row by row.
+    Args:
+        current: Current embeddings
+        delta: New delta embeddings
+        alpha: Weight for current embeddings (1-alpha applied to delta)
+    Returns:
+        np.ndarray: float32 merged embeddings
+    """
+    merged = np.multiply(current, alpha, dtype=np.float32)
+    merged += np.multiply(delta, 1 - alpha, dtype=np.float32)
+    return merged
+
+def decay_embeddings(embeddings: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """
+    Apply time decay to embeddings
+    Args:
+        embeddings: (d,) vector or (m, d) matrix
+        days: Elapsed days, a scalar or one value per row
+    Returns:
+        np.ndarray: float32 decayed embeddings
+    """
+    factors = decay_factors(days).astype(np.float32)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 2:
+        factors = np.reshape(factors, (-1, 1))
+    return embeddings * factors
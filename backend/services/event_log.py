@@ -0,0 +1,37 @@
+# services/event_log.py
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+# Fraction of hot-path events that are logged
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+logger = logging.getLogger("popreel")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+def log_event(event: str, level: int = logging.INFO, sample_rate: float = 1.0, **fields) -> None:
+    """
+    Log an event as one JSON line
+    Args:
+        event: Event name
+        level: Logging level
+        sample_rate: Fraction of calls that are logged, hot paths pass LOG_SAMPLE_RATE
+        fields: Extra JSON-serializable fields
+    """
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    if not logger.isEnabledFor(level):
+        return
+    record = {"event": event, "ts": round(time.time(), 3), **fields}
+    if sample_rate < 1.0:
+        record["sampleRate"] = sample_rate
+    logger.log(level, json.dumps(record, default=str))
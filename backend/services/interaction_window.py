@@ -0,0 +1,70 @@
+# services/interaction_window.py
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from routes.kafka_client import VideoInteraction
+from services import embedding_engine
+
+# Window bounds for the interaction stream processor
+INTERACTION_WINDOW_MAX_SIZE = int(os.getenv('INTERACTION_WINDOW_MAX_SIZE', '5000'))  # Interactions per window
+INTERACTION_WINDOW_MAX_DELAY_SECONDS = float(os.getenv('INTERACTION_WINDOW_MAX_DELAY_SECONDS', '5.0'))
+
+class InteractionWindow:
+    """
+    Size- and time-bounded window of interactions, pre-aggregated per (userId, videoId)
+    Each interaction contributes its weightedScore decayed by its age. The
+    delta embedding is a weighted average, so summing the weights of repeated
+    views of a video gives the same result as keeping them separate.
+    """
+
+    def __init__(self, max_size: int = INTERACTION_WINDOW_MAX_SIZE, max_delay: float = INTERACTION_WINDOW_MAX_DELAY_SECONDS):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._weights: Dict[Tuple[str, str], float] = {}
+        self._count = 0
+        self._opened_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        """Number of interactions added since the window opened"""
+        return self._count
+
+    def add(self, interactions: List[VideoInteraction]) -> None:
+        """Fold a batch of interactions into the window"""
+        if not interactions:
+            return
+        if self._opened_at is None:
+            self._opened_at = time.monotonic()
+
+        weights = embedding_engine.interaction_weights(
+            np.array([i.weightedScore for i in interactions], dtype=np.float64),
+            embedding_engine.timestamps_to_epoch([i.timestamp for i in interactions])
+        )
+        for interaction, weight in zip(interactions, weights.tolist()):
+            key = (interaction.userId, interaction.videoId)
+            self._weights[key] = self._weights.get(key, 0.0) + weight
+        self._count += len(interactions)
+
+    def remaining(self) -> float:
+        """Seconds until the window is due by delay, max_delay when it is empty"""
+        if self._opened_at is None:
+            return self.max_delay
+        return max(self.max_delay - (time.monotonic() - self._opened_at), 0.0)
+
+    def is_due(self) -> bool:
+        """Whether the window holds interactions and has hit its size or delay bound"""
+        return len(self) > 0 and (len(self) >= self.max_size or self.remaining() == 0.0)
+
+    def drain(self) -> Dict[str, Dict[str, float]]:
+        """
+        Close the window and start an empty one
+        Returns:
+            Dict[str, Dict[str, float]]: userId -> videoId -> aggregated weight
+        """
+        weights_by_user: Dict[str, Dict[str, float]] = {}
+        for (user_id, video_id), weight in self._weights.items():
+            weights_by_user.setdefault(user_id, {})[video_id] = weight
+        self._weights = {}
+        self._count = 0
+        self._opened_at = None
+        return weights_by_user
@@ -0,0 +1,40 @@
+# services/invalidation_log.py
+from collections import OrderedDict
+from typing import Hashable
+
+class InvalidationLog:
+    """
+    Recent invalidations of a cache, so fills read before one can be refused
+    A fill takes token() before its database read and checks changed_since()
+    before caching what it read. Only the last history keys are remembered,
+    an older invalidation counts against every token taken before it.
+    """
+
+    def __init__(self, history: int = 10000):
+        self.history = history
+        self._changes = 0  # Bumped by every invalidation
+        self._changed: "OrderedDict[Hashable, int]" = OrderedDict()  # key -> change number
+        self._forgotten = 0  # Latest change dropped from _changed
+        self._cleared = 0  # Change number of the last clear
+
+    def token(self) -> int:
+        """Token for changed_since(), taken before a read"""
+        return self._changes
+
+    def record(self, key: Hashable) -> None:
+        """Record that a key was invalidated"""
+        self._changes += 1
+        self._changed[key] = self._changes
+        self._changed.move_to_end(key)
+        if len(self._changed) > self.history:
+            _, self._forgotten = self._changed.popitem(last=False)
+
+    def record_all(self) -> None:
+        """Record that every key was invalidated"""
+        self._changes += 1
+        self._cleared = self._changes
+        self._changed.clear()
+
+    def changed_since(self, key: Hashable, token: int) -> bool:
+        """Whether the key may have been invalidated after the token was taken"""
+        return token < self._cleared or token < self._forgotten or self._changed.get(key, 0) > token
@@ -0,0 +1,228 @@
+# services/metrics.py
+import bisect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Default histogram buckets in seconds, from sub-millisecond cache hits to slow queries
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+LabelValues = Tuple[str, ...]
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric(ABC):
+    """
+    Base for a named metric with optional labels
+    Updates take a lock so the producer poll thread and consumer threads can
+    record alongside the event loop.
+    """
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for every label combination"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+class Gauge(Metric):
+    """Value that can go up and down, set directly or read from a callback at scrape time"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], Any]] = None
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def remove(self, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+
+    def set_function(self, function: Callable[[], Any]) -> None:
+        """
+        Report function() at scrape time
+        Unlabelled gauges return a number, labelled ones a dict of label value tuples to numbers.
+        """
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                return []
+            if not self.label_names:
+                return [f"{self.name} {_format_value(value)}"]
+            items = [(tuple(str(label) for label in key), number) for key, number in value.items()]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (last one is +Inf), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall time spent in the block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Process-wide set of metrics rendered in the Prometheus text format"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+# Singleton instance
+_registry: MetricsRegistry | None = None
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Get or create the metrics registry singleton"""
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
+
+# Metrics shared across modules
+registry = get_metrics_registry()
+RECOMMENDATION_SECONDS = registry.histogram(
+    "popreel_recommendation_seconds",
+    "Recommendation latency by stage: user embedding fetch, vector query, rerank and the whole request",
+    ("stage",)
+)
+VECTOR_UPSERT_SECONDS = registry.histogram("popreel_vector_upsert_seconds", "Latency of one vector store upsert request")
+DB_POOL_WAIT_SECONDS = registry.histogram("popreel_db_pool_wait_seconds", "Time spent waiting to acquire a pooled connection", ("pool",))
+DB_POOL_CONNECTIONS = registry.gauge("popreel_db_pool_connections", "Open pooled connections by state", ("pool", "state"))
+USER_EMBEDDING_DB_FETCHES = registry.counter("popreel_user_embedding_db_fetches_total", "User embeddings read from the database on a cache miss")
+VIDEO_EMBEDDING_CACHE_LOOKUPS = registry.counter("popreel_video_embedding_cache_lookups_total", "Video embedding cache lookups by result", ("result",))
+CONSUMER_BATCH_SIZE = registry.histogram("popreel_consumer_batch_size", "Messages per consumed batch", ("topic",), SIZE_BUCKETS)
+CONSUMER_PROCESSING_SECONDS = registry.histogram("popreel_consumer_processing_seconds", "Time to process one consumed batch or window", ("topic",))
+CONSUMER_MESSAGES = registry.counter("popreel_consumer_messages_total", "Consumed messages by outcome", ("topic", "result"))
+CONSUMER_LAG = registry.gauge("popreel_consumer_lag", "Messages between the consumer position and the partition high watermark", ("topic", "partition"))
+CONSUMER_RETRIES = registry.counter("popreel_consumer_retries_total", "Per-item retries after a failed batch, by outcome", ("topic", "result"))
+DEAD_LETTERS = registry.counter("popreel_dead_letters_total", "Items sent to a dead-letter topic", ("topic",))
+PRODUCER_MESSAGES = registry.counter("popreel_producer_messages_total", "Produced messages by delivery outcome", ("topic", "result"))
+PRODUCER_QUEUE_DEPTH = registry.gauge("popreel_producer_queue_depth", "Messages and requests waiting in the producer's local queue")
@@ -1,97 +1,403 @@
 # services/ml_consumer.py
-from typing import List, Optional
-from routes.kafka_client import get_kafka_client, Topics
+from typing import Dict, List, Optional, Tuple
+from confluent_kafka import Consumer
+from routes.kafka_client import get_kafka_client, KafkaClient, Topics, CONSUMER_MAX_WAIT_SECONDS, UserInteractionWeights, VideoEmbedding
+import argparse
 import asyncio
-from services.ml_processor import add_to_pinecone, update_user_embedding
-from db.connection import get_db
+import multiprocessing
+import os
+import signal
+import numpy as np
+from services.interaction_window import InteractionWindow
+from services.ml_processor import (
+    USER_EMBEDDINGS_CHANNEL,
+    VIDEO_EMBEDDINGS_CHANNEL,
+    add_batch_to_pinecone,
+    add_to_pinecone,
+    clear_user_caches,
+    handle_user_embedding_notification,
+    handle_video_embedding_notification,
+    update_user_embeddings_from_weights,
+)
+from db.connection import get_consumer_db, init_postgres, listen
+from services.metrics import CONSUMER_PROCESSING_SECONDS, get_metrics_registry
+from services.seen_filter import get_seen_filter_cache
+from services.dead_letters import RETRY_MAX_DELAY_SECONDS, retry_each, settle_failures
+from services.embedding_engine import EMBEDDING_DIMENSION
+from services.video_embedding_cache import get_video_embedding_cache
+from services.vector_store import get_vector_store
 
-async def process_video_embeddings():
+# Worker processes started by the standalone runner
+CONSUMER_WORKERS = int(os.getenv('CONSUMER_WORKERS', '1'))
+CONSUMER_METRICS_PORT = int(os.getenv('CONSUMER_METRICS_PORT', '0'))  # Worker i serves /metrics on port + i, 0 disables
+# Window flush planning
+USER_UPDATE_CHUNK_SIZE = int(os.getenv('USER_UPDATE_CHUNK_SIZE', '100'))  # Users per fetch, merge and upsert round trip
+USER_UPDATE_CONCURRENCY = int(os.getenv('USER_UPDATE_CONCURRENCY', '4'))  # Chunks in flight, keep below the consumer pool size
+# Dead-letter replay stops after this many failed items in a row instead of parking them
+REPLAY_MAX_CONSECUTIVE_FAILURES = int(os.getenv('REPLAY_MAX_CONSECUTIVE_FAILURES', '3'))
+
+async def process_video_embeddings(stop: Optional[asyncio.Event] = None):
     client = get_kafka_client()
     consumer = client.create_consumer("video-processor")
     consumer.subscribe([Topics.VIDEO_EMBEDDINGS])
-    
+    stop = stop or asyncio.Event()
+
     try:
-        while True:
-            embeddings = client.consume_video_embeddings(consumer)
+        while not stop.is_set():
+            # Waits off the event loop for up to a full batch
+            embeddings = await client.consume_video_embeddings(consumer)
             if embeddings:  # Only process and commit if we received messages
-                for embedding in embeddings:
-                    # Add to Pinecone
-                    success = await add_to_pinecone(embedding)
-                    if not success:
-                        print(f"Failed to process video embedding for video {embedding.id}")
-                # Commit offset after successful processing of batch
-                consumer.commit()
-            await asyncio.sleep(1)  # Poll every second
+                # Add the whole batch to Pinecone
+                with CONSUMER_PROCESSING_SECONDS.time(topic=Topics.VIDEO_EMBEDDINGS):
+                    results = await add_batch_to_pinecone(embeddings)
+                # Retry failed videos one by one, the rest of the batch is already stored
+                settled = await settle_failures(
+                    Topics.VIDEO_EMBEDDINGS,
+                    Topics.VIDEO_EMBEDDINGS_DLQ,
+                    {video.id: video for video in embeddings if not results.get(video.id)},
+                    retry_video_embedding,
+                    lambda video_id, video: video
+                )
+                if settled:
+                    # Every video is stored or dead-lettered
+                    await client.commit_async(consumer)
+                else:
+                    await redeliver(client, consumer)
     finally:
-        consumer.close()
+        await client.close_consumer_async(consumer)
 
-async def process_interactions():
+async def process_interactions(stop: Optional[asyncio.Event] = None):
     client = get_kafka_client()
     consumer = client.create_consumer("interaction-processor")
-    consumer.subscribe([Topics.VIDEO_INTERACTIONS])
-    
+    window = InteractionWindow()
+    loop = asyncio.get_running_loop()
+    stop = stop or asyncio.Event()
+
+    async def flush() -> bool:
+        weights_by_user = window.drain()
+        with CONSUMER_PROCESSING_SECONDS.time(topic=Topics.VIDEO_INTERACTIONS):
+            results = await flush_interaction_window(weights_by_user)
+        # Retry failed users one by one, users already updated are not applied twice
+        return await settle_failures(
+            Topics.VIDEO_INTERACTIONS,
+            Topics.VIDEO_INTERACTIONS_DLQ,
+            {user_id: weights_by_user[user_id] for user_id, success in results.items() if not success},
+            retry_user_weights,
+            lambda user_id, weights: UserInteractionWeights(userId=user_id, weights=weights)
+        )
+
+    def on_revoke(consumer, partitions):
+        # Runs on the consumer thread inside consume() or close(), while the
+        # event loop is free. Flush and commit before another worker picks up
+        # these partitions so it neither replays nor loses the open window.
+        if len(window) == 0:
+            return
+        try:
+            # Left uncommitted if dead-lettering failed, the next owner replays the window
+            if asyncio.run_coroutine_threadsafe(flush(), loop).result():
+                consumer.commit(asynchronous=False)
+        except Exception as e:
+            print(f"Error flushing interactions on revoke: {e}")
+
+    consumer.subscribe([Topics.VIDEO_INTERACTIONS], on_revoke=on_revoke)
+
+    try:
+        while not stop.is_set():
+            # Consume continuously, waking up in time to flush the open window
+            interactions = await client.consume_interactions(
+                consumer,
+                timeout=max(min(CONSUMER_MAX_WAIT_SECONDS, window.remaining()), 0.01)
+            )
+            window.add(interactions)
+            # Only filters loaded in this process are updated, when the API runs the consumers
+            get_seen_filter_cache().mark_interactions(interactions)
+            # Every user in the window is updated or dead-lettered once flushed
+            if window.is_due():
+                if await flush():
+                    await client.commit_async(consumer)
+                else:
+                    await redeliver(client, consumer)
+
+        # Drain the open window before leaving the group, uncommitted on failure
+        if len(window) and await flush():
+            await client.commit_async(consumer)
+    finally:
+        await client.close_consumer_async(consumer)
+
+async def redeliver(client: KafkaClient, consumer: Consumer) -> None:
+    """
+    Consume a batch again after its failed items could not be dead-lettered
+    Nothing is committed, so the next successful commit cannot skip over the
+    batch. Items of the batch that did succeed are processed again, which
+    repeats their update rather than losing the failed ones.
+    """
+    print("Dead-lettering failed, rewinding to the last committed offsets")
+    # Give the dead-letter topic time to recover before the batch fails again
+    await asyncio.sleep(RETRY_MAX_DELAY_SECONDS)
+    await client.rewind_async(consumer)
+
+async def flush_interaction_window(weights_by_user: Dict[str, Dict[str, float]]) -> Dict[str, bool]:
+    """
+    Apply a drained interaction window to the user embeddings
+    Every distinct video in the window is fetched in one query, then users are
+    updated in chunks of USER_UPDATE_CHUNK_SIZE, USER_UPDATE_CONCURRENCY at a time.
+    Args:
+        weights_by_user: userId -> videoId -> aggregated interaction weight
+    Returns:
+        Dict[str, bool]: Success status per user
+    """
+    if not weights_by_user:
+        return {}
+    video_ids = list({video_id for weights in weights_by_user.values() for video_id in weights})
+    try:
+        video_rows, video_matrix = await get_video_embedding_matrix(video_ids)
+    except Exception as e:
+        print(f"Error fetching video embeddings: {e}")
+        return {user_id: False for user_id in weights_by_user}
+
+    user_ids = list(weights_by_user.keys())
+    semaphore = asyncio.Semaphore(USER_UPDATE_CONCURRENCY)
+
+    async def update(chunk: List[str]) -> Dict[str, bool]:
+        async with semaphore:
+            return await update_user_embeddings_from_weights(
+                {user_id: weights_by_user[user_id] for user_id in chunk}, video_rows, video_matrix
+            )
+
+    results: Dict[str, bool] = {}
+    for chunk_results in await asyncio.gather(*(
+        update(user_ids[start:start + USER_UPDATE_CHUNK_SIZE])
+        for start in range(0, len(user_ids), USER_UPDATE_CHUNK_SIZE)
+    )):
+        results.update(chunk_results)
+    return results
+
+async def get_video_embedding_matrix(video_ids: List[str]) -> Tuple[Dict[str, int], np.ndarray]:
+    """
+    Fetch video embeddings into one matrix indexed by id
+    Cached videos are read from the video embedding cache, only the rest are
+    queried and then cached.
+    Args:
+        video_ids: Distinct video IDs
+    Returns:
+        Tuple[Dict[str, int], np.ndarray]: videoId -> row, for videos with an
+            embedding, and the (n, d) float32 matrix of those rows
+    """
+    cache = get_video_embedding_cache()
+    cached_ids, cached, missing = cache.get_many(video_ids)
+
+    # Invalidations that land during the read keep its embeddings out of the cache
+    token = cache.fill_token()
+    rows = [row for row in await get_video_embeddings(missing) if row['embedding'] is not None]
+    # Rows come back in any order, pair them with videos by id
+    fetched_ids = [str(row['id']) for row in rows]
+    fetched = np.stack([row['embedding'] for row in rows]) if rows else np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+    cache.fill_many(fetched_ids, fetched, token)
+
+    video_rows = {video_id: i for i, video_id in enumerate(cached_ids + fetched_ids)}
+    return video_rows, np.concatenate([cached, fetched])
+
+async def retry_video_embedding(video_id: str, video: VideoEmbedding) -> bool:
+    """Store one video that failed in its batch"""
+    return await add_to_pinecone(video)
+
+async def retry_user_weights(user_id: str, weights: Dict[str, float]) -> bool:
+    """Apply one user's window after the user failed in the batch"""
+    results = await flush_interaction_window({user_id: weights})
+    return results.get(user_id, False)
+
+async def replay_dead_letters(
+    source: str,
+    idle_seconds: float = 10.0,
+    max_consecutive_failures: int = REPLAY_MAX_CONSECUTIVE_FAILURES
+) -> int:
+    """
+    Reprocess dead-lettered items, committing after each one
+    An item that still fails is moved to the parking topic, so it cannot hold
+    up the items behind it on later replays. Stops when the dead-letter topic
+    has been idle for idle_seconds, or when max_consecutive_failures items
+    fail in a row, which points at an outage rather than bad items. The item
+    that stops the replay is not parked or committed, it and everything
+    behind it stay on the topic for the next replay.
+    Args:
+        source: "videos" or "interactions"
+        idle_seconds: How long to wait for more items before stopping
+        max_consecutive_failures: Failed items in a row that stop the replay
+    Returns:
+        int: Number of items replayed
+    """
+    client = get_kafka_client()
+    if source == "videos":
+        topic, consume, attempt = Topics.VIDEO_EMBEDDINGS_DLQ, client.consume_video_embeddings, retry_video_embedding
+        parking_topic = Topics.VIDEO_EMBEDDINGS_PARKED
+        key = lambda video: video.id
+    else:
+        topic, consume = Topics.VIDEO_INTERACTIONS_DLQ, client.consume_interaction_weights
+        parking_topic = Topics.VIDEO_INTERACTIONS_PARKED
+        attempt = lambda user_id, window: retry_user_weights(user_id, window.weights)
+        key = lambda window: window.userId
+
+    consumer = client.create_consumer(f"{topic}-replay")
+    consumer.subscribe([topic])
+    loop = asyncio.get_running_loop()
+    replayed = 0
+    parked = 0
+    failures = 0
     try:
         while True:
-            # Get interactions grouped by user
-            interactions_by_user = client.consume_interactions_by_user(consumer)
-            
-            if interactions_by_user:  # Only process and commit if we received messages
-                success = True
-                for user_id, interactions in interactions_by_user.items():
-                    # Update user embeddings
-                    video_ids = [i.videoId for i in interactions]
-                    video_embeddings = await get_video_embeddings(video_ids)
-                    interactions_with_video_embeddings = zip(interactions, video_embeddings)
-                    result = await update_user_embedding(user_id, interactions_with_video_embeddings)
-                    if not result:
-                        print(f"Failed to process interactions for user {user_id}")
-                        success = False
-                
-                # Only commit if all users were processed successfully
-                if success:
-                    consumer.commit()
-                    print("Successfully committed offset after processing interactions")
-            
-            await asyncio.sleep(60)  # Poll every minute
+            started = loop.time()
+            # One item at a time, so a commit never covers an item that failed
+            items = await consume(consumer, max_messages=1, timeout=idle_seconds)
+            if not items:
+                if loop.time() - started >= idle_seconds:
+                    break
+                # An undecodable message was skipped, move past it
+                await client.commit_async(consumer)
+                continue
+            item = items[0]
+            item_key = key(item)
+            if (await retry_each({item_key: item}, attempt, topic))[item_key]:
+                failures = 0
+                replayed += 1
+            else:
+                failures += 1
+                if failures >= max_consecutive_failures:
+                    print(f"Replay stopped at {item_key} from {topic}, {failures} items in a row still fail")
+                    break
+                if not await client.produce_async(parking_topic, [item], headers={'source-topic': topic}):
+                    print(f"Replay stopped at {item_key} from {topic}, it could not be parked")
+                    break
+                print(f"Parked {item_key} from {topic} on {parking_topic}, it still fails")
+                parked += 1
+            await client.commit_async(consumer)
     finally:
-        consumer.close()
+        await client.close_consumer_async(consumer)
+    print(f"Replayed {replayed} items from {topic}, parked {parked}")
+    return replayed
 
 async def get_video_embeddings(video_ids: List[str]) -> List[dict]:
     if not video_ids:
         return []
-    pool = await get_db()
+    pool = await get_consumer_db()
 
     query = """
-    SELECT id, embedding 
+    SELECT id, embedding
     FROM videos
     WHERE id = ANY($1)
     """
     async with pool.acquire() as conn:
         rows = await conn.fetch(query, video_ids)
-        if not rows:
-            return []
-        
-        # Convert each row to a dict and parse the embedding string into a list of floats
-        processed_rows = []
-        for row in rows:
-            row_dict = dict(row)
-            if row_dict['embedding']:
-                # Remove brackets and split by comma
-                embedding_str = row_dict['embedding'].strip('[]')
-                embedding_floats = [float(x.strip()) for x in embedding_str.split(',')]
-                row_dict['embedding'] = embedding_floats
-            processed_rows.append(row_dict)
-            
-        return processed_rows
+        # Embeddings are decoded into float32 arrays by the vector codec
+        return [dict(row) for row in rows]
 
 
 # Start both consumers
-async def run_consumers():
+async def run_consumers(stop: Optional[asyncio.Event] = None):
     await asyncio.gather(
-        process_video_embeddings(),
-        process_interactions()
+        process_video_embeddings(stop),
+        process_interactions(stop)
     )
 
-if __name__ == "__main__":
-    asyncio.run(run_consumers())
+async def serve_metrics(port: int) -> asyncio.AbstractServer:
+    """Serve the metrics registry over plain HTTP, workers have no web app of their own"""
+    registry = get_metrics_registry()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = registry.render().encode('utf-8')
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + f"Content-Type: {registry.CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii')
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host="0.0.0.0", port=port)
+
+async def run_worker(index: int = 0):
+    """
+    Run one consumer worker until SIGTERM or SIGINT
+    Each worker joins both consumer groups, so Kafka spreads partitions
+    across however many workers are running.
+    Args:
+        index: Position of the worker, offsets its metrics port
+    """
+    await init_postgres(("consumer",))
+    # Fail now, not on the first upsert, if the index was built for another projection
+    await asyncio.to_thread(get_vector_store)
+    metrics_server = await serve_metrics(CONSUMER_METRICS_PORT + index) if CONSUMER_METRICS_PORT else None
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    # A user's partition can move here from another worker after a rebalance,
+    # drop cached embeddings that worker has since rewritten
+    listeners = [
+        asyncio.create_task(listen(USER_EMBEDDINGS_CHANNEL, handle_user_embedding_notification, clear_user_caches)),
+        asyncio.create_task(
+            listen(VIDEO_EMBEDDINGS_CHANNEL, handle_video_embedding_notification, get_video_embedding_cache().clear)
+        ),
+    ]
+    try:
+        await run_consumers(stop)
+    finally:
+        for listener in listeners:
+            listener.cancel()
+        if metrics_server is not None:
+            metrics_server.close()
+        get_kafka_client().close()
+
+def _worker_main(index: int = 0):
+    asyncio.run(run_worker(index))
+
+async def _replay_main(source: str):
+    await init_postgres(("consumer",))
+    try:
+        await replay_dead_letters(source)
+    finally:
+        get_kafka_client().close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Kafka consumer workers")
+    parser.add_argument("--workers", type=int, default=CONSUMER_WORKERS, help="Number of worker processes")
+    parser.add_argument("--replay", choices=("videos", "interactions"), help="Reprocess a dead-letter topic and exit")
+    args = parser.parse_args()
+
+    if args.replay:
+        asyncio.run(_replay_main(args.replay))
+        return
 
+    if args.workers <= 1:
+        _worker_main()
+        return
+
+    # Spawn, not fork, so no worker inherits another's Kafka or Postgres sockets
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_worker_main, args=(i,), name=f"consumer-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def forward(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    for worker in workers:
+        worker.join()
+        if worker.exitcode:
+            print(f"{worker.name} exited with code {worker.exitcode}")
+
+if __name__ == "__main__":
+    main()
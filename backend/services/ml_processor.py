@@ -1,273 +1,328 @@
-import os
-from typing import List, Dict, Any, Optional, Tuple
-from pinecone import Pinecone, ServerlessSpec
-from db.connection import get_db
-from routes.kafka_client import VideoInteraction, VideoEmbedding
-from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+from db.connection import INSTANCE_ID, InstrumentedPool, encode_vector, get_consumer_db, get_db
+from routes.kafka_client import VideoEmbedding
+from datetime import timezone
 import numpy as np
+from services import embedding_engine
+from services.vector_store import get_vector_store
+from services.recommendation_cache import get_recommendation_cache
+from services.user_embedding_cache import CachedUserEmbedding, get_user_embedding_cache
+from services.video_embedding_cache import get_video_embedding_cache
+from services.metrics import USER_EMBEDDING_DB_FETCHES, VECTOR_UPSERT_SECONDS
+from services.event_log import LOG_SAMPLE_RATE, log_event
 
-# Lazy initialization of Pinecone
-_pinecone_client = None
+VECTOR_UPSERT_BATCH_SIZE = 100  # Vectors per upsert request
+USER_EMBEDDINGS_CHANNEL = "user_embeddings_updated"  # NOTIFY channel, payload is "<instance>:<userId>"
+USER_EMBEDDINGS_ALL = "*"  # userId in a notification after a bulk rewrite, drop every cached user
+VIDEO_EMBEDDINGS_CHANNEL = "video_embeddings_updated"  # NOTIFY channel, payload is "<instance>:<videoId>"
 
-# Constants for embedding calculations
-EMBEDDING_DIMENSION = 1536  # OpenAI embedding dimension
-TIME_DECAY_FACTOR = 0.5  # Halves importance every 30 days
-
-def get_pinecone_client():
-    """Get or create Pinecone client"""
-    global _pinecone_client
-    if _pinecone_client is None:
-        api_key = os.getenv('PINECONE_API_KEY')
-        if not api_key:
-            print("Warning: PINECONE_API_KEY not set")
-            return None
-        
-        _pinecone_client = Pinecone(api_key=api_key)
-        
-        # Create index if it doesn't exist
-        index_name = "video-embeddings"
-        try:
-            if index_name not in _pinecone_client.list_indexes().names():
-                _pinecone_client.create_index(
-                    name=index_name,
-                    dimension=1536,  # OpenAI embedding dimension
-                    spec=ServerlessSpec(
-                        cloud="aws",
-                        region="us-west-2"
-                    )
-                )
-        except Exception as e:
-            print(f"Error creating Pinecone index: {e}")
-            return None
-            
-    return _pinecone_client
+def video_vector(video: VideoEmbedding) -> Dict[str, Any]:
+    """
+    Vector store record for a video
+    Args:
+        video: Video embedding data, with an embedding
+    Returns:
+        Dict[str, Any]: id, values and the metadata returned with query matches
+    """
+    return {
+        'id': video.id,
+        'values': video.embedding,
+        'metadata': {
+            'title': video.title,
+            'description': video.description,
+            'userId': video.userId,
+            'duration': video.duration,
+            'trendingScore': video.trendingScore
+        }
+    }
 
 async def add_to_pinecone(video: VideoEmbedding) -> bool:
     """
-    Add video embedding to Pinecone
+    Add video embedding to the vector store
     Args:
         video: Video embedding data
     Returns:
         bool: Success status
     """
-    try:
-        if not video.embedding:
+    results = await add_batch_to_pinecone([video])
+    return results.get(video.id, False)
+
+async def add_batch_to_pinecone(videos: List[VideoEmbedding]) -> Dict[str, bool]:
+    """
+    Add a batch of video embeddings to the vector store and record their status
+    Vectors are upserted in chunks of VECTOR_UPSERT_BATCH_SIZE, then every
+    video is marked 'ready' or 'failed' in a single statement. Videos without
+    an embedding are marked 'failed' and count as handled, retrying cannot
+    give them one.
+    Args:
+        videos: Video embedding data
+    Returns:
+        Dict[str, bool]: Per video id, False only for vector store or database errors
+    """
+    results: Dict[str, bool] = {video.id: False for video in videos}
+    if not videos:
+        return results
+
+    # Keyed by id so a video repeated in the batch is upserted once
+    vectors_by_id: Dict[str, Dict[str, Any]] = {}
+    for video in videos:
+        if video.embedding is None or len(video.embedding) == 0:
             print(f"No embedding for video {video.id}")
-            return False
-            
-        pc = get_pinecone_client()
-        if not pc:
-            print("Pinecone client not available")
-            return False
-            
-        index = pc.Index("video-embeddings")
+            continue
+        vectors_by_id[video.id] = video_vector(video)
+    vectors = list(vectors_by_id.values())
 
-        # Upsert to Pinecone
-        index.upsert(
-            vectors=[{
-                'id': video.id,
-                'values': video.embedding,
-                'metadata': {
-                    'title': video.title,
-                    'description': video.description,
-                    'userId': video.userId,
-                    'duration': video.duration,
-                    'trendingScore': video.trendingScore
-                }
-            }]
-        )
-        
-        # Update video status in database
-        db_pool = await get_db()
+    store = get_vector_store()
+    for start in range(0, len(vectors), VECTOR_UPSERT_BATCH_SIZE):
+        chunk = vectors[start:start + VECTOR_UPSERT_BATCH_SIZE]
+        try:
+            with VECTOR_UPSERT_SECONDS.time():
+                await store.upsert(chunk)
+        except Exception as e:
+            print(f"Error adding to vector store: {e}")
+            continue
+        for vector in chunk:
+            results[vector['id']] = True
+
+    # The embedding may have changed, drop cached copies here and in other processes
+    get_video_embedding_cache().invalidate(list(results.keys()))
+    statuses = ['ready' if stored else 'failed' for stored in results.values()]
+    for video_id in results.keys() - vectors_by_id.keys():
+        results[video_id] = True
+
+    # Update every video status in one round trip
+    try:
+        db_pool = await get_consumer_db()
         async with db_pool.acquire() as conn:
             await conn.execute(
                 """
-                UPDATE videos 
-                SET status = 'ready'
-                WHERE id = $1
+                WITH updated AS (
+                    UPDATE videos AS v
+                    SET status = s.status
+                    FROM unnest($1::text[], $2::text[]) AS s(id, status)
+                    WHERE v.id = s.id::uuid
+                    RETURNING v.id::text AS id
+                )
+                SELECT pg_notify($3, $4 || ':' || id)
+                FROM updated
                 """,
-                video.id
+                list(results.keys()),
+                statuses,
+                VIDEO_EMBEDDINGS_CHANNEL,
+                INSTANCE_ID
             )
-        
-        return True
     except Exception as e:
-        print(f"Error adding to Pinecone: {e}")
-        return False 
-    
+        print(f"Error updating video status: {e}")
+        return {video_id: False for video_id in results}
+
+    return results
 
-async def update_user_embedding(user_id: str, interactions_with_video_embeddings: List[Tuple[VideoInteraction, List[float] | None]]) -> bool:
+async def update_user_embeddings_from_weights(
+    weights_by_user: Dict[str, Dict[str, float]],
+    video_rows: Dict[str, int],
+    video_matrix: np.ndarray
+) -> Dict[str, bool]:
     """
-    Update user embedding based on their video interactions
+    Update the embeddings of every user in a pre-aggregated interaction window
     Args:
-        user_id: ID of the user
-        interactions_with_video_embeddings: List of tuples containing video interactions and their embeddings
+        weights_by_user: userId -> videoId -> decayed interaction weight
+        video_rows: videoId -> row in video_matrix, videos without an embedding are absent
+        video_matrix: (n, d) video embeddings
     Returns:
-        bool: Success status
+        Dict[str, bool]: Per user, False only for database errors
     """
-    try:
-        # Get current user embedding if it exists
-        current_user_embedding = await get_user_embedding(user_id)
-        
-        # Generate new embedding from interactions
-        delta_embedding = await generate_delta_embedding(interactions_with_video_embeddings)
-        if not delta_embedding:
+    if not weights_by_user:
+        return {}
+    user_ids = list(weights_by_user.keys())
+    rows = []
+    weights = []
+    groups = []
+    for user_index, user_id in enumerate(user_ids):
+        for video_id, weight in weights_by_user[user_id].items():
+            row = video_rows.get(video_id)
+            if row is None:
+                continue
+            rows.append(row)
+            weights.append(weight)
+            groups.append(user_index)
+
+    deltas: Dict[str, np.ndarray] = {}
+    if rows:
+        averages, valid = embedding_engine.grouped_weighted_average(
+            video_matrix[rows], np.array(weights), np.array(groups), len(user_ids)
+        )
+        deltas = {user_ids[i]: averages[i] for i in np.flatnonzero(valid)}
+    return await _merge_and_store_deltas(user_ids, deltas)
+
+async def _merge_and_store_deltas(user_ids: List[str], deltas: Dict[str, np.ndarray]) -> Dict[str, bool]:
+    """
+    Merge deltas into the current user embeddings and upsert them in one statement
+    Users without a delta, none of whose videos has an embedding (still
+    processing or deleted), have nothing to apply and count as handled.
+    Args:
+        user_ids: Every user in the batch
+        deltas: userId -> delta embedding, for users with a valid delta
+    Returns:
+        Dict[str, bool]: Per user, False only for database errors
+    """
+    results = {user_id: user_id not in deltas for user_id in user_ids}
+    for user_id in user_ids:
+        if user_id not in deltas:
             print(f"No valid delta embedding generated for user {user_id}")
-            return False
-            
-        if not current_user_embedding:
-            # First time user - use delta embedding as is
-            new_embedding = delta_embedding
-        else:
-            # Merge existing embedding with delta
-            new_embedding = merge_embeddings(current_user_embedding, delta_embedding)
-        
-        # Update in database
-        db_pool = await get_db()
+    if not deltas:
+        return results
+
+    try:
+        delta_user_ids = list(deltas.keys())
+        new_embeddings = np.stack([deltas[user_id] for user_id in delta_user_ids])
+
+        # Merge existing embeddings with their deltas, first time users keep the delta as is
+        # Read from the consumer pool, the merge must not wait behind API traffic
+        current = await fetch_user_embeddings(delta_user_ids, db_pool=await get_consumer_db())
+        existing = [i for i, user_id in enumerate(delta_user_ids) if user_id in current]
+        if existing:
+            current_matrix = np.stack([current[delta_user_ids[i]].embedding for i in existing])
+            days_since_update = embedding_engine.days_since(np.array([
+                current[delta_user_ids[i]].updated_at.replace(tzinfo=timezone.utc).timestamp()
+                for i in existing
+            ]))
+            decayed = embedding_engine.decay_embeddings(current_matrix, days_since_update)
+            new_embeddings[existing] = embedding_engine.merge_embeddings(decayed, new_embeddings[existing])
+
+        # Upsert every user in one round trip
+        db_pool = await get_consumer_db()
         async with db_pool.acquire() as conn:
-            # First try to update existing record
-            result = await conn.execute(
+            # Notify other processes so they drop their cached copies
+            rows = await conn.fetch(
                 """
-                UPDATE user_embeddings 
-                SET embedding = $1, updated_at = NOW()
-                WHERE user_id = $2
-                """,
-                f"[{','.join(map(str, new_embedding))}]",  # Format as PostgreSQL array
-                user_id
-            )
-            
-            # If no record was updated, insert a new one
-            if result == "UPDATE 0":
-                await conn.execute(
-                    """
+                WITH upserted AS (
                     INSERT INTO user_embeddings (user_id, embedding, updated_at)
-                    VALUES ($1, $2, NOW())
-                    """,
-                    user_id,
-                    f"[{','.join(map(str, new_embedding))}]"  # Format as PostgreSQL array
+                    SELECT u.user_id, u.embedding, NOW()
+                    FROM unnest($1::text[], $2::vector[]) AS u(user_id, embedding)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET embedding = EXCLUDED.embedding, updated_at = EXCLUDED.updated_at
+                    RETURNING user_id, updated_at
                 )
-        return True
+                SELECT user_id, updated_at, pg_notify($3, $4 || ':' || user_id)
+                FROM upserted
+                """,
+                delta_user_ids,
+                [encode_vector(embedding) for embedding in new_embeddings],
+                USER_EMBEDDINGS_CHANNEL,
+                INSTANCE_ID
+            )
     except Exception as e:
-        print(f"Error updating user embedding: {e}")
-        return False
+        print(f"Error updating user embeddings: {e}")
+        return results
+
+    # Write through so the next read skips the database
+    cache = get_user_embedding_cache()
+    recommendation_cache = get_recommendation_cache()
+    updated_at = {row['user_id']: row['updated_at'] for row in rows}
+    for user_id, embedding in zip(delta_user_ids, new_embeddings):
+        cache.put(user_id, embedding, updated_at[user_id])
+        # Cached recommendations were ranked against the old embedding
+        recommendation_cache.invalidate(user_id)
+        results[user_id] = True
+    return results
 
-async def get_user_embedding(user_id: str) -> Optional[List[float]]:
+def handle_user_embedding_notification(payload: str) -> None:
+    """Drop cached state for a user whose embedding another process rewrote"""
+    instance_id, _, user_id = payload.partition(':')
+    if instance_id == INSTANCE_ID:
+        return
+    if user_id == USER_EMBEDDINGS_ALL:
+        clear_user_caches()
+        return
+    get_user_embedding_cache().invalidate(user_id)
+    get_recommendation_cache().invalidate(user_id)
+
+def handle_video_embedding_notification(payload: str) -> None:
+    """Drop a cached video embedding that another process changed or removed"""
+    instance_id, _, video_id = payload.partition(':')
+    if instance_id == INSTANCE_ID:
+        return
+    get_video_embedding_cache().invalidate([video_id])
+
+def clear_user_caches() -> None:
+    """Drop every cached user embedding and ranked candidate list"""
+    get_user_embedding_cache().clear()
+    get_recommendation_cache().clear()
+
+async def fetch_user_embedding(user_id: str) -> Optional[CachedUserEmbedding]:
     """
-    Get user embedding and apply time decay
+    Get the stored user embedding and its update time, through the cache
     Args:
         user_id: ID of the user
     Returns:
-        Optional[List[float]]: Time-decayed user embedding or None if not found
+        Optional[CachedUserEmbedding]: Undecayed embedding or None if not found
     """
-    db_pool = await get_db()
-    async with db_pool.acquire() as conn:
-        result = await conn.fetchrow(
-            """
-            SELECT embedding, updated_at 
-            FROM user_embeddings 
-            WHERE user_id = $1
-            """, 
-            user_id
-        )
-        print(f"Fetched user embedding for user {user_id}")
-        
-        if not result or not result['embedding']:
-            return None
-            
-        # Parse the embedding string into a list of floats
-        embedding_str = result['embedding'].strip('[]')
-        embedding = [float(x.strip()) for x in embedding_str.split(',')]
-            
-        # Apply time decay - ensure both times are timezone-aware
-        updated_at = result['updated_at'].replace(tzinfo=timezone.utc)  # Ensure UTC timezone
-        current_time = datetime.now(timezone.utc)
-        days_since_update = (current_time - updated_at).days
-        decay_factor = np.power(TIME_DECAY_FACTOR, days_since_update / 30)  # Decay over 30-day periods
-        return [x * decay_factor for x in embedding]
+    embeddings = await fetch_user_embeddings([user_id])
+    return embeddings.get(user_id)
 
-async def generate_delta_embedding(interactions_with_video_embeddings: List[Tuple[VideoInteraction, List[float] | None]]) -> Optional[List[float]]:
+async def fetch_user_embeddings(user_ids: List[str], db_pool: Optional[InstrumentedPool] = None) -> Dict[str, CachedUserEmbedding]:
     """
-    Generate delta embedding based on video interactions
+    Get stored user embeddings and their update times, through the cache
+    Cache misses are read in a single query.
     Args:
-        interactions_with_video_embeddings: List of tuples containing video interactions and their embeddings
+        user_ids: IDs of the users
+        db_pool: Pool to read misses from, the API pool by default
     Returns:
-        Optional[List[float]]: Weighted average embedding based on interactions
+        Dict[str, CachedUserEmbedding]: userId -> undecayed embedding, for users that have one
     """
-    if not interactions_with_video_embeddings:
-        return None
-        
-    weighted_embeddings = []
-    total_weight = 0.0  # Changed to float
-    
-    for interaction, video_embedding_dict in interactions_with_video_embeddings:
-        if not video_embedding_dict or not video_embedding_dict.get('embedding'):
-            continue
-            
-        # Extract the embedding from the dictionary
-        video_embedding = video_embedding_dict['embedding']
-            
-        # Convert video embedding to numpy array for vector operations
-        embedding_array = np.array(video_embedding, dtype=np.float64)
-            
-        # Use the pre-calculated weightedScore
-        weight = float(interaction.weightedScore)  # Convert to float
-            
-        # Apply time decay to the interaction
-        interaction_time = datetime.fromisoformat(interaction.timestamp.replace('Z', '+00:00'))
-        days_since_interaction = (datetime.now(timezone.utc) - interaction_time).days
-        decay_factor = float(np.power(TIME_DECAY_FACTOR, days_since_interaction / 30))  # Convert to float
-        weight *= decay_factor
-        
-        # Add weighted embedding using numpy multiplication
-        weighted_embedding = embedding_array * weight
-        weighted_embeddings.append(weighted_embedding)
-        total_weight += weight
-    
-    if not weighted_embeddings or total_weight == 0:
-        return None
-        
-    # Calculate weighted average using numpy
-    result = np.zeros(EMBEDDING_DIMENSION, dtype=np.float64)
-    for weighted_embedding in weighted_embeddings:
-        result += weighted_embedding
-    
-    # Normalize by total weight and convert back to list
-    if total_weight > 0:
-        result = result / total_weight
-            
-    return result.tolist()
+    cache = get_user_embedding_cache()
+    found: Dict[str, CachedUserEmbedding] = {}
+    missing = []
+    for user_id in user_ids:
+        cached = cache.get(user_id)
+        if cached is not None:
+            found[user_id] = cached
+        else:
+            missing.append(user_id)
+    if not missing:
+        return found
 
-def merge_embeddings(current: List[float], delta: List[float], alpha: float = 0.7) -> List[float]:
-    """
-    Merge current embedding with delta embedding using exponential moving average
-    Args:
-        current: Current user embedding
-        delta: New delta embedding
-        alpha: Weight for current embedding (1-alpha applied to delta)
-    Returns:
-        List[float]: Merged embedding
-    """
-    return [alpha * c + (1 - alpha) * d for c, d in zip(current, delta)]
+    if db_pool is None:
+        db_pool = await get_db()
+    # Invalidations that land during the read keep its rows out of the cache
+    token = cache.fill_token()
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT user_id, embedding, updated_at 
+            FROM user_embeddings 
+            WHERE user_id = ANY($1)
+            """, 
+            missing
+        )
+    USER_EMBEDDING_DB_FETCHES.inc(len(missing))
+    log_event("user_embeddings_fetched", sample_rate=LOG_SAMPLE_RATE, users=len(missing), found=len(rows))
+    for row in rows:
+        if row['embedding'] is None:
+            continue
+        cache.fill(row['user_id'], row['embedding'], row['updated_at'], token)
+        found[row['user_id']] = CachedUserEmbedding(row['embedding'], row['updated_at'])
+    return found
 
 async def delete_from_pinecone(video_id: str) -> bool:
     """
-    Delete video embedding from Pinecone
+    Delete video embedding from the vector store
     Args:
         video_id: ID of the video to delete
     Returns:
         bool: Success status
     """
     try:
-        pc = get_pinecone_client()
-        if not pc:
-            print("Pinecone client not available")
-            return False
-            
-        index = pc.Index("video-embeddings")
-
-        # Delete from Pinecone
-        index.delete(ids=[video_id])
-        return True
+        await get_vector_store().delete([video_id])
     except Exception as e:
-        print(f"Error deleting from Pinecone: {e}")
+        print(f"Error deleting from vector store: {e}")
         return False
-    
\ No newline at end of file
+
+    get_video_embedding_cache().invalidate([video_id])
+    try:
+        db_pool = await get_db()
+        async with db_pool.acquire() as conn:
+            await conn.execute("SELECT pg_notify($1, $2)", VIDEO_EMBEDDINGS_CHANNEL, f"{INSTANCE_ID}:{video_id}")
+    except Exception as e:
+        print(f"Error notifying video embedding removal: {e}")
+    return True
@@ -0,0 +1,58 @@
+# services/periodic_snapshot.py
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar('T')
+
+class PeriodicSnapshot(ABC, Generic[T]):
+    """
+    In-memory value rebuilt on a fixed cadence
+    Subclasses implement load(). A refresh builds a whole new value and swaps
+    the reference, so readers never wait once the first load has completed
+    and never see a partial value.
+    """
+
+    name = "snapshot"  # Named in refresh errors
+
+    def __init__(self, initial: T, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._value = initial
+        self._refreshed_at: Optional[float] = None
+        self._loading: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    async def load(self) -> T:
+        """Build a new value"""
+
+    async def refresh(self) -> None:
+        """Build a new value and swap it in"""
+        self._value = await self.load()
+        self._refreshed_at = time.monotonic()
+
+    async def get(self) -> T:
+        """
+        Get the current value, loading it once if no refresh has completed yet
+        Returns:
+            T: The value, shared between callers and not to be modified
+        """
+        if self._refreshed_at is None:
+            if self._loading is None or self._loading.done():
+                self._loading = asyncio.ensure_future(self.refresh())
+            await asyncio.shield(self._loading)
+        return self._value
+
+    async def run(self) -> None:
+        """Refresh every refresh_seconds until cancelled"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing {self.name}: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    @property
+    def age_seconds(self) -> Optional[float]:
+        """Seconds since the last completed refresh, None before the first"""
+        return None if self._refreshed_at is None else time.monotonic() - self._refreshed_at
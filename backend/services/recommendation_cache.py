@@ -0,0 +1,176 @@
+# services/recommendation_cache.py
+import asyncio
+import base64
+import binascii
+import itertools
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+
+# Candidate list depth and cache bounds
+RECOMMENDATION_CANDIDATE_DEPTH = int(os.getenv('RECOMMENDATION_CANDIDATE_DEPTH', '500'))
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.getenv('RECOMMENDATION_CACHE_TTL_SECONDS', '300'))
+RECOMMENDATION_CACHE_MAX_USERS = int(os.getenv('RECOMMENDATION_CACHE_MAX_USERS', '10000'))
+# Lists kept for cursors after they were replaced, so pagination finishes on the list it started
+RECOMMENDATION_CACHE_MAX_SNAPSHOTS = int(os.getenv('RECOMMENDATION_CACHE_MAX_SNAPSHOTS', '20000'))
+
+class RankedCandidates(NamedTuple):
+    video_ids: Sequence[str]
+    generation: int  # Distinguishes rebuilt lists for the same user, carried in cursors
+    created_at: float
+    truncated: bool = False  # The ranking continues past video_ids
+
+def encode_cursor(offset: int, generation: int = 0) -> str:
+    """
+    Encode a position in a ranked candidate list as an opaque cursor
+    Args:
+        offset: Position of the next page
+        generation: Generation of the list the position is in, 0 for uncached lists
+    """
+    return base64.urlsafe_b64encode(f"g:{generation}:{offset}".encode('ascii')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """
+    Decode a cursor produced by encode_cursor
+    Returns:
+        Tuple[int, int]: Generation and offset
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        fields = base64.urlsafe_b64decode(padded).decode('ascii').split(':')
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if len(fields) == 3 and fields[0] == 'g' and fields[1].isdigit() and fields[2].isdigit():
+        return int(fields[1]), int(fields[2])
+    raise ValueError("Invalid cursor")
+
+class RecommendationCache:
+    """
+    Per-user cache of one deep ranked candidate list
+    Pages are sliced from the cached list. Concurrent misses for the same
+    user share a single build, and invalidate() drops both the cached list
+    and any build still in flight. Every built list is also kept by
+    generation for ttl_seconds, so a cursor keeps paging through the list its
+    first page came from after the user's list was replaced.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = RECOMMENDATION_CACHE_TTL_SECONDS,
+        max_users: int = RECOMMENDATION_CACHE_MAX_USERS,
+        max_snapshots: int = RECOMMENDATION_CACHE_MAX_SNAPSHOTS
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.max_snapshots = max_snapshots
+        self._entries: "OrderedDict[str, RankedCandidates]" = OrderedDict()
+        self._snapshots: "OrderedDict[int, Tuple[str, RankedCandidates]]" = OrderedDict()  # generation -> (user, list)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._generations = itertools.count(1)
+
+    def _get_fresh(self, user_id: str) -> Optional[RankedCandidates]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl_seconds:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def _snapshot(self, user_id: str, video_ids: Sequence[str], depth: int) -> RankedCandidates:
+        entry = RankedCandidates(video_ids[:depth], next(self._generations), time.monotonic(), len(video_ids) > depth)
+        self._snapshots[entry.generation] = (user_id, entry)
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+        return entry
+
+    def _store(self, user_id: str, video_ids: Sequence[str], depth: int) -> RankedCandidates:
+        entry = self._snapshot(user_id, video_ids, depth)
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def get_or_build(
+        self,
+        user_id: str,
+        build: Callable[[], Awaitable[Sequence[str]]],
+        depth: int = RECOMMENDATION_CANDIDATE_DEPTH
+    ) -> RankedCandidates:
+        """
+        Get the user's ranked candidates, building them once on a miss
+        Args:
+            user_id: ID of the user
+            build: Coroutine factory returning the ranked video IDs, ask it for
+                depth + 1 so the list knows whether the ranking continues
+            depth: Video IDs kept, a longer build result marks the list truncated
+        Returns:
+            RankedCandidates: Cached or freshly built candidates
+        """
+        entry = self._get_fresh(user_id)
+        if entry is not None:
+            return entry
+
+        task = self._in_flight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._build(user_id, build, depth))
+            self._in_flight[user_id] = task
+        # Shield so one cancelled request does not cancel the shared build
+        return await asyncio.shield(task)
+
+    async def _build(self, user_id: str, build: Callable[[], Awaitable[Sequence[str]]], depth: int) -> RankedCandidates:
+        task = asyncio.current_task()
+        try:
+            video_ids = await build()
+        finally:
+            if self._in_flight.get(user_id) is task:
+                del self._in_flight[user_id]
+                invalidated = False
+            else:
+                invalidated = True
+        if invalidated:
+            # The embedding changed mid-build, serve the result without caching it
+            return self._snapshot(user_id, video_ids, depth)
+        return self._store(user_id, video_ids, depth)
+
+    def get_generation(self, user_id: str, generation: int) -> Optional[RankedCandidates]:
+        """
+        Get the list a cursor was issued from, even if it has since been replaced
+        Args:
+            user_id: ID of the user
+            generation: Generation from the cursor
+        Returns:
+            Optional[RankedCandidates]: The list, or None once it expired or was evicted
+        """
+        snapshot = self._snapshots.get(generation)
+        if snapshot is None or snapshot[0] != user_id:
+            return None
+        if time.monotonic() - snapshot[1].created_at > self.ttl_seconds:
+            del self._snapshots[generation]
+            return None
+        return snapshot[1]
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop the user's cached candidates and detach any in-flight build"""
+        self._entries.pop(user_id, None)
+        self._in_flight.pop(user_id, None)
+
+    def clear(self) -> None:
+        """Drop every cached list and detach in-flight builds, open cursors keep their lists"""
+        self._entries.clear()
+        self._in_flight.clear()
+
+# Singleton instance
+_recommendation_cache: RecommendationCache | None = None
+
+def get_recommendation_cache() -> RecommendationCache:
+    """Get or create the recommendation cache singleton"""
+    global _recommendation_cache
+    if _recommendation_cache is None:
+        _recommendation_cache = RecommendationCache()
+    return _recommendation_cache
@@ -0,0 +1,81 @@
+# services/reranker.py
+import os
+import time
+from typing import List, NamedTuple, Optional, Sequence
+import numpy as np
+from services.video_attributes import VideoAttributes
+
+# Weights of the reranking score terms, similarity and the first two are each in [0, 1]
+RERANK_SIMILARITY_WEIGHT = float(os.getenv('RERANK_SIMILARITY_WEIGHT', '1.0'))
+RERANK_TRENDING_WEIGHT = float(os.getenv('RERANK_TRENDING_WEIGHT', '0.1'))  # Trending score relative to the candidates'
+RERANK_FRESHNESS_WEIGHT = float(os.getenv('RERANK_FRESHNESS_WEIGHT', '0.1'))
+RERANK_FRESHNESS_HALF_LIFE_DAYS = float(os.getenv('RERANK_FRESHNESS_HALF_LIFE_DAYS', '7'))
+RERANK_CREATOR_PENALTY = float(os.getenv('RERANK_CREATOR_PENALTY', '0.05'))  # Per earlier candidate from the same creator
+
+class RerankWeights(NamedTuple):
+    similarity: float = RERANK_SIMILARITY_WEIGHT
+    trending: float = RERANK_TRENDING_WEIGHT
+    freshness: float = RERANK_FRESHNESS_WEIGHT
+    freshness_half_life_days: float = RERANK_FRESHNESS_HALF_LIFE_DAYS
+    creator_penalty: float = RERANK_CREATOR_PENALTY
+
+def rerank(
+    video_ids: Sequence[str],
+    similarities: np.ndarray,
+    attributes: VideoAttributes,
+    weights: RerankWeights = RerankWeights(),
+    now: Optional[float] = None
+) -> List[str]:
+    """
+    Reorder nearest-neighbour candidates by similarity, trending score, freshness and creator diversity
+    Each candidate scores a weighted sum of its similarity, its log trending
+    score over the candidates' highest and a freshness that halves every half
+    life. A creator's candidates then lose creator_penalty per better-scored
+    candidate of the same creator, so one creator cannot fill a page. Videos
+    missing from attributes count as brand new, untrended and from a creator
+    of their own.
+    Args:
+        video_ids: Candidate video IDs
+        similarities: Cosine similarity of each candidate to the user
+        attributes: Columns to read the candidates' attributes from
+        weights: Score weights
+        now: Epoch seconds freshness is measured at, defaults to the current time
+    Returns:
+        List[str]: The candidates, best first
+    """
+    n = len(video_ids)
+    if n == 0:
+        return []
+    now = time.time() if now is None else now
+    rows = attributes.lookup(video_ids)
+    known = rows >= 0
+    trending = np.zeros(n, dtype=np.float32)
+    created_at = np.full(n, now, dtype=np.float64)
+    creator = -1 - np.arange(n, dtype=np.int64)
+    if known.any():
+        known_rows = rows[known]
+        trending[known] = attributes.trending_score[known_rows]
+        created_at[known] = attributes.created_at[known_rows]
+        creator[known] = attributes.creator[known_rows]
+
+    trending = np.log1p(np.maximum(trending, 0))
+    trending /= max(float(trending.max()), 1e-6)
+    age_days = np.maximum(now - created_at, 0) / 86400
+    freshness = np.exp2(-age_days / weights.freshness_half_life_days)
+    score = (
+        weights.similarity * np.asarray(similarities, dtype=np.float64)
+        + weights.trending * trending
+        + weights.freshness * freshness
+    )
+
+    if weights.creator_penalty:
+        # Position of each candidate among its creator's, best first
+        order = np.lexsort((-score, creator))
+        grouped = creator[order]
+        positions = np.arange(n)
+        starts = np.maximum.accumulate(np.where(np.r_[True, grouped[1:] != grouped[:-1]], positions, 0))
+        rank_in_creator = np.empty(n, dtype=np.float64)
+        rank_in_creator[order] = positions - starts
+        score -= weights.creator_penalty * rank_in_creator
+
+    return [video_ids[i] for i in np.argsort(-score, kind='stable').tolist()]
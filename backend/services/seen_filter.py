@@ -0,0 +1,189 @@
+# services/seen_filter.py
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+from db.connection import get_replica_db
+
+def bloom_shape(capacity: int, false_positive_rate: float) -> Tuple[int, int]:
+    """
+    Smallest Bloom filter holding capacity items at the given false positive rate
+    Args:
+        capacity: Items the filter is sized for
+        false_positive_rate: Rate wanted once capacity items are in
+    Returns:
+        Tuple[int, int]: Bits, rounded up to whole bytes, and hash count
+    """
+    bits = math.ceil(-max(capacity, 1) * math.log(false_positive_rate) / math.log(2) ** 2)
+    bits = (bits + 7) // 8 * 8
+    return bits, max(1, round(bits / max(capacity, 1) * math.log(2)))
+
+# Cache bounds and rebuild policy
+SEEN_FILTER_MAX_BYTES = int(os.getenv('SEEN_FILTER_MAX_BYTES', str(64 * 1024 * 1024)))
+SEEN_FILTER_TTL_SECONDS = float(os.getenv('SEEN_FILTER_TTL_SECONDS', '600'))  # Rebuild to pick up other replicas' ingests
+SEEN_FILTER_HISTORY = int(os.getenv('SEEN_FILTER_HISTORY', '5000'))  # Most recent videos loaded from analytics
+SEEN_FILTER_OVERFETCH = float(os.getenv('SEEN_FILTER_OVERFETCH', '2.0'))  # Candidates ranked per candidate served
+# Bloom filter shape, sized for a full history at this false positive rate. Videos
+# marked seen between rebuilds push a filter past it until the next rebuild
+SEEN_FILTER_FALSE_POSITIVE_RATE = float(os.getenv('SEEN_FILTER_FALSE_POSITIVE_RATE', '0.01'))
+_BITS, _HASHES = bloom_shape(SEEN_FILTER_HISTORY, SEEN_FILTER_FALSE_POSITIVE_RATE)  # 47928 bits, 7 hashes for 5000 at 1%
+SEEN_FILTER_BITS = int(os.getenv('SEEN_FILTER_BITS', str(_BITS)))  # ~6 KiB per user at the defaults
+SEEN_FILTER_HASHES = int(os.getenv('SEEN_FILTER_HASHES', str(_HASHES)))
+
+def _positions(video_ids: Sequence[str], bits: int, hashes: int) -> np.ndarray:
+    """(n, hashes) bit positions by double hashing one 128-bit blake2b digest per id"""
+    digests = b''.join(hashlib.blake2b(video_id.encode('utf-8'), digest_size=16).digest() for video_id in video_ids)
+    halves = np.frombuffer(digests, dtype='<u8').reshape(-1, 2)
+    steps = np.arange(hashes, dtype=np.uint64)
+    # uint64 wraps on overflow, which keeps the positions well mixed
+    return (halves[:, :1] + steps * halves[:, 1:]) % np.uint64(bits)
+
+class SeenFilter:
+    """
+    Fixed-size Bloom filter of the videos a user has seen
+    Never reports a seen video as unseen. Unseen videos are reported as seen
+    with a small probability that grows with history, the memory stays the same.
+    """
+
+    def __init__(self, bits: int = SEEN_FILTER_BITS, hashes: int = SEEN_FILTER_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = np.zeros((bits + 7) // 8, dtype=np.uint8)
+        self.built_at = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return self._array.nbytes
+
+    def add(self, video_ids: Sequence[str]) -> None:
+        """Mark videos as seen"""
+        if not video_ids:
+            return
+        positions = _positions(video_ids, self.bits, self.hashes).ravel()
+        np.bitwise_or.at(self._array, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def contains(self, video_ids: Sequence[str]) -> np.ndarray:
+        """Boolean mask of the videos that were probably seen"""
+        if not video_ids:
+            return np.zeros(0, dtype=bool)
+        positions = _positions(video_ids, self.bits, self.hashes)
+        set_bits = (self._array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return set_bits.all(axis=1)
+
+    def unseen(self, video_ids: Sequence[str]) -> List[str]:
+        """Videos not in the filter, in their original order"""
+        seen = self.contains(video_ids)
+        return [video_id for video_id, was_seen in zip(video_ids, seen.tolist()) if not was_seen]
+
+class SeenFilterCache:
+    """
+    Byte-bounded LRU of per-user seen filters
+    A filter is built from the user's most recent analytics rows on first use
+    and after SEEN_FILTER_TTL_SECONDS, and kept current in between by
+    mark_seen() from the interaction ingest and consumer paths.
+    """
+
+    # Rough per-entry overhead of the dict slot, object and array header
+    ENTRY_OVERHEAD_BYTES = 256
+
+    def __init__(self, max_bytes: int = SEEN_FILTER_MAX_BYTES, ttl_seconds: float = SEEN_FILTER_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, SeenFilter]" = OrderedDict()
+        self._bytes = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def _entry_bytes(self, seen: SeenFilter) -> int:
+        return seen.nbytes + self.ENTRY_OVERHEAD_BYTES
+
+    async def get(self, user_id: str) -> SeenFilter:
+        """
+        Get the user's seen filter, building it from analytics when missing or stale
+        Args:
+            user_id: ID of the user
+        Returns:
+            SeenFilter: The user's filter
+        """
+        seen = self._entries.get(user_id)
+        if seen is not None and time.monotonic() - seen.built_at <= self.ttl_seconds:
+            self._entries.move_to_end(user_id)
+            return seen
+
+        seen = SeenFilter()
+        db_pool = await get_replica_db()
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT video_id
+                FROM analytics
+                WHERE user_id = $1
+                GROUP BY video_id
+                ORDER BY max(timestamp) DESC
+                LIMIT $2
+                """,
+                user_id,
+                SEEN_FILTER_HISTORY
+            )
+        seen.add([row['video_id'] for row in rows])
+        self.builds += 1
+        self._put(user_id, seen)
+        return seen
+
+    def _put(self, user_id: str, seen: SeenFilter) -> None:
+        self.invalidate(user_id)
+        self._entries[user_id] = seen
+        self._bytes += self._entry_bytes(seen)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._entry_bytes(evicted)
+            self.evictions += 1
+
+    def mark_seen(self, user_id: str, video_ids: Sequence[str]) -> None:
+        """Add videos to the user's filter if it is loaded, an unloaded one is built from analytics later"""
+        seen = self._entries.get(user_id)
+        if seen is not None:
+            seen.add(video_ids)
+
+    def mark_interactions(self, interactions: Sequence[Any]) -> None:
+        """mark_seen for a batch of objects with userId and videoId, e.g. VideoInteraction"""
+        video_ids_by_user: Dict[str, List[str]] = {}
+        for interaction in interactions:
+            if interaction.userId in self._entries:
+                video_ids_by_user.setdefault(interaction.userId, []).append(interaction.videoId)
+        for user_id, video_ids in video_ids_by_user.items():
+            self._entries[user_id].add(video_ids)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's filter so the next read rebuilds it"""
+        seen = self._entries.pop(user_id, None)
+        if seen is not None:
+            self._bytes -= self._entry_bytes(seen)
+
+    def clear(self) -> None:
+        """Drop every filter"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the cache"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "maxBytes": self.max_bytes,
+            "builds": self.builds,
+            "evictions": self.evictions,
+        }
+
+# Singleton instance
+_seen_filter_cache: SeenFilterCache | None = None
+
+def get_seen_filter_cache() -> SeenFilterCache:
+    """Get or create the seen filter cache singleton"""
+    global _seen_filter_cache
+    if _seen_filter_cache is None:
+        _seen_filter_cache = SeenFilterCache()
+    return _seen_filter_cache
@@ -0,0 +1,118 @@
+# services/user_embedding_cache.py
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
+import numpy as np
+from services.invalidation_log import InvalidationLog
+
+# Memory cap for cached user embeddings
+USER_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv('USER_EMBEDDING_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+class CachedUserEmbedding(NamedTuple):
+    embedding: np.ndarray  # float32, undecayed as stored
+    updated_at: datetime
+
+class UserEmbeddingCache:
+    """
+    Bounded LRU cache of user embeddings as stored in user_embeddings
+    Filled on read and written through by the interaction window flush, so hot users
+    never go back to the database for their own vector. Reads fill through
+    fill() with a token taken before the query, so a row read before a
+    concurrent invalidation cannot overwrite it.
+    """
+
+    # Rough per-entry overhead of the dict slot, tuple and array header
+    ENTRY_OVERHEAD_BYTES = 256
+
+    def __init__(self, max_bytes: int = USER_EMBEDDING_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedUserEmbedding]" = OrderedDict()
+        self._bytes = 0
+        self._invalidations = InvalidationLog()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entry_bytes(self, entry: CachedUserEmbedding) -> int:
+        return entry.embedding.nbytes + self.ENTRY_OVERHEAD_BYTES
+
+    def get(self, user_id: str) -> Optional[CachedUserEmbedding]:
+        """Look up a user's embedding, counting the hit or miss"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry
+
+    def put(self, user_id: str, embedding: np.ndarray, updated_at: datetime) -> None:
+        """Insert or replace a user's embedding, evicting least recently used users"""
+        self.invalidate(user_id)
+        entry = CachedUserEmbedding(np.asarray(embedding, dtype=np.float32), updated_at)
+        entry_bytes = self._entry_bytes(entry)
+        if entry_bytes > self.max_bytes:
+            return
+        self._entries[user_id] = entry
+        self._bytes += entry_bytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._entry_bytes(evicted)
+            self.evictions += 1
+
+    def fill_token(self) -> int:
+        """Token for fill(), taken before reading rows from the database"""
+        return self._invalidations.token()
+
+    def fill(self, user_id: str, embedding: np.ndarray, updated_at: datetime, token: int) -> bool:
+        """
+        Cache a row read from the database unless the user changed since the token was taken
+        Args:
+            user_id: ID of the user
+            embedding: Embedding as read
+            updated_at: Update time as read
+            token: fill_token() from before the read
+        Returns:
+            bool: Whether the row was cached
+        """
+        if self._invalidations.changed_since(user_id, token):
+            return False
+        self.put(user_id, embedding, updated_at)
+        return True
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's embedding, and keep fills that started earlier from restoring it"""
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= self._entry_bytes(entry)
+        self._invalidations.record(user_id)
+
+    def clear(self) -> None:
+        """Drop every embedding, and keep fills that started earlier from restoring them"""
+        self._entries.clear()
+        self._bytes = 0
+        self._invalidations.record_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+# Singleton instance
+_user_embedding_cache: UserEmbeddingCache | None = None
+
+def get_user_embedding_cache() -> UserEmbeddingCache:
+    """Get or create the user embedding cache singleton"""
+    global _user_embedding_cache
+    if _user_embedding_cache is None:
+        _user_embedding_cache = UserEmbeddingCache()
+    return _user_embedding_cache
@@ -0,0 +1,186 @@
+# services/user_sync.py
+"""
+Bulk import of users from an identity provider export
+
+    cd backend && PYTHONPATH=. python -m services.user_sync users.json
+
+Accepts a JSON array or JSON lines of Clerk user objects (the shape the
+webhooks deliver) or flat {id, username, email} records, or a CSV with id,
+username and email (or primary_email_address) columns. Users are staged with
+COPY and merged into the users table in one statement per batch, so a missed
+webhook or a migrated tenant is repaired by re-running the export. Users
+missing from the export are left alone.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import asyncpg
+from db.connection import get_admin_db, init_postgres
+from schemas.user import UserCreate
+
+USER_SYNC_BATCH_SIZE = int(os.getenv('USER_SYNC_BATCH_SIZE', '50000'))  # Users per COPY and merge
+# Webhook deliveries remembered to skip redeliveries, svix retries for up to a few days
+WEBHOOK_DELIVERY_CACHE_SIZE = int(os.getenv('WEBHOOK_DELIVERY_CACHE_SIZE', '10000'))
+WEBHOOK_DELIVERY_CACHE_TTL_SECONDS = float(os.getenv('WEBHOOK_DELIVERY_CACHE_TTL_SECONDS', str(24 * 3600)))
+
+STAGING_TABLE = "users_sync"
+
+def user_from_record(data: Dict[str, Any]) -> Optional[UserCreate]:
+    """
+    Build a user from a Clerk user object or a flat export record
+    The username falls back to the local part of the primary email, as on signup.
+    Args:
+        data: Clerk user object, or a record with id, username and email
+    Returns:
+        Optional[UserCreate]: The user, or None if it has no id or no primary email
+    """
+    user_id = data.get("id")
+    email = data.get("email") or data.get("primary_email_address")
+    if not email:
+        primary_email_id = data.get("primary_email_address_id")
+        email = next(
+            (address["email_address"] for address in data.get("email_addresses") or [] if address.get("id") == primary_email_id),
+            None
+        )
+    if not user_id or not email:
+        return None
+    return UserCreate(id=user_id, username=data.get("username") or email.split("@")[0], email=email)
+
+def read_export(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield the records of a CSV, JSON array or JSON lines export"""
+    with open(path, newline='') as f:
+        if path.suffix.lower() == '.csv':
+            yield from csv.DictReader(f)
+            return
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+async def sync_users(conn: asyncpg.Connection, users: Iterable[UserCreate]) -> Dict[str, int]:
+    """
+    Upsert users with COPY into a staging table and one merge statement
+    Rows whose username and email are unchanged are not rewritten.
+    Args:
+        conn: Connection to run on
+        users: Users to insert or update, the last one wins for a repeated id
+    Returns:
+        Dict[str, int]: Counts of inserted and updated users
+    """
+    latest = {user.id: user for user in users}
+    if not latest:
+        return {"inserted": 0, "updated": 0}
+    async with conn.transaction():
+        await conn.execute(
+            f"CREATE TEMP TABLE {STAGING_TABLE} (id text NOT NULL, username text NOT NULL, email text NOT NULL) ON COMMIT DROP"
+        )
+        await conn.copy_records_to_table(
+            STAGING_TABLE,
+            records=[(user.id, user.username, user.email) for user in latest.values()],
+            columns=('id', 'username', 'email')
+        )
+        row = await conn.fetchrow(
+            f"""
+            WITH merged AS (
+                INSERT INTO users (id, username, email)
+                SELECT id, username, email
+                FROM {STAGING_TABLE}
+                ON CONFLICT (id) DO UPDATE
+                SET username = EXCLUDED.username, email = EXCLUDED.email, updated_at = NOW()
+                WHERE (users.username, users.email) IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.email)
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT count(*) FILTER (WHERE inserted) AS inserted, count(*) FILTER (WHERE NOT inserted) AS updated
+            FROM merged
+            """
+        )
+    return {"inserted": row['inserted'], "updated": row['updated']}
+
+async def sync_records(records: Iterable[Dict[str, Any]], batch_size: int = USER_SYNC_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Sync export records in batches on the admin pool
+    Args:
+        records: Clerk user objects or flat export records
+        batch_size: Users per COPY and merge
+    Returns:
+        Dict[str, int]: Counts of inserted, updated and skipped records
+    """
+    totals = {"inserted": 0, "updated": 0, "skipped": 0}
+    db_pool = await get_admin_db()
+    async with db_pool.acquire() as conn:
+        batch: List[UserCreate] = []
+        for record in records:
+            user = user_from_record(record)
+            if user is None:
+                totals["skipped"] += 1
+                continue
+            batch.append(user)
+            if len(batch) >= batch_size:
+                for key, count in (await sync_users(conn, batch)).items():
+                    totals[key] += count
+                batch = []
+        if batch:
+            for key, count in (await sync_users(conn, batch)).items():
+                totals[key] += count
+    return totals
+
+class WebhookDeliveryCache:
+    """
+    Recently handled webhook delivery ids, so a redelivered event is skipped
+    Ids are kept per process, the handlers are idempotent for duplicates that
+    reach another replica or arrive after the ttl.
+    """
+
+    def __init__(self, max_size: int = WEBHOOK_DELIVERY_CACHE_SIZE, ttl_seconds: float = WEBHOOK_DELIVERY_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._handled: "OrderedDict[str, float]" = OrderedDict()
+
+    def seen(self, delivery_id: str) -> bool:
+        """Whether this delivery was already handled within the ttl"""
+        handled_at = self._handled.get(delivery_id)
+        return handled_at is not None and time.monotonic() - handled_at <= self.ttl_seconds
+
+    def mark(self, delivery_id: str) -> None:
+        """Record a delivery once it has been handled"""
+        self._handled[delivery_id] = time.monotonic()
+        self._handled.move_to_end(delivery_id)
+        while len(self._handled) > self.max_size:
+            self._handled.popitem(last=False)
+
+# Singleton instance
+_webhook_delivery_cache: WebhookDeliveryCache | None = None
+
+def get_webhook_delivery_cache() -> WebhookDeliveryCache:
+    """Get or create the webhook delivery cache singleton"""
+    global _webhook_delivery_cache
+    if _webhook_delivery_cache is None:
+        _webhook_delivery_cache = WebhookDeliveryCache()
+    return _webhook_delivery_cache
+
+async def run(path: Path, batch_size: int) -> None:
+    await init_postgres(("admin",))
+    totals = await sync_records(read_export(path), batch_size)
+    print(f"Synced users from {path}: {totals['inserted']:,} inserted, {totals['updated']:,} updated, {totals['skipped']:,} skipped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert or update users from an identity provider export")
+    parser.add_argument("export", type=Path, help="CSV, JSON array or JSON lines export")
+    parser.add_argument("--batch-size", type=int, default=USER_SYNC_BATCH_SIZE, help="Users per COPY and merge")
+    args = parser.parse_args()
+    asyncio.run(run(args.export, args.batch_size))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# services/video_attributes.py
+import os
+from typing import Any, Dict, NamedTuple, Sequence
+import numpy as np
+from db.connection import get_replica_db
+from services.periodic_snapshot import PeriodicSnapshot
+
+VIDEO_ATTRIBUTES_REFRESH_SECONDS = float(os.getenv('VIDEO_ATTRIBUTES_REFRESH_SECONDS', '300'))  # Full reload cadence
+
+class VideoAttributes(NamedTuple):
+    """One column per attribute, row i of each describes the same video"""
+    rows: Dict[str, int]  # video id -> row
+    trending_score: np.ndarray  # float32
+    created_at: np.ndarray  # float64 epoch seconds
+    creator: np.ndarray  # int32 code per distinct user_id
+
+    def lookup(self, video_ids: Sequence[str]) -> np.ndarray:
+        """Rows of the given videos, -1 for videos loaded after the last refresh"""
+        rows = self.rows
+        return np.fromiter((rows.get(video_id, -1) for video_id in video_ids), dtype=np.intp, count=len(video_ids))
+
+EMPTY_ATTRIBUTES = VideoAttributes({}, np.zeros(0, np.float32), np.zeros(0, np.float64), np.zeros(0, np.int32))
+
+class VideoAttributeCache(PeriodicSnapshot[VideoAttributes]):
+    """
+    Columnar copy of the ranking attributes of every ready video
+    Reranking reads these for a thousand candidates per request, so they are
+    held as NumPy columns instead of being fetched or carried in the vector
+    store metadata.
+    """
+
+    name = "video attributes"
+
+    def __init__(self, refresh_seconds: float = VIDEO_ATTRIBUTES_REFRESH_SECONDS):
+        super().__init__(EMPTY_ATTRIBUTES, refresh_seconds)
+
+    async def load(self) -> VideoAttributes:
+        """Read the columns from the videos table"""
+        db_pool = await get_replica_db()
+        async with db_pool.acquire() as conn:
+            records = await conn.fetch(
+                """
+                SELECT id::text AS id, user_id, trending_score, extract(epoch FROM created_at)::float8 AS created_at
+                FROM videos
+                WHERE status = 'ready'
+                """
+            )
+        n = len(records)
+        creators: Dict[str, int] = {}
+        return VideoAttributes(
+            rows={record['id']: row for row, record in enumerate(records)},
+            trending_score=np.fromiter((record['trending_score'] or 0.0 for record in records), dtype=np.float32, count=n),
+            created_at=np.fromiter((record['created_at'] for record in records), dtype=np.float64, count=n),
+            creator=np.fromiter(
+                (creators.setdefault(record['user_id'], len(creators)) for record in records), dtype=np.int32, count=n
+            ),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and age of the loaded columns"""
+        attributes = self._value
+        return {
+            "videos": len(attributes.rows),
+            "bytes": attributes.trending_score.nbytes + attributes.created_at.nbytes + attributes.creator.nbytes,
+            "ageSeconds": self.age_seconds,
+        }
+
+# Singleton instance
+_video_attribute_cache: VideoAttributeCache | None = None
+
+def get_video_attribute_cache() -> VideoAttributeCache:
+    """Get or create the video attribute cache singleton"""
+    global _video_attribute_cache
+    if _video_attribute_cache is None:
+        _video_attribute_cache = VideoAttributeCache()
+    return _video_attribute_cache
@@ -0,0 +1,200 @@
+# services/video_embedding_cache.py
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from services.embedding_compression import EMBEDDING_QUANTIZATION, Quantizer
+from services.embedding_engine import EMBEDDING_DIMENSION
+from services.invalidation_log import InvalidationLog
+from services.metrics import VIDEO_EMBEDDING_CACHE_LOOKUPS
+
+# Cache capacity in videos, the matrix takes capacity x 6 KiB at 1536 float32 dimensions, half that as float16
+VIDEO_EMBEDDING_CACHE_ROWS = int(os.getenv('VIDEO_EMBEDDING_CACHE_ROWS', '20000'))
+VIDEO_EMBEDDING_CACHE_AGING_LOOKUPS = int(os.getenv('VIDEO_EMBEDDING_CACHE_AGING_LOOKUPS', '100000'))  # Halve hit counts after this many lookups
+
+class VideoEmbeddingCache:
+    """
+    Fixed-capacity cache of video embeddings in one contiguous matrix
+    Rows are stored in the EMBEDDING_QUANTIZATION encoding at full dimension,
+    lookups decode them back to float32. An id -> row map locates each video. Every lookup bumps the row's hit
+    count and a full cache replaces the rows with the lowest counts, so videos
+    seen once make way before popular ones. Counts are halved every
+    aging_lookups lookups so videos that stop trending age out. Reads fill
+    through fill_many() with a token taken before the query, so an embedding
+    read before a concurrent invalidation cannot overwrite it.
+    """
+
+    def __init__(
+        self,
+        capacity: int = VIDEO_EMBEDDING_CACHE_ROWS,
+        dimension: int = EMBEDDING_DIMENSION,
+        aging_lookups: int = VIDEO_EMBEDDING_CACHE_AGING_LOOKUPS,
+        quantization: str = EMBEDDING_QUANTIZATION
+    ):
+        self.capacity = capacity
+        self.aging_lookups = aging_lookups
+        self._quantizer = Quantizer(quantization)
+        # Zeroed pages are only committed once a row is written
+        self._matrix = np.zeros((capacity, dimension), dtype=self._quantizer.dtype)
+        self._scales = np.zeros(capacity, dtype=np.float32) if self._quantizer.scaled else None
+        self._counts = np.zeros(capacity, dtype=np.uint32)
+        self._rows: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._free: List[int] = []  # Invalidated rows
+        self._used = 0  # Rows handed out at least once
+        self._lookups = 0
+        self._invalidations = InvalidationLog()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, video_ids: Sequence[str]) -> Tuple[List[str], np.ndarray, List[str]]:
+        """
+        Look up videos, counting a hit for each cached one
+        Args:
+            video_ids: Distinct video IDs
+        Returns:
+            Tuple[List[str], np.ndarray, List[str]]: Cached IDs, a (k, d) copy
+                of their embeddings that later writes cannot change, and the
+                IDs that are not cached
+        """
+        found: List[str] = []
+        rows: List[int] = []
+        missing: List[str] = []
+        for video_id in video_ids:
+            row = self._rows.get(video_id)
+            if row is None:
+                missing.append(video_id)
+            else:
+                found.append(video_id)
+                rows.append(row)
+
+        row_array = np.array(rows, dtype=np.intp)
+        self._counts[row_array] += 1
+        self.hits += len(found)
+        self.misses += len(missing)
+        VIDEO_EMBEDDING_CACHE_LOOKUPS.inc(len(found), result="hit")
+        VIDEO_EMBEDDING_CACHE_LOOKUPS.inc(len(missing), result="miss")
+        self._lookups += len(video_ids)
+        if self._lookups >= self.aging_lookups:
+            self._counts >>= 1
+            self._lookups = 0
+        scales = self._scales[row_array] if self._scales is not None else None
+        return found, self._quantizer.decode(self._matrix[row_array], scales), missing
+
+    def put_many(self, video_ids: Sequence[str], embeddings: np.ndarray) -> None:
+        """
+        Cache embeddings, replacing the least frequently used rows when full
+        Args:
+            video_ids: Distinct video IDs
+            embeddings: (n, d) embeddings in the same order
+        """
+        codes, scales = self._quantizer.encode(embeddings)
+        new = []
+        for i, video_id in enumerate(video_ids):
+            row = self._rows.get(video_id)
+            if row is None:
+                new.append(i)
+            else:
+                self._store(row, codes, scales, i)
+        # A batch larger than the cache keeps only what fits
+        new = new[:self.capacity]
+        if not new:
+            return
+
+        rows = self._allocate(len(new))
+        self._store(rows, codes, scales, new)
+        self._counts[rows] = 1
+        for i, row in zip(new, rows.tolist()):
+            self._rows[video_ids[i]] = row
+            self._ids[row] = video_ids[i]
+
+    def fill_token(self) -> int:
+        """Token for fill_many(), taken before reading embeddings from the database"""
+        return self._invalidations.token()
+
+    def fill_many(self, video_ids: Sequence[str], embeddings: np.ndarray, token: int) -> List[str]:
+        """
+        Cache embeddings read from the database, except those of videos changed since the token was taken
+        Args:
+            video_ids: Distinct video IDs
+            embeddings: (n, d) embeddings in the same order
+            token: fill_token() from before the read
+        Returns:
+            List[str]: IDs that were cached
+        """
+        keep = [i for i, video_id in enumerate(video_ids) if not self._invalidations.changed_since(video_id, token)]
+        kept_ids = [video_ids[i] for i in keep]
+        if kept_ids:
+            self.put_many(kept_ids, embeddings[keep])
+        return kept_ids
+
+    def _store(self, rows, codes: np.ndarray, scales: Optional[np.ndarray], index) -> None:
+        self._matrix[rows] = codes[index]
+        if scales is not None:
+            self._scales[rows] = scales[index]
+
+    def _allocate(self, n: int) -> np.ndarray:
+        """Free rows first, then never used ones, then the n - those least used"""
+        rows = self._free[-n:]
+        del self._free[len(self._free) - len(rows):]
+        fresh = min(n - len(rows), self.capacity - self._used)
+        rows.extend(range(self._used, self._used + fresh))
+        self._used += fresh
+
+        evict = n - len(rows)
+        if evict:
+            # Every row is occupied here, the rows just taken are not assigned yet
+            candidates = np.ones(self.capacity, dtype=bool)
+            candidates[rows] = False
+            occupied = np.flatnonzero(candidates)
+            victims = occupied[np.argpartition(self._counts[occupied], evict - 1)[:evict]]
+            for row in victims.tolist():
+                del self._rows[self._ids[row]]
+                self._ids[row] = None
+            self.evictions += evict
+            rows.extend(victims.tolist())
+        return np.array(rows, dtype=np.intp)
+
+    def invalidate(self, video_ids: Sequence[str]) -> None:
+        """Drop videos whose embedding changed or that were removed, and keep fills that started earlier from restoring them"""
+        for video_id in video_ids:
+            self._invalidations.record(video_id)
+            row = self._rows.pop(video_id, None)
+            if row is not None:
+                self._ids[row] = None
+                self._counts[row] = 0
+                self._free.append(row)
+
+    def clear(self) -> None:
+        """Drop every video, and keep fills that started earlier from restoring them"""
+        self._invalidations.record_all()
+        self._rows.clear()
+        self._ids = [None] * self.capacity
+        self._counts[:] = 0
+        self._free = []
+        self._used = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the cache"""
+        return {
+            "entries": len(self._rows),
+            "capacity": self.capacity,
+            "bytes": self._matrix.nbytes + (self._scales.nbytes if self._scales is not None else 0),
+            "quantization": self._quantizer.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+# Singleton instance
+_video_embedding_cache: VideoEmbeddingCache | None = None
+
+def get_video_embedding_cache() -> VideoEmbeddingCache:
+    """Get or create the video embedding cache singleton"""
+    global _video_embedding_cache
+    if _video_embedding_cache is None:
+        _video_embedding_cache = VideoEmbeddingCache()
+    return _video_embedding_cache
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+
+# Modules read their configuration at import, no service is contacted
+os.environ.setdefault('DATABASE_URL', 'postgresql://test@localhost/test')
+os.environ.setdefault('LOG_SAMPLE_RATE', '0')
@@ -0,0 +1,49 @@
+# tests/test_backfill.py
+import numpy as np
+from services import embedding_engine
+from services.backfill import VideoMatrix, load_checkpoint, save_checkpoint, user_embeddings_from_rows
+
+NOW = 1704067200.0
+DIMENSION = 8
+
+def test_video_matrix_grows_without_moving_loaded_rows():
+    videos = VideoMatrix(dimension=DIMENSION, capacity=2)
+    videos.add(["v1", "v2"], [np.full(DIMENSION, 1.0), np.full(DIMENSION, 2.0)])
+    before = videos.matrix
+    videos.add(["v3"], [np.full(DIMENSION, 3.0)])
+    videos.mark_missing(["v4"])
+
+    assert len(videos) == 3
+    # A view handed out earlier still holds its rows
+    assert before[:, 0].tolist() == [1.0, 2.0]
+    assert videos.rows(["v3", "v4", "v1"]).tolist() == [2, -1, 0]
+    assert videos.unknown(["v1", "v4", "v5", "v5"]) == ["v5"]
+
+def test_user_embeddings_match_a_weighted_average_of_history():
+    rng = np.random.default_rng(0)
+    video_matrix = rng.standard_normal((3, DIMENSION)).astype(np.float32)
+    user_ids = ["u2", "u1", "u1", "u1", "u3"]
+    video_rows = np.array([2, 0, 1, 0, -1])
+    scores = np.array([1.0, 1.0, 2.0, 3.0, 1.0])
+    epochs = np.array([NOW, NOW, NOW - 30 * 86400, NOW, NOW])
+
+    users, embeddings = user_embeddings_from_rows(user_ids, video_rows, scores, epochs, video_matrix, NOW)
+    # u3 only interacted with a video without an embedding
+    assert users == ["u1", "u2"]
+    weights = embedding_engine.interaction_weights(scores[1:4], epochs[1:4], NOW)
+    expected = embedding_engine.weighted_average(video_matrix[video_rows[1:4]], weights)
+    np.testing.assert_allclose(embeddings[0], expected, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(embeddings[1], video_matrix[2], rtol=1e-6)
+
+def test_checkpoint_round_trips_and_starts_empty(tmp_path):
+    path = tmp_path / "state" / "backfill_users.json"
+    assert load_checkpoint(path) == {}
+    save_checkpoint(path, {"last_user_id": "u9", "users": 10})
+    assert load_checkpoint(path) == {"last_user_id": "u9", "users": 10}
+    assert not path.with_suffix(".tmp").exists()
+
+def test_history_without_embeddings_gives_no_users():
+    users, embeddings = user_embeddings_from_rows(
+        ["u1", "u2"], np.array([-1, -1]), np.ones(2), np.full(2, NOW), np.zeros((1, DIMENSION), dtype=np.float32), NOW
+    )
+    assert users == [] and embeddings.shape == (0, DIMENSION)
@@ -0,0 +1,36 @@
+# tests/test_benchmark_harness.py
+from benchmarks.harness import Benchmark, BenchmarkResult, load_results, regressions, run_benchmark, save_results
+
+def _result(name, p50_ms, peak_kib):
+    return BenchmarkResult(name, 10, 1000.0, p50_ms, p50_ms, p50_ms, peak_kib)
+
+def test_run_benchmark_times_sync_and_async_calls():
+    calls = []
+
+    async def async_call():
+        calls.append("async")
+
+    for fn in (lambda: calls.append("sync"), async_call):
+        result = run_benchmark(Benchmark("noop", fn, ops_per_call=4), min_time=0, min_iterations=3, memory_iterations=1)
+        assert result.iterations == 3
+        assert result.ops_per_second > 0
+    # Warmup, timed and traced calls
+    assert calls.count("sync") == calls.count("async") == 5
+
+def test_regressions_flag_latency_and_memory_growth_past_the_threshold():
+    baseline = {
+        "steady": _result("steady", 1.0, 100.0)._asdict(),
+        "slower": _result("slower", 1.0, 100.0)._asdict(),
+        "bigger": _result("bigger", 1.0, 100.0)._asdict(),
+    }
+    results = [_result("steady", 1.05, 105.0), _result("slower", 1.5, 100.0), _result("bigger", 1.0, 150.0), _result("new", 9.0, 900.0)]
+    assert regressions(results, baseline, 0.1) == [
+        "slower p50_ms: 1.000 -> 1.500",
+        "bigger peak_kib_per_call: 100.000 -> 150.000",
+    ]
+
+def test_results_round_trip_through_the_baseline_file(tmp_path):
+    path = tmp_path / "baseline.json"
+    assert load_results(path) is None
+    save_results([_result("steady", 1.0, 100.0)], path)
+    assert load_results(path) == {"steady": _result("steady", 1.0, 100.0)._asdict()}
@@ -0,0 +1,29 @@
+# tests/test_cold_start_feed.py
+import asyncio
+from services.cold_start_feed import ColdStartFeed, blend
+
+def test_blend_gives_personalized_videos_their_share_of_positions():
+    personalized = ["p1", "p2", "p3", "p4"]
+    trending = ["t1", "t2", "t3", "t4"]
+    assert blend(personalized, trending, 0.5) == ["t1", "p1", "t2", "p2", "t3", "p3", "t4", "p4"]
+    assert blend(personalized, trending, 1.0) == personalized + trending
+    assert blend(personalized, trending, 0.0) == trending + personalized
+
+def test_blend_skips_duplicates_and_fills_from_the_longer_source():
+    assert blend(["a", "b"], ["b", "c", "d", "e"], 0.5) == ["b", "a", "c", "d", "e"]
+    assert blend([], ["t1"], 0.5) == ["t1"]
+
+def test_feed_is_served_from_memory_after_the_first_load(monkeypatch):
+    loads = []
+
+    async def load(self):
+        loads.append(1)
+        return ("v1", "v2")
+    monkeypatch.setattr(ColdStartFeed, "load", load)
+    feed = ColdStartFeed(refresh_seconds=60)
+
+    async def run():
+        return await feed.get(), await feed.get()
+
+    assert asyncio.run(run()) == (("v1", "v2"), ("v1", "v2"))
+    assert len(loads) == 1
@@ -0,0 +1,68 @@
+# tests/test_connection.py
+import asyncio
+import struct
+import numpy as np
+import pytest
+from db import connection
+
+def test_vector_round_trips_through_the_binary_format():
+    vector = np.array([0.5, -1.25, 3.0], dtype=np.float32)
+    encoded = connection.encode_vector(vector)
+    # Dimension and an unused flag word, then big-endian float32s
+    assert encoded[:4] == struct.pack('>HH', 3, 0)
+    assert encoded[4:] == vector.astype('>f4').tobytes()
+    decoded = connection._decode_vector(encoded)
+    assert decoded.dtype == np.float32
+    assert np.array_equal(decoded, vector)
+
+def test_encode_vector_accepts_lists_and_passes_bytes_through():
+    encoded = connection.encode_vector([1.0, 2.0])
+    assert connection.encode_vector(encoded) is encoded
+    assert np.array_equal(connection._decode_vector(encoded), [1.0, 2.0])
+
+def test_encode_vector_rejects_matrices():
+    with pytest.raises(ValueError):
+        connection.encode_vector(np.zeros((2, 2), dtype=np.float32))
+
+def test_connections_register_the_binary_vector_codec():
+    class Connection:
+        async def set_type_codec(self, name, **kwargs):
+            self.codec = (name, kwargs)
+
+    conn = Connection()
+    asyncio.run(connection._init_connection(conn))
+    name, kwargs = conn.codec
+    assert name == 'vector'
+    assert kwargs['format'] == 'binary'
+    assert kwargs['decoder'] is connection._decode_vector
+
+def test_pool_settings_are_overridable_per_workload(monkeypatch):
+    monkeypatch.setenv("DB_CONSUMER_POOL_MAX_SIZE", "20")
+    monkeypatch.setenv("DB_CONSUMER_POOL_STATEMENT_CACHE_SIZE", "0")
+    config = connection._pool_config("consumer", "postgresql://primary", 1, 5, 300)
+    assert config == connection.PoolConfig("postgresql://primary", 1, 20, 300.0, 0)
+
+def test_init_postgres_creates_each_configured_pool_once(monkeypatch):
+    created = []
+
+    async def create_pool(name, config):
+        created.append(name)
+        return connection.InstrumentedPool(name, object())
+
+    monkeypatch.setattr(connection, "pools", {})
+    monkeypatch.setattr(connection, "_create_pool", create_pool)
+    monkeypatch.setattr(connection, "POOL_CONFIGS", {
+        name: connection._pool_config(name, "postgresql://primary", 0, 1, 0) for name in ("api", "consumer")
+    })
+
+    async def run():
+        await connection.init_postgres(("api", "replica"))
+        await connection.init_postgres(("api", "consumer"))
+        return await connection.get_replica_db(), await connection.get_consumer_db()
+
+    replica, consumer = asyncio.run(run())
+    # Unconfigured pools are skipped and existing ones kept
+    assert created == ["api", "consumer"]
+    # Without a replica, replica reads go to the API pool
+    assert replica.name == "api"
+    assert consumer.name == "consumer"
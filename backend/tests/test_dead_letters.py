@@ -0,0 +1,159 @@
+# tests/test_dead_letters.py
+import asyncio
+import pytest
+from confluent_kafka import KafkaError, KafkaException
+from routes.kafka_client import KafkaClient, Topics, VideoEmbedding, VideoInteraction
+from services import dead_letters, ml_consumer
+
+class FakeConsumer:
+    def subscribe(self, topics, on_revoke=None):
+        pass
+
+class FakeKafkaClient:
+    """Serves the given batches once, then stops the consumer loop"""
+
+    def __init__(self, stop: asyncio.Event, batches: list, dead_letter_delivered: bool):
+        self.stop = stop
+        self.batches = list(batches)
+        self.dead_letter_delivered = dead_letter_delivered
+        self.dead_lettered = []
+        self.topics = []
+        self.commits = 0
+        self.rewinds = 0
+
+    def create_consumer(self, group_id):
+        return FakeConsumer()
+
+    async def _next_batch(self, *args, **kwargs):
+        if self.batches:
+            return self.batches.pop(0)
+        self.stop.set()
+        return []
+
+    consume_video_embeddings = _next_batch
+    consume_interactions = _next_batch
+
+    async def produce_async(self, topic, messages, headers=None):
+        self.topics.append(topic)
+        self.dead_lettered.extend(messages)
+        return self.dead_letter_delivered
+
+    async def commit_async(self, consumer):
+        self.commits += 1
+
+    async def rewind_async(self, consumer):
+        self.rewinds += 1
+
+    async def close_consumer_async(self, consumer):
+        pass
+
+def _install(monkeypatch, batches, dead_letter_delivered):
+    stop = asyncio.Event()
+    client = FakeKafkaClient(stop, batches, dead_letter_delivered)
+    monkeypatch.setattr(ml_consumer, "get_kafka_client", lambda: client)
+    monkeypatch.setattr(dead_letters, "get_kafka_client", lambda: client)
+    monkeypatch.setattr(dead_letters, "backoff_delay", lambda attempt: 0)
+    monkeypatch.setattr(ml_consumer, "RETRY_MAX_DELAY_SECONDS", 0)
+    return stop, client
+
+async def _always_fails(*args):
+    return False
+
+def _video(video_id):
+    return VideoEmbedding.model_construct(id=video_id)
+
+def test_settle_failures_reports_a_failed_dead_letter_produce(monkeypatch):
+    for delivered in (True, False):
+        _, client = _install(monkeypatch, [], delivered)
+        settled = asyncio.run(dead_letters.settle_failures(
+            Topics.VIDEO_EMBEDDINGS, Topics.VIDEO_EMBEDDINGS_DLQ, {"v1": _video("v1")}, _always_fails, lambda key, video: video
+        ))
+        assert settled is delivered
+        assert [video.id for video in client.dead_lettered] == ["v1"]
+
+def test_settle_failures_without_failures_is_settled():
+    assert asyncio.run(dead_letters.settle_failures("t", "t-dlq", {}, _always_fails, lambda key, item: item))
+
+def _failing_video_batch(monkeypatch):
+    async def batch_fails(videos):
+        return {video.id: False for video in videos}
+    monkeypatch.setattr(ml_consumer, "add_batch_to_pinecone", batch_fails)
+    monkeypatch.setattr(ml_consumer, "add_to_pinecone", _always_fails)
+
+def test_video_batch_is_redelivered_when_dead_lettering_fails(monkeypatch):
+    stop, client = _install(monkeypatch, [[_video("v1"), _video("v2")]], dead_letter_delivered=False)
+    _failing_video_batch(monkeypatch)
+    asyncio.run(ml_consumer.process_video_embeddings(stop))
+    assert client.commits == 0
+    assert client.rewinds == 1
+
+def test_video_batch_is_committed_once_dead_lettered(monkeypatch):
+    stop, client = _install(monkeypatch, [[_video("v1"), _video("v2")]], dead_letter_delivered=True)
+    _failing_video_batch(monkeypatch)
+    asyncio.run(ml_consumer.process_video_embeddings(stop))
+    assert client.commits == 1
+    assert client.rewinds == 0
+
+def test_interaction_window_is_not_committed_when_dead_lettering_fails(monkeypatch):
+    interaction = VideoInteraction(
+        userId="u1", videoId="v1", viewDuration=10, liked=True, commented=False, shared=False,
+        timestamp="2024-01-01T00:00:00.000Z", weightedScore=2.0
+    )
+    stop, client = _install(monkeypatch, [[interaction]], dead_letter_delivered=False)
+
+    async def window_fails(weights_by_user):
+        return {user_id: False for user_id in weights_by_user}
+    monkeypatch.setattr(ml_consumer, "flush_interaction_window", window_fails)
+    # The window is drained when the loop stops, before it would fall due
+    asyncio.run(ml_consumer.process_interactions(stop))
+    assert [window.userId for window in client.dead_lettered] == ["u1"]
+    assert client.commits == 0
+
+def _replay(monkeypatch, items, outcomes, max_consecutive_failures=3, parked_delivered=True):
+    """Replay dead-lettered videos, item i succeeding when outcomes[i] is True"""
+    _, client = _install(monkeypatch, [[item] for item in items], parked_delivered)
+    succeeds = {item.id: outcome for item, outcome in zip(items, outcomes)}
+
+    async def attempt(video_id, video):
+        return succeeds[video_id]
+    monkeypatch.setattr(ml_consumer, "retry_video_embedding", attempt)
+    replayed = asyncio.run(ml_consumer.replay_dead_letters(
+        "videos", idle_seconds=0, max_consecutive_failures=max_consecutive_failures
+    ))
+    return replayed, client
+
+def test_replay_parks_an_item_that_still_fails_and_continues(monkeypatch):
+    replayed, client = _replay(monkeypatch, [_video("v1"), _video("v2"), _video("v3")], [True, False, True])
+    assert replayed == 2
+    assert client.topics == [Topics.VIDEO_EMBEDDINGS_PARKED]
+    assert [video.id for video in client.dead_lettered] == ["v2"]
+    assert client.commits == 3
+
+def test_replay_stops_uncommitted_when_items_keep_failing(monkeypatch):
+    replayed, client = _replay(
+        monkeypatch, [_video("v1"), _video("v2"), _video("v3")], [False, False, True], max_consecutive_failures=2
+    )
+    assert replayed == 0
+    # v1 was parked, v2 looks like an outage and stays on the dead-letter topic with v3
+    assert [video.id for video in client.dead_lettered] == ["v1"]
+    assert client.commits == 1
+
+def test_replay_stops_uncommitted_when_parking_fails(monkeypatch):
+    replayed, client = _replay(monkeypatch, [_video("v1"), _video("v2")], [False, True], parked_delivered=False)
+    assert replayed == 0
+    assert client.commits == 0
+
+class CommitConsumer:
+    def __init__(self, error):
+        self.error = error
+
+    def commit(self, asynchronous=True):
+        if self.error is not None:
+            raise KafkaException(KafkaError(self.error))
+
+def test_commit_without_a_new_offset_is_a_no_op():
+    client = KafkaClient()
+    asyncio.run(client.commit_async(CommitConsumer(KafkaError._NO_OFFSET)))
+    with pytest.raises(KafkaException):
+        asyncio.run(client.commit_async(CommitConsumer(KafkaError._PARTITION_EOF)))
+    client.close()
@@ -0,0 +1,60 @@
+# tests/test_embedding_compression.py
+import numpy as np
+import pytest
+from services.embedding_compression import EmbeddingCompressor, PCAProjection, Quantizer, fit_projection
+from services.vector_store import LocalVectorStore
+
+DIMENSION = 16
+
+def _embeddings(rows, rank=4, seed=0):
+    """Rows spanning a rank-dimensional subspace, like correlated embeddings"""
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((rows, rank)) @ rng.standard_normal((rank, DIMENSION))).astype(np.float32)
+
+@pytest.mark.parametrize("mode, tolerance", [("none", 0), ("float16", 1e-3), ("int8", 1e-2)])
+def test_quantized_rows_decode_within_their_precision(mode, tolerance):
+    quantizer = Quantizer(mode)
+    values = _embeddings(8)
+    codes, scales = quantizer.encode(values)
+    assert codes.dtype == quantizer.dtype
+    assert (scales is not None) == quantizer.scaled
+    decoded = quantizer.decode(codes, scales)
+    # Error relative to each row's largest magnitude
+    assert np.all(np.abs(decoded - values) <= tolerance * np.abs(values).max(axis=1, keepdims=True) + 1e-7)
+
+def test_int8_dot_matches_decoded_rows():
+    quantizer = Quantizer("int8")
+    codes, scales = quantizer.encode(_embeddings(8))
+    query = _embeddings(1, seed=1)[0]
+    np.testing.assert_allclose(quantizer.dot(codes, scales, query), quantizer.decode(codes, scales) @ query, rtol=1e-5)
+
+def test_unknown_quantization_is_rejected():
+    with pytest.raises(ValueError):
+        Quantizer("int4")
+
+def test_projection_keeps_dot_products_of_low_rank_embeddings(tmp_path):
+    samples = _embeddings(64)
+    projection = fit_projection(samples, 4)
+    assert projection.dimension == 4
+    assert projection.explained_variance == pytest.approx(1.0, abs=1e-5)
+    projected = projection.project(samples)
+    np.testing.assert_allclose(projected @ projected.T, samples @ samples.T, rtol=1e-3, atol=1e-2)
+
+    path = tmp_path / "pca.npz"
+    projection.save(path)
+    loaded = PCAProjection.load(path)
+    assert loaded.signature == projection.signature
+
+def test_compressor_checks_input_dimension():
+    projection = fit_projection(_embeddings(32), 4)
+    with pytest.raises(ValueError):
+        EmbeddingCompressor(projection=projection, input_dimension=DIMENSION + 1)
+    compressor = EmbeddingCompressor(quantization="float16", projection=projection, input_dimension=DIMENSION)
+    assert compressor.dimension == 4
+    with pytest.raises(ValueError):
+        compressor.project(np.ones(DIMENSION + 1, dtype=np.float32))
+
+def test_local_store_refuses_a_different_layout(tmp_path):
+    LocalVectorStore(tmp_path, dimension=DIMENSION, compressor=EmbeddingCompressor("float16", input_dimension=DIMENSION))
+    with pytest.raises(ValueError, match="Reindex"):
+        LocalVectorStore(tmp_path, dimension=DIMENSION, compressor=EmbeddingCompressor("int8", input_dimension=DIMENSION))
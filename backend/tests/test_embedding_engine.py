@@ -0,0 +1,69 @@
+# tests/test_embedding_engine.py
+import numpy as np
+from services import embedding_engine
+from services.embedding_engine import (
+    days_since,
+    decay_embeddings,
+    decay_factors,
+    grouped_weighted_average,
+    interaction_weights,
+    merge_embeddings,
+    timestamps_to_epoch,
+    weighted_average,
+)
+
+NOW = 1704067200.0  # 2024-01-01T00:00:00Z
+
+def test_timestamps_to_epoch_parses_utc_and_offset_strings():
+    assert timestamps_to_epoch(["2024-01-01T00:00:00.000Z", "2024-01-02T00:00:00Z"]).tolist() == [NOW, NOW + 86400]
+    # Mixed formats take the slow path, naive values count as UTC
+    mixed = timestamps_to_epoch(["2024-01-01T01:00:00+01:00", "2024-01-01T00:00:00"])
+    assert mixed.tolist() == [NOW, NOW]
+
+def test_days_since_floors_like_timedelta_days():
+    epochs = np.array([NOW, NOW - 1, NOW - 86400, NOW - 86400 * 1.5])
+    assert days_since(epochs, NOW).tolist() == [0, 0, 1, 1]
+
+def test_interaction_weights_decay_scores_by_age():
+    weights = interaction_weights(np.array([2.0, 2.0]), np.array([NOW, NOW - 30 * 86400]), NOW)
+    np.testing.assert_allclose(weights, [2.0, 1.0])
+
+def test_weighted_average_of_zero_weights_is_none():
+    embeddings = np.eye(2, dtype=np.float32)
+    assert weighted_average(embeddings, np.zeros(2)) is None
+    np.testing.assert_allclose(weighted_average(embeddings, np.array([3.0, 1.0])), [0.75, 0.25])
+
+def test_grouped_weighted_average_matches_per_group_average():
+    rng = np.random.default_rng(2)
+    embeddings = rng.standard_normal((7, 16)).astype(np.float32)
+    weights = rng.random(7)
+    weights[5] = 0.0
+    # Unsorted groups, and group 2 has no rows with weight
+    groups = np.array([1, 0, 3, 1, 0, 2, 3])
+
+    averages, valid = grouped_weighted_average(embeddings, weights, groups, 5)
+    assert valid.tolist() == [True, True, False, True, False]
+    for group in (0, 1, 3):
+        rows = groups == group
+        np.testing.assert_allclose(averages[group], weighted_average(embeddings[rows], weights[rows]), rtol=1e-5, atol=1e-6)
+    assert not averages[[2, 4]].any()
+
+def test_decay_factors_halve_every_period():
+    days = np.array([0, 30, 60, 4500], dtype=np.float64)
+    np.testing.assert_allclose(decay_factors(days), 0.5 ** (days / embedding_engine.DECAY_PERIOD_DAYS), rtol=1e-12)
+
+def test_decay_embeddings_scales_each_row_by_its_own_age():
+    rng = np.random.default_rng(0)
+    current = rng.standard_normal((4, 64)).astype(np.float32)
+    days = np.array([0, 3, 45, 4500], dtype=np.float64)
+
+    decayed = decay_embeddings(current, days)
+    assert decayed.dtype == np.float32
+    np.testing.assert_array_equal(decayed, current * decay_factors(days).astype(np.float32)[:, None])
+    np.testing.assert_array_equal(decay_embeddings(current[1], 3.0), decayed[1])
+
+def test_merge_embeddings_is_an_exponential_moving_average():
+    rng = np.random.default_rng(1)
+    current = rng.standard_normal((4, 64)).astype(np.float32)
+    delta = rng.standard_normal((4, 64)).astype(np.float32)
+    np.testing.assert_allclose(merge_embeddings(current, delta), 0.7 * current + 0.3 * delta, rtol=1e-6, atol=1e-7)
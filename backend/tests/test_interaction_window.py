@@ -0,0 +1,109 @@
+# tests/test_interaction_window.py
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from routes.kafka_client import VideoInteraction
+from services import interaction_window, ml_consumer
+from services.interaction_window import InteractionWindow
+
+NOW = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def _interaction(user_id, video_id, score=1.0, timestamp=NOW):
+    return VideoInteraction(
+        userId=user_id, videoId=video_id, viewDuration=10, liked=False, commented=False, shared=False,
+        timestamp=timestamp, weightedScore=score
+    )
+
+def test_window_sums_repeated_views_per_user_and_video():
+    window = InteractionWindow(max_size=10, max_delay=60)
+    window.add([_interaction("u1", "v1", 1.0), _interaction("u1", "v1", 2.0), _interaction("u2", "v1", 1.0)])
+    # Old interactions decay to nearly nothing
+    window.add([_interaction("u1", "v2", 4.0, "2000-01-01T00:00:00.000Z")])
+    assert len(window) == 4
+
+    weights = window.drain()
+    assert weights["u1"]["v1"] == pytest.approx(3.0)
+    assert weights["u2"] == {"v1": pytest.approx(1.0)}
+    assert weights["u1"]["v2"] < 1e-9
+    assert len(window) == 0 and window.drain() == {}
+
+def test_window_is_due_by_size_or_delay(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(interaction_window.time, "monotonic", lambda: clock[0])
+    window = InteractionWindow(max_size=2, max_delay=5)
+    assert not window.is_due() and window.remaining() == 5
+    window.add([_interaction("u1", "v1")])
+    clock[0] += 3
+    assert not window.is_due() and window.remaining() == 2
+    clock[0] += 2
+    assert window.is_due()
+
+    window.drain()
+    window.add([_interaction("u1", "v1"), _interaction("u2", "v1")])
+    assert window.is_due()
+
+class FakeConsumer:
+    def subscribe(self, topics, on_revoke=None):
+        pass
+
+class FakeKafkaClient:
+    """Serves the given batches, then stops the consumer loop"""
+
+    def __init__(self, stop, batches):
+        self.stop = stop
+        self.batches = list(batches)
+        self.events = []
+
+    def create_consumer(self, group_id):
+        return FakeConsumer()
+
+    async def consume_interactions(self, consumer, timeout):
+        if self.batches:
+            return self.batches.pop(0)
+        self.stop.set()
+        return []
+
+    async def commit_async(self, consumer):
+        self.events.append("commit")
+
+    async def rewind_async(self, consumer):
+        self.events.append("rewind")
+
+    async def close_consumer_async(self, consumer):
+        pass
+
+def _run(monkeypatch, batches, settled=True):
+    stop = asyncio.Event()
+    client = FakeKafkaClient(stop, batches)
+    flushed = []
+
+    async def flush_interaction_window(weights_by_user):
+        flushed.append(weights_by_user)
+        return {user_id: settled for user_id in weights_by_user}
+
+    async def settle_failures(topic, dead_letter_topic, failed, attempt, to_message):
+        return not failed
+
+    monkeypatch.setattr(ml_consumer, "get_kafka_client", lambda: client)
+    monkeypatch.setattr(ml_consumer, "InteractionWindow", lambda: InteractionWindow(max_size=2, max_delay=60))
+    monkeypatch.setattr(ml_consumer, "flush_interaction_window", flush_interaction_window)
+    monkeypatch.setattr(ml_consumer, "settle_failures", settle_failures)
+    monkeypatch.setattr(ml_consumer, "RETRY_MAX_DELAY_SECONDS", 0)
+    asyncio.run(ml_consumer.process_interactions(stop))
+    return flushed, client.events
+
+def test_full_windows_are_flushed_and_committed(monkeypatch):
+    flushed, events = _run(monkeypatch, [
+        [_interaction("u1", "v1")],
+        [_interaction("u1", "v1"), _interaction("u2", "v2")],
+        [_interaction("u3", "v3")],
+    ])
+    # The second batch fills the window, the third is drained on stop
+    assert [sorted(weights) for weights in flushed] == [["u1", "u2"], ["u3"]]
+    assert flushed[0]["u1"]["v1"] == pytest.approx(2.0)
+    assert events == ["commit", "commit"]
+
+def test_window_that_cannot_be_settled_is_rewound_not_committed(monkeypatch):
+    flushed, events = _run(monkeypatch, [[_interaction("u1", "v1"), _interaction("u2", "v2")]], settled=False)
+    assert len(flushed) == 1
+    assert events == ["rewind"]
@@ -0,0 +1,152 @@
+# tests/test_kafka_client.py
+import asyncio
+import json
+import threading
+import numpy as np
+from confluent_kafka import KafkaError, KafkaException
+from routes import kafka_client
+from routes.kafka_client import KafkaClient, UserInteractionWeights, VideoEmbedding, VideoInteraction
+
+class Message:
+    def __init__(self, topic, value=None, error=None):
+        self._topic = topic
+        self._value = value
+        self._error = error
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return self._error
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return 0
+
+class Consumer:
+    """Hands out the given messages in one consume() call and records the calling thread"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.threads = []
+
+    def consume(self, num_messages=1, timeout=-1):
+        self.threads.append(threading.current_thread())
+        batch, self.messages = self.messages[:num_messages], self.messages[num_messages:]
+        return batch
+
+    def assignment(self):
+        return []
+
+class Producer:
+    """Delivers every message at once, or raises the given error from produce()"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.produced = 0
+        self.keys = []
+
+    def produce(self, topic, key=None, value=None, headers=None, on_delivery=None):
+        if self.error is not None:
+            raise self.error
+        self.produced += 1
+        self.keys.append(key)
+        on_delivery(None, Message(topic))
+
+def _client(monkeypatch, producer, max_in_flight=2):
+    monkeypatch.setattr(kafka_client, "PRODUCER_MAX_IN_FLIGHT", max_in_flight)
+    monkeypatch.setattr(kafka_client, "PRODUCER_ENQUEUE_TIMEOUT_SECONDS", 0.05)
+    client = KafkaClient()
+    monkeypatch.setattr(client, "_get_producer", lambda: producer)
+    return client
+
+def test_failed_produce_releases_its_permit(monkeypatch):
+    producer = Producer(KafkaException("Message size too large"))
+    client = _client(monkeypatch, producer)
+
+    async def run():
+        # More failures than permits, each one must give its permit back
+        for _ in range(5):
+            assert not await client.produce_async("topic", [{"n": 1}])
+        producer.error = None
+        return await client.produce_async("topic", [{"n": 1}, {"n": 2}])
+
+    assert asyncio.run(run())
+    assert producer.produced == 2
+    client.close()
+
+def test_full_local_queue_times_out_and_releases_its_permit(monkeypatch):
+    producer = Producer(BufferError("Local: Queue full"))
+    client = _client(monkeypatch, producer, max_in_flight=1)
+
+    async def run():
+        assert not await client.produce_async("topic", [{"n": 1}])
+        producer.error = None
+        return await client.produce_async("topic", [{"n": 1}])
+
+    assert asyncio.run(run())
+    client.close()
+
+def test_messages_are_keyed_by_user_or_video(monkeypatch):
+    producer = Producer()
+    client = _client(monkeypatch, producer)
+    interaction = VideoInteraction(
+        userId="u1", videoId="v1", viewDuration=5, liked=False, commented=False, shared=False,
+        timestamp="2024-01-01T00:00:00Z", weightedScore=1.0
+    )
+    messages = [
+        interaction,
+        UserInteractionWeights(userId="u2", weights={"v1": 1.0}),
+        VideoEmbedding.model_construct(
+            id="v3", embedding=np.ones(4, dtype=np.float32), title="", description=None, userId="u3", duration=None, trendingScore=0.0
+        ),
+        {"n": 1},
+    ]
+
+    async def run():
+        for message in messages:
+            await client.produce_async("topic", [message])
+
+    asyncio.run(run())
+    # Each user's interactions stay ordered on one partition
+    assert producer.keys == [b"u1", b"u2", b"v3", None]
+    client.close()
+
+def _interaction(user_id):
+    return json.dumps({
+        "userId": user_id, "videoId": "v1", "viewDuration": 5, "liked": False, "commented": False,
+        "shared": False, "timestamp": "2024-01-01T00:00:00Z", "weightedScore": 1.0
+    }).encode()
+
+def test_consume_batch_takes_a_batch_and_skips_errors_and_bad_messages():
+    consumer = Consumer([
+        Message("interactions", _interaction("u1")),
+        Message("interactions", error=KafkaError(KafkaError._PARTITION_EOF)),
+        Message("interactions", b"not json"),
+        Message("interactions", _interaction("u2")),
+        Message("interactions", _interaction("u3")),
+    ])
+    client = KafkaClient()
+    messages = client.consume_batch(consumer, max_messages=4, timeout=0)
+    assert [message["userId"] for message in messages] == ["u1", "u2"]
+    # One consume() call per batch, the rest waits for the next one
+    assert len(consumer.threads) == 1
+    assert [message["userId"] for message in client.consume_batch(consumer, timeout=0)] == ["u3"]
+    client.close()
+
+def test_consume_interactions_runs_off_the_event_loop():
+    consumer = Consumer([Message("interactions", _interaction("u1"))])
+    client = KafkaClient()
+
+    async def run():
+        return await client.consume_interactions(consumer, timeout=0)
+
+    interactions = asyncio.run(run())
+    assert [interaction.userId for interaction in interactions] == ["u1"]
+    assert consumer.threads[0] is not threading.main_thread()
+    client.close()
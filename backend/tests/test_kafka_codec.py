@@ -0,0 +1,53 @@
+# tests/test_kafka_codec.py
+import json
+import numpy as np
+import pytest
+from routes import kafka_codec
+from routes.kafka_client import KafkaClient
+
+FIELDS = {
+    "id": "v1", "userId": "u1", "title": "Title", "description": None, "fileUrl": "https://example.com/v1.mp4",
+    "createdAt": "2024-01-01T00:00:00Z", "metadata": {"labels": ["cat"]}, "status": "ready", "duration": 12,
+    "trendingScore": 0.5
+}
+
+def test_embedding_message_round_trips():
+    embedding = np.linspace(-1, 1, 1536, dtype=np.float32)
+    value = kafka_codec.encode_embedding_message(FIELDS, embedding)
+    assert kafka_codec.is_binary(value)
+    # Roughly a third of the JSON encoding of the same message
+    assert len(value) < len(kafka_codec.encode_json({**FIELDS, "embedding": embedding.tolist()})) / 3
+
+    fields, decoded = kafka_codec.decode_embedding_message(value)
+    assert fields == FIELDS
+    assert decoded.dtype == np.float32
+    assert np.array_equal(decoded, embedding)
+
+def test_message_without_embedding_decodes_to_none():
+    fields, embedding = kafka_codec.decode_embedding_message(kafka_codec.encode_embedding_message(FIELDS, None))
+    assert fields == FIELDS
+    assert embedding is None
+
+@pytest.mark.parametrize("cut", [4, kafka_codec.HEADER.size + 3, -2])
+def test_truncated_message_is_rejected(cut):
+    value = kafka_codec.encode_embedding_message(FIELDS, np.ones(4, dtype=np.float32))
+    with pytest.raises(ValueError):
+        kafka_codec.decode_embedding_message(value[:cut])
+
+def test_unknown_version_is_rejected():
+    value = bytearray(kafka_codec.encode_embedding_message(FIELDS, None))
+    value[2] = kafka_codec.FORMAT_VERSION + 1
+    with pytest.raises(ValueError, match="version"):
+        kafka_codec.decode_embedding_message(bytes(value))
+
+def test_consumer_reads_binary_and_legacy_json_messages():
+    client = KafkaClient()
+    embedding = np.ones(4, dtype=np.float32)
+    for value in (
+        kafka_codec.encode_embedding_message(FIELDS, embedding),
+        json.dumps({**FIELDS, "embedding": embedding.tolist()}).encode(),
+    ):
+        video = client._decode_video_embedding(value)
+        assert video.id == "v1"
+        assert np.array_equal(np.asarray(video.embedding, dtype=np.float32), embedding)
+    client.close()
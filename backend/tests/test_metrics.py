@@ -0,0 +1,57 @@
+# tests/test_metrics.py
+import json
+import pytest
+from services import event_log
+from services.metrics import Metric, MetricsRegistry
+
+def test_a_metric_without_samples_fails_when_created():
+    class Unrendered(Metric):
+        type_name = "gauge"
+
+    with pytest.raises(TypeError):
+        Unrendered("popreel_unrendered", "Never rendered")
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("popreel_test_seconds", "Test latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        latency.observe(value, route="feed")
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP popreel_test_seconds Test latency", "# TYPE popreel_test_seconds histogram"]
+    assert lines[2:] == [
+        'popreel_test_seconds_bucket{route="feed",le="0.1"} 1',
+        'popreel_test_seconds_bucket{route="feed",le="1"} 3',
+        'popreel_test_seconds_bucket{route="feed",le="+Inf"} 4',
+        'popreel_test_seconds_sum{route="feed"} 3.05',
+        'popreel_test_seconds_count{route="feed"} 4',
+    ]
+
+def test_counters_and_gauges_render_per_label_set():
+    registry = MetricsRegistry()
+    messages = registry.counter("popreel_test_total", "Test messages", ("result",))
+    messages.inc(result="ok")
+    messages.inc(2, result='bad "json"')
+    depth = registry.gauge("popreel_test_depth", "Test depth")
+    depth.set_function(lambda: 7)
+    rendered = registry.render()
+    assert 'popreel_test_total{result="ok"} 1\n' in rendered
+    assert 'popreel_test_total{result="bad \\"json\\""} 2\n' in rendered
+    assert "popreel_test_depth 7\n" in rendered
+
+def test_metric_rejects_wrong_labels_and_conflicting_registration():
+    registry = MetricsRegistry()
+    messages = registry.counter("popreel_test_total", "Test messages", ("result",))
+    assert registry.counter("popreel_test_total", "Test messages", ("result",)) is messages
+    with pytest.raises(ValueError):
+        messages.inc(topic="t")
+    with pytest.raises(ValueError):
+        registry.gauge("popreel_test_total", "Test messages", ("result",))
+
+def test_sampled_events_record_their_sample_rate(monkeypatch):
+    logged = []
+    monkeypatch.setattr(event_log.logger, "log", lambda level, message: logged.append(json.loads(message)))
+    monkeypatch.setattr(event_log.random, "random", lambda: 0.5)
+    event_log.log_event("skipped", sample_rate=0.1)
+    event_log.log_event("kept", sample_rate=0.9, users=3)
+    assert [event["event"] for event in logged] == ["kept"]
+    assert logged[0]["sampleRate"] == 0.9 and logged[0]["users"] == 3
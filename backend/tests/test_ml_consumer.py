@@ -0,0 +1,47 @@
+# tests/test_ml_consumer.py
+import asyncio
+import numpy as np
+from services import ml_consumer
+
+def _install(monkeypatch, chunk_size, concurrency):
+    fetches = []
+    chunks = []
+    running = [0, 0]  # Now, peak
+
+    async def get_video_embedding_matrix(video_ids):
+        fetches.append(sorted(video_ids))
+        return {video_id: i for i, video_id in enumerate(video_ids)}, np.zeros((len(video_ids), 4), dtype=np.float32)
+
+    async def update_user_embeddings_from_weights(weights_by_user, video_rows, video_matrix):
+        running[0] += 1
+        running[1] = max(running)
+        chunks.append(sorted(weights_by_user))
+        await asyncio.sleep(0)
+        running[0] -= 1
+        return {user_id: user_id != "u3" for user_id in weights_by_user}
+
+    monkeypatch.setattr(ml_consumer, "get_video_embedding_matrix", get_video_embedding_matrix)
+    monkeypatch.setattr(ml_consumer, "update_user_embeddings_from_weights", update_user_embeddings_from_weights)
+    monkeypatch.setattr(ml_consumer, "USER_UPDATE_CHUNK_SIZE", chunk_size)
+    monkeypatch.setattr(ml_consumer, "USER_UPDATE_CONCURRENCY", concurrency)
+    return fetches, chunks, running
+
+def test_window_fetches_videos_once_and_updates_users_in_bounded_chunks(monkeypatch):
+    fetches, chunks, running = _install(monkeypatch, chunk_size=2, concurrency=2)
+    weights_by_user = {f"u{i}": {"v1": 1.0, f"v{i}": 1.0} for i in range(1, 8)}
+
+    results = asyncio.run(ml_consumer.flush_interaction_window(weights_by_user))
+    assert results == {f"u{i}": i != 3 for i in range(1, 8)}
+    # Shared videos are fetched once for the whole window
+    assert fetches == [sorted({f"v{i}" for i in range(1, 8)})]
+    assert sorted(chunks) == [["u1", "u2"], ["u3", "u4"], ["u5", "u6"], ["u7"]]
+    assert running[1] == 2
+
+def test_failed_video_fetch_fails_every_user(monkeypatch):
+    _install(monkeypatch, chunk_size=2, concurrency=2)
+
+    async def get_video_embedding_matrix(video_ids):
+        raise ConnectionError("connection lost")
+    monkeypatch.setattr(ml_consumer, "get_video_embedding_matrix", get_video_embedding_matrix)
+    results = asyncio.run(ml_consumer.flush_interaction_window({"u1": {"v1": 1.0}, "u2": {"v2": 1.0}}))
+    assert results == {"u1": False, "u2": False}
@@ -0,0 +1,154 @@
+# tests/test_ml_processor.py
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import numpy as np
+from db.connection import INSTANCE_ID, _decode_vector
+from routes.kafka_client import VideoEmbedding
+from services import ml_processor
+from services.embedding_engine import EMBEDDING_DIMENSION
+from services.recommendation_cache import RecommendationCache
+from services.user_embedding_cache import UserEmbeddingCache
+
+class Connection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def execute(self, query, *args):
+        self.pool.executed.append(args)
+
+    async def fetch(self, query, *args):
+        self.pool.executed.append(args)
+        return self.pool.respond(query, args)
+
+class Pool:
+    def __init__(self, respond=lambda query, args: []):
+        self.executed = []
+        self.respond = respond
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield Connection(self)
+
+class Store:
+    def __init__(self):
+        self.upserted = []
+        self.calls = 0
+
+    async def upsert(self, vectors):
+        self.calls += 1
+        self.upserted.extend(vector['id'] for vector in vectors)
+
+def _install(monkeypatch):
+    pool, store = Pool(), Store()
+
+    async def get_pool():
+        return pool
+    monkeypatch.setattr(ml_processor, "get_consumer_db", get_pool)
+    monkeypatch.setattr(ml_processor, "get_vector_store", lambda: store)
+    return pool, store
+
+def _video(video_id, embedding):
+    return VideoEmbedding.model_construct(
+        id=video_id, embedding=embedding, title="", description=None, userId="u", duration=None, trendingScore=0.0
+    )
+
+def test_batch_is_upserted_in_chunks_with_one_status_update(monkeypatch):
+    pool, store = _install(monkeypatch)
+    monkeypatch.setattr(ml_processor, "VECTOR_UPSERT_BATCH_SIZE", 2)
+    embedding = np.ones(EMBEDDING_DIMENSION, dtype=np.float32)
+    # v1 repeats in the batch and is only upserted once
+    videos = [_video(video_id, embedding) for video_id in ("v1", "v2", "v1", "v3")]
+    results = asyncio.run(ml_processor.add_batch_to_pinecone(videos))
+    assert results == {"v1": True, "v2": True, "v3": True}
+    assert store.upserted == ["v1", "v2", "v3"]
+    assert store.calls == 2
+    assert len(pool.executed) == 1
+    ids, statuses = pool.executed[0][:2]
+    assert dict(zip(ids, statuses)) == {"v1": "ready", "v2": "ready", "v3": "ready"}
+
+def test_video_without_embedding_is_handled_and_marked_failed(monkeypatch):
+    pool, store = _install(monkeypatch)
+    videos = [_video("v1", np.ones(EMBEDDING_DIMENSION, dtype=np.float32)), _video("v2", None), _video("v3", [])]
+    results = asyncio.run(ml_processor.add_batch_to_pinecone(videos))
+    assert results == {"v1": True, "v2": True, "v3": True}
+    assert store.upserted == ["v1"]
+    ids, statuses = pool.executed[0][:2]
+    assert dict(zip(ids, statuses)) == {"v1": "ready", "v2": "failed", "v3": "failed"}
+
+def test_vector_store_error_is_a_failure(monkeypatch):
+    _install(monkeypatch)
+
+    class FailingStore:
+        async def upsert(self, vectors):
+            raise RuntimeError("vector store unavailable")
+    monkeypatch.setattr(ml_processor, "get_vector_store", lambda: FailingStore())
+    results = asyncio.run(ml_processor.add_batch_to_pinecone([_video("v1", np.ones(EMBEDDING_DIMENSION, dtype=np.float32))]))
+    assert results == {"v1": False}
+
+def test_user_without_video_embeddings_is_handled(monkeypatch):
+    pool, _ = _install(monkeypatch)
+    results = asyncio.run(ml_processor.update_user_embeddings_from_weights(
+        {"u1": {"missing": 1.0}}, {}, np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+    ))
+    assert results == {"u1": True}
+    assert pool.executed == []
+
+def test_user_embeddings_are_merged_and_upserted_in_one_statement(monkeypatch):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    current = np.full(EMBEDDING_DIMENSION, 1.0, dtype=np.float32)
+
+    def respond(query, args):
+        if "INSERT INTO user_embeddings" in query:
+            return [{"user_id": user_id, "updated_at": now} for user_id in args[0]]
+        # Only u1 has a stored embedding
+        return [{"user_id": "u1", "embedding": current, "updated_at": now}]
+
+    pool, _ = _install(monkeypatch)
+    pool.respond = respond
+    user_cache = UserEmbeddingCache()
+    monkeypatch.setattr(ml_processor, "get_user_embedding_cache", lambda: user_cache)
+    monkeypatch.setattr(ml_processor, "get_recommendation_cache", lambda: RecommendationCache())
+
+    video_matrix = np.stack([np.full(EMBEDDING_DIMENSION, 2.0, dtype=np.float32), np.full(EMBEDDING_DIMENSION, 4.0, dtype=np.float32)])
+    results = asyncio.run(ml_processor.update_user_embeddings_from_weights(
+        {"u1": {"v1": 1.0}, "u2": {"v1": 1.0, "v2": 1.0}}, {"v1": 0, "v2": 1}, video_matrix
+    ))
+    assert results == {"u1": True, "u2": True}
+    # One read of the current embeddings, one upsert for both users
+    assert len(pool.executed) == 2
+    user_ids, embeddings = pool.executed[1][:2]
+    upserted = dict(zip(user_ids, (_decode_vector(embedding) for embedding in embeddings)))
+    np.testing.assert_allclose(upserted["u1"], 0.7 * 1.0 + 0.3 * 2.0, rtol=1e-6)
+    # A first-time user keeps the delta as is
+    np.testing.assert_allclose(upserted["u2"], 3.0, rtol=1e-6)
+    # Written through to the cache
+    np.testing.assert_allclose(user_cache.get("u2").embedding, 3.0, rtol=1e-6)
+
+def test_failed_upsert_fails_only_users_with_a_delta(monkeypatch):
+    def respond(query, args):
+        if "INSERT INTO user_embeddings" in query:
+            raise ConnectionError("connection lost")
+        return []
+
+    pool, _ = _install(monkeypatch)
+    pool.respond = respond
+    monkeypatch.setattr(ml_processor, "get_user_embedding_cache", lambda: UserEmbeddingCache())
+    results = asyncio.run(ml_processor.update_user_embeddings_from_weights(
+        {"u1": {"v1": 1.0}, "u2": {"missing": 1.0}}, {"v1": 0}, np.ones((1, EMBEDDING_DIMENSION), dtype=np.float32)
+    ))
+    assert results == {"u1": False, "u2": True}
+
+def test_notifications_from_other_processes_invalidate_cached_users(monkeypatch):
+    user_cache = UserEmbeddingCache()
+    monkeypatch.setattr(ml_processor, "get_user_embedding_cache", lambda: user_cache)
+    monkeypatch.setattr(ml_processor, "get_recommendation_cache", lambda: RecommendationCache())
+    now = datetime.now(timezone.utc)
+    for user_id in ("u1", "u2"):
+        user_cache.put(user_id, np.ones(EMBEDDING_DIMENSION, dtype=np.float32), now)
+
+    # This process already wrote through its own update
+    ml_processor.handle_user_embedding_notification(f"{INSTANCE_ID}:u1")
+    ml_processor.handle_user_embedding_notification("other-worker:u2")
+    assert user_cache.get("u1") is not None
+    assert user_cache.get("u2") is None
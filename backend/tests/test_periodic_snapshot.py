@@ -0,0 +1,50 @@
+# tests/test_periodic_snapshot.py
+import asyncio
+import pytest
+from services.periodic_snapshot import PeriodicSnapshot
+
+class Counter(PeriodicSnapshot[int]):
+    name = "counter"
+
+    def __init__(self, failures: int = 0):
+        super().__init__(0, refresh_seconds=0)
+        self.loads = 0
+        self.failures = failures
+
+    async def load(self) -> int:
+        self.loads += 1
+        await asyncio.sleep(0)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        return self.loads
+
+def test_concurrent_first_gets_share_one_load():
+    snapshot = Counter()
+
+    async def run():
+        return await asyncio.gather(*(snapshot.get() for _ in range(5)))
+
+    assert asyncio.run(run()) == [1] * 5
+    assert snapshot.loads == 1
+    assert snapshot.age_seconds is not None
+
+def test_run_keeps_refreshing_after_a_failure(capsys):
+    snapshot = Counter(failures=1)
+
+    async def run():
+        task = asyncio.ensure_future(snapshot.run())
+        while snapshot.loads < 3:
+            await asyncio.sleep(0)
+        task.cancel()
+        return await snapshot.get()
+
+    assert asyncio.run(run()) >= 2
+    assert "Error refreshing counter: database unavailable" in capsys.readouterr().out
+
+def test_a_snapshot_without_load_fails_when_created():
+    class Unloaded(PeriodicSnapshot[int]):
+        pass
+
+    with pytest.raises(TypeError):
+        Unloaded(0, refresh_seconds=60)
@@ -0,0 +1,84 @@
+# tests/test_recommendation_pagination.py
+import asyncio
+import pytest
+from routes import recommendations
+from services.recommendation_cache import RecommendationCache, decode_cursor, encode_cursor
+
+@pytest.fixture
+def ranked(monkeypatch):
+    """Serve pages from a fresh cache, ranking whatever list the test sets"""
+    cache = RecommendationCache()
+    state = {"video_ids": []}
+
+    async def rank_candidates(user_id, top_k):
+        return list(state["video_ids"][:top_k])
+
+    monkeypatch.setattr(recommendations, "get_recommendation_cache", lambda: cache)
+    monkeypatch.setattr(recommendations, "rank_candidates", rank_candidates)
+    return cache, state
+
+def _next_page(response):
+    generation, offset = decode_cursor(response["nextCursor"])
+    return offset, generation
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(40, 7)) == (7, 40)
+    assert decode_cursor(encode_cursor(40)) == (0, 40)
+    for malformed in ("not-a-cursor", "bzo0MA"):  # The second is "o:40"
+        with pytest.raises(ValueError):
+            decode_cursor(malformed)
+
+def test_next_page_comes_from_the_same_list_after_invalidation(ranked):
+    cache, state = ranked
+    state["video_ids"] = [f"a{i}" for i in range(10)]
+    first = asyncio.run(recommendations._page_recommendations("u1", 3, 0))
+    assert first["videoIds"] == ["a0", "a1", "a2"]
+
+    # An embedding update re-ranks the user's list between the two pages
+    cache.invalidate("u1")
+    state["video_ids"] = ["a2", "a0", "b0", "a1", "a3", "a4"]
+    second = asyncio.run(recommendations._page_recommendations("u1", 3, *_next_page(first)))
+    assert second["videoIds"] == ["a3", "a4", "a5"]
+    assert not second["restarted"]
+
+    # A new first page sees the re-ranked list
+    fresh = asyncio.run(recommendations._page_recommendations("u1", 3, 0))
+    assert fresh["videoIds"] == ["a2", "a0", "b0"]
+
+def test_pagination_restarts_when_the_list_expired(ranked):
+    cache, state = ranked
+    state["video_ids"] = [f"a{i}" for i in range(10)]
+    first = asyncio.run(recommendations._page_recommendations("u1", 3, 0))
+    cache.invalidate("u1")
+    cache._snapshots.clear()
+    state["video_ids"] = [f"b{i}" for i in range(10)]
+    second = asyncio.run(recommendations._page_recommendations("u1", 3, *_next_page(first)))
+    assert second["videoIds"] == ["b0", "b1", "b2"]
+    assert second["restarted"]
+
+def test_cursor_of_another_user_is_not_served(ranked):
+    cache, state = ranked
+    state["video_ids"] = [f"a{i}" for i in range(10)]
+    first = asyncio.run(recommendations._page_recommendations("u1", 3, 0))
+    offset, generation = _next_page(first)
+    assert cache.get_generation("u2", generation) is None
+
+def _last_cached_page(ranked, monkeypatch, n_ranked):
+    cache, state = ranked
+    monkeypatch.setattr(recommendations, "RECOMMENDATION_CANDIDATE_DEPTH", 6)
+    state["video_ids"] = [f"a{i}" for i in range(n_ranked)]
+    return asyncio.run(recommendations._page_recommendations("u1", 3, 3))
+
+def test_a_list_of_exactly_the_cached_depth_ends(ranked, monkeypatch):
+    page = _last_cached_page(ranked, monkeypatch, 6)
+    assert page["videoIds"] == ["a3", "a4", "a5"]
+    assert page["nextCursor"] is None
+
+def test_a_ranking_deeper_than_the_cache_continues_past_it(ranked, monkeypatch):
+    page = _last_cached_page(ranked, monkeypatch, 8)
+    assert page["videoIds"] == ["a3", "a4", "a5"]
+    offset, generation = _next_page(page)
+    assert (offset, generation) == (6, 0)
+    beyond = asyncio.run(recommendations._page_recommendations("u1", 3, offset, generation))
+    assert beyond["videoIds"] == ["a6", "a7"]
+    assert beyond["nextCursor"] is None
@@ -0,0 +1,69 @@
+# tests/test_reranker.py
+import asyncio
+from contextlib import asynccontextmanager
+import numpy as np
+from services import video_attributes
+from services.reranker import RerankWeights, rerank
+from services.video_attributes import EMPTY_ATTRIBUTES, VideoAttributeCache, VideoAttributes
+
+NOW = 1704067200.0
+DAY = 86400
+
+def _attributes(videos):
+    """videos: id -> (trending score, age in days, creator code)"""
+    return VideoAttributes(
+        rows={video_id: row for row, video_id in enumerate(videos)},
+        trending_score=np.array([trending for trending, _, _ in videos.values()], dtype=np.float32),
+        created_at=np.array([NOW - age * DAY for _, age, _ in videos.values()], dtype=np.float64),
+        creator=np.array([creator for _, _, creator in videos.values()], dtype=np.int32),
+    )
+
+def test_similarity_alone_keeps_nearest_neighbour_order():
+    weights = RerankWeights(similarity=1.0, trending=0.0, freshness=0.0, creator_penalty=0.0)
+    ranked = rerank(["a", "b", "c"], np.array([0.2, 0.9, 0.5]), EMPTY_ATTRIBUTES, weights, NOW)
+    assert ranked == ["b", "c", "a"]
+
+def test_trending_and_fresh_videos_move_up():
+    attributes = _attributes({"old": (0.0, 60, 0), "fresh": (0.0, 0, 1), "trending": (1000.0, 60, 2)})
+    similarities = np.array([0.80, 0.75, 0.75])
+    weights = RerankWeights(similarity=1.0, trending=0.1, freshness=0.1, creator_penalty=0.0)
+    assert rerank(["old", "fresh", "trending"], similarities, attributes, weights, NOW)[-1] == "old"
+
+def test_repeated_creators_are_spread_out():
+    attributes = _attributes({"a1": (0.0, 0, 7), "a2": (0.0, 0, 7), "a3": (0.0, 0, 7), "b1": (0.0, 0, 8)})
+    weights = RerankWeights(similarity=1.0, trending=0.0, freshness=0.0, creator_penalty=0.05)
+    ranked = rerank(["a1", "a2", "a3", "b1"], np.array([0.90, 0.89, 0.88, 0.86]), attributes, weights, NOW)
+    # a2 and a3 each lose 0.05 per better candidate of their creator
+    assert ranked == ["a1", "b1", "a2", "a3"]
+
+def test_unknown_videos_count_as_new_and_from_their_own_creator():
+    weights = RerankWeights(similarity=1.0, trending=0.0, freshness=0.1, creator_penalty=0.05)
+    attributes = _attributes({"known": (0.0, 365, 1)})
+    ranked = rerank(["known", "new1", "new2"], np.array([0.9, 0.85, 0.84]), attributes, weights, NOW)
+    assert ranked == ["new1", "new2", "known"]
+    assert rerank([], np.zeros(0), attributes, weights, NOW) == []
+
+def test_attribute_cache_loads_columns_with_one_code_per_creator(monkeypatch):
+    records = [
+        {"id": "v1", "user_id": "u1", "trending_score": 2.5, "created_at": NOW},
+        {"id": "v2", "user_id": "u2", "trending_score": None, "created_at": NOW - DAY},
+        {"id": "v3", "user_id": "u1", "trending_score": 1.0, "created_at": NOW},
+    ]
+
+    class Connection:
+        async def fetch(self, query):
+            return records
+
+    class Pool:
+        @asynccontextmanager
+        async def acquire(self, timeout=None):
+            yield Connection()
+
+    async def get_replica_db():
+        return Pool()
+    monkeypatch.setattr(video_attributes, "get_replica_db", get_replica_db)
+
+    attributes = asyncio.run(VideoAttributeCache().load())
+    assert attributes.lookup(["v3", "missing", "v1"]).tolist() == [2, -1, 0]
+    assert attributes.trending_score.tolist() == [2.5, 0.0, 1.0]
+    assert attributes.creator.tolist() == [0, 1, 0]
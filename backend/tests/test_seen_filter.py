@@ -0,0 +1,66 @@
+# tests/test_seen_filter.py
+import asyncio
+from contextlib import asynccontextmanager
+from services import seen_filter
+from services.seen_filter import SEEN_FILTER_FALSE_POSITIVE_RATE, SEEN_FILTER_HISTORY, SeenFilter, SeenFilterCache, bloom_shape
+
+def test_bloom_shape_matches_the_textbook_optimum():
+    assert bloom_shape(5000, 0.01) == (47928, 7)
+    assert bloom_shape(5000, 0.001) == (71888, 10)
+
+def test_default_filter_keeps_its_rate_at_full_history():
+    seen = SeenFilter()
+    seen_ids = [f"seen-{i}" for i in range(SEEN_FILTER_HISTORY)]
+    seen.add(seen_ids)
+    assert seen.contains(seen_ids).all()
+
+    unseen_ids = [f"unseen-{i}" for i in range(50000)]
+    false_positive_rate = seen.contains(unseen_ids).mean()
+    assert false_positive_rate < 1.5 * SEEN_FILTER_FALSE_POSITIVE_RATE
+
+def test_unseen_keeps_candidate_order():
+    seen = SeenFilter()
+    seen.add(["v2", "v4"])
+    assert seen.unseen(["v1", "v2", "v3", "v4"]) == ["v1", "v3"]
+
+def _install_history(monkeypatch, history):
+    class Connection:
+        async def fetch(self, query, user_id, limit):
+            return [{"video_id": video_id} for video_id in history[user_id][:limit]]
+
+    class Pool:
+        @asynccontextmanager
+        async def acquire(self, timeout=None):
+            yield Connection()
+
+    async def get_replica_db():
+        return Pool()
+    monkeypatch.setattr(seen_filter, "get_replica_db", get_replica_db)
+
+def test_cache_builds_once_and_marks_new_views(monkeypatch):
+    _install_history(monkeypatch, {"u1": ["v1"]})
+    cache = SeenFilterCache()
+
+    async def run():
+        first = await cache.get("u1")
+        cache.mark_seen("u1", ["v2"])
+        # Unloaded users are built from analytics on their next read instead
+        cache.mark_seen("u2", ["v3"])
+        return first, await cache.get("u1")
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert cache.builds == 1
+    assert first.unseen(["v1", "v2", "v3"]) == ["v3"]
+
+def test_cache_evicts_least_recent_user_past_its_byte_budget(monkeypatch):
+    _install_history(monkeypatch, {"u1": [], "u2": [], "u3": []})
+    cache = SeenFilterCache(max_bytes=2 * (SeenFilter().nbytes + SeenFilterCache.ENTRY_OVERHEAD_BYTES))
+
+    async def run():
+        for user_id in ("u1", "u2", "u1", "u3"):
+            await cache.get(user_id)
+
+    asyncio.run(run())
+    assert cache.evictions == 1
+    assert list(cache._entries) == ["u1", "u3"]
@@ -0,0 +1,70 @@
+# tests/test_user_embedding_cache.py
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+import numpy as np
+from services import ml_processor
+from services.user_embedding_cache import UserEmbeddingCache
+
+NOW = datetime(2024, 1, 1)
+
+def _embedding(value: float) -> np.ndarray:
+    return np.full(8, value, dtype=np.float32)
+
+def test_least_recently_used_user_is_evicted_past_the_byte_budget():
+    cache = UserEmbeddingCache(max_bytes=2 * (_embedding(0).nbytes + UserEmbeddingCache.ENTRY_OVERHEAD_BYTES))
+    cache.put("u1", _embedding(1), NOW)
+    cache.put("u2", _embedding(2), NOW)
+    assert cache.get("u1") is not None
+    cache.put("u3", _embedding(3), NOW)
+    assert cache.get("u2") is None
+    assert cache.get("u1").embedding[0] == 1 and cache.get("u3").embedding[0] == 3
+    assert cache.evictions == 1
+
+def test_fill_without_changes_is_cached():
+    cache = UserEmbeddingCache()
+    assert cache.fill("u1", _embedding(1), NOW, cache.fill_token())
+    assert cache.get("u1") is not None
+
+def test_fill_after_invalidation_is_skipped():
+    cache = UserEmbeddingCache()
+    token = cache.fill_token()
+    cache.invalidate("u1")
+    assert not cache.fill("u1", _embedding(1), NOW, token)
+    assert cache.get("u1") is None
+    # Other users read with the same token are unaffected
+    assert cache.fill("u2", _embedding(2), NOW, token)
+
+def test_fill_after_clear_is_skipped():
+    cache = UserEmbeddingCache()
+    token = cache.fill_token()
+    cache.clear()
+    assert not cache.fill("u1", _embedding(1), NOW, token)
+
+def test_fill_after_forgotten_change_is_skipped():
+    cache = UserEmbeddingCache()
+    cache._invalidations.history = 2
+    token = cache.fill_token()
+    for user_id in ("u1", "u2", "u3"):
+        cache.invalidate(user_id)
+    # u1's change was forgotten, the token predates it so the fill is refused
+    assert not cache.fill("u1", _embedding(1), NOW, token)
+
+def test_fetch_does_not_cache_a_row_invalidated_mid_read(monkeypatch):
+    cache = UserEmbeddingCache()
+    monkeypatch.setattr(ml_processor, "get_user_embedding_cache", lambda: cache)
+
+    class Connection:
+        async def fetch(self, query, user_ids):
+            # A NOTIFY for a rewrite arrives while the read is in flight
+            cache.invalidate("u1")
+            return [{"user_id": "u1", "embedding": _embedding(1), "updated_at": NOW}]
+
+    class Pool:
+        @asynccontextmanager
+        async def acquire(self, timeout=None):
+            yield Connection()
+
+    found = asyncio.run(ml_processor.fetch_user_embeddings(["u1"], Pool()))
+    assert "u1" in found
+    assert cache.get("u1") is None
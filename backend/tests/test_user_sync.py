@@ -0,0 +1,83 @@
+# tests/test_user_sync.py
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from services import user_sync
+from services.user_sync import WebhookDeliveryCache, read_export, sync_records, user_from_record
+
+CLERK_USER = {
+    "id": "user_1",
+    "username": None,
+    "primary_email_address_id": "email_2",
+    "email_addresses": [
+        {"id": "email_1", "email_address": "old@example.com"},
+        {"id": "email_2", "email_address": "ada@example.com"},
+    ],
+}
+
+def test_user_from_clerk_object_uses_primary_email_for_the_username():
+    user = user_from_record(CLERK_USER)
+    assert (user.id, user.username, user.email) == ("user_1", "ada", "ada@example.com")
+    assert user_from_record({"id": "user_2", "username": "bob", "email": "bob@example.com"}).username == "bob"
+    assert user_from_record({"id": "user_3"}) is None
+
+def test_read_export_accepts_csv_json_array_and_json_lines(tmp_path):
+    records = [{"id": "user_1", "username": "ada", "email": "ada@example.com"}]
+    (tmp_path / "users.csv").write_text("id,username,email\nuser_1,ada,ada@example.com\n")
+    (tmp_path / "users.json").write_text("  " + json.dumps(records))
+    (tmp_path / "users.jsonl").write_text(json.dumps(records[0]) + "\n\n")
+    for name in ("users.csv", "users.json", "users.jsonl"):
+        assert list(read_export(tmp_path / name)) == records
+
+class Connection:
+    def __init__(self):
+        self.copied = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query):
+        pass
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.copied.append(records)
+
+    async def fetchrow(self, query):
+        return {"inserted": len(self.copied[-1]), "updated": 0}
+
+class Pool:
+    def __init__(self):
+        self.conn = Connection()
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield self.conn
+
+def test_records_are_copied_in_batches_with_one_row_per_user(monkeypatch):
+    pool = Pool()
+
+    async def get_admin_db():
+        return pool
+    monkeypatch.setattr(user_sync, "get_admin_db", get_admin_db)
+    records = [{"id": f"user_{i}", "email": f"user{i}@example.com"} for i in range(5)]
+    # A repeated id keeps its last record, one without an email is skipped
+    records[2:2] = [{"id": "user_0", "email": "new@example.com"}, {"id": "user_9"}]
+
+    totals = asyncio.run(sync_records(records, batch_size=3))
+    assert totals == {"inserted": 5, "updated": 0, "skipped": 1}
+    assert [len(batch) for batch in pool.conn.copied] == [2, 3]
+    assert pool.conn.copied[0][0] == ("user_0", "new", "new@example.com")
+
+def test_webhook_delivery_cache_forgets_after_ttl_and_size(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(user_sync.time, "monotonic", lambda: clock[0])
+    cache = WebhookDeliveryCache(max_size=2, ttl_seconds=10)
+    cache.mark("msg_1")
+    assert cache.seen("msg_1") and not cache.seen("msg_2")
+    clock[0] = 11
+    assert not cache.seen("msg_1")
+    cache.mark("msg_2")
+    cache.mark("msg_3")
+    cache.mark("msg_4")
+    assert not cache.seen("msg_2") and cache.seen("msg_4")
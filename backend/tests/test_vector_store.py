@@ -0,0 +1,133 @@
+# tests/test_vector_store.py
+import asyncio
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from services import vector_store
+from services.embedding_compression import EmbeddingCompressor, fit_projection
+from services.vector_store import LocalVectorStore, PineconeVectorStore, VectorStore
+
+DIMENSION = 8
+
+def _vectors(ids, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{'id': vector_id, 'values': rng.standard_normal(DIMENSION).astype(np.float32)} for vector_id in ids]
+
+def _store(path):
+    return LocalVectorStore(path, dimension=DIMENSION, nlist=2, nprobe=2, train_size=4)
+
+def test_async_query_reloads_off_the_loop(tmp_path, monkeypatch):
+    reader = _store(tmp_path)
+    writer = _store(tmp_path)
+    # Training writes a snapshot, which the reader can only pick up with a full load
+    writer.upsert_sync(_vectors(["a", "b", "c", "d", "e"]))
+
+    loads = []
+    original_load = LocalVectorStore._load
+    def record_load(store):
+        loads.append(store is reader)
+        original_load(store)
+    monkeypatch.setattr(LocalVectorStore, "_load", record_load)
+
+    async def run():
+        query = np.ones(DIMENSION, dtype=np.float32)
+        before = await reader.query(query, 10)
+        await reader._refreshing
+        after = await reader.query(query, 10)
+        return before, after
+
+    before, after = asyncio.run(run())
+    assert before == []
+    assert sorted(match.id for match in after) == ["a", "b", "c", "d", "e"]
+    # The reload ran on a detached copy and was swapped in
+    assert loads == [False]
+
+def test_async_query_applies_journal_records(tmp_path):
+    reader = _store(tmp_path)
+    writer = _store(tmp_path)
+    writer.upsert_sync(_vectors(["a", "b"]))
+
+    async def run():
+        query = np.ones(DIMENSION, dtype=np.float32)
+        await reader.query(query, 10)
+        await reader._refreshing
+        writer.delete_sync(["a"])
+        reader._last_refresh = 0.0
+        await reader.query(query, 10)
+        await reader._refreshing
+        return await reader.query(query, 10)
+
+    assert [match.id for match in asyncio.run(run())] == ["b"]
+
+def test_async_query_waits_for_a_writer_off_the_loop(tmp_path):
+    store = _store(tmp_path)
+    store.upsert_sync(_vectors(["a"]))
+    store._last_refresh = float("inf")
+
+    async def run():
+        ticks = 0
+        # Stands in for an upsert or training pass in a worker thread
+        store._lock.acquire()
+        try:
+            query = asyncio.ensure_future(store.query(np.ones(DIMENSION, dtype=np.float32), 10))
+            for _ in range(10):
+                await asyncio.sleep(0.001)
+                ticks += 1
+            assert not query.done()
+        finally:
+            store._lock.release()
+        return ticks, await query
+
+    ticks, matches = asyncio.run(run())
+    assert ticks == 10
+    assert [match.id for match in matches] == ["a"]
+
+def test_a_store_missing_a_method_fails_when_created():
+    class UpsertOnly(VectorStore):
+        async def upsert(self, vectors):
+            pass
+
+    with pytest.raises(TypeError):
+        UpsertOnly()
+
+def _pinecone_client(dimension):
+    index = SimpleNamespace(describe_index_stats=lambda: SimpleNamespace(dimension=dimension))
+    return SimpleNamespace(Index=lambda name: index)
+
+def test_pinecone_store_refuses_index_of_another_dimension(monkeypatch):
+    monkeypatch.setattr(vector_store, "get_pinecone_client", lambda: _pinecone_client(DIMENSION))
+    samples = np.random.default_rng(0).standard_normal((16, DIMENSION)).astype(np.float32)
+    projected = EmbeddingCompressor(projection=fit_projection(samples, 4), input_dimension=DIMENSION)
+    with pytest.raises(ValueError, match="dimension 8, configured for 4"):
+        PineconeVectorStore(projected)
+    # The unprojected layout matches the index
+    PineconeVectorStore(EmbeddingCompressor(input_dimension=DIMENSION))
+
+def _exact_top_k(vectors, query, top_k):
+    matrix = np.stack([vector['values'] for vector in vectors])
+    scores = (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)) @ (query / np.linalg.norm(query))
+    return [vectors[i]['id'] for i in np.argsort(-scores)[:top_k]]
+
+def test_queries_match_exact_cosine_ranking_before_and_after_training(tmp_path):
+    store = _store(tmp_path)
+    vectors = _vectors([f"v{i}" for i in range(12)], seed=1)
+    query = np.random.default_rng(2).standard_normal(DIMENSION).astype(np.float32)
+
+    store.upsert_sync(vectors[:3])
+    assert [match.id for match in store.query_sync(query, 2)] == _exact_top_k(vectors[:3], query, 2)
+    # Past train_size the index is trained, probing every list is still exact
+    store.upsert_sync(vectors[3:])
+    matches = store.query_sync(query, 5)
+    assert [match.id for match in matches] == _exact_top_k(vectors, query, 5)
+    assert all(earlier.score >= later.score for earlier, later in zip(matches, matches[1:]))
+
+def test_deleted_vectors_stay_deleted_after_reopening(tmp_path):
+    store = _store(tmp_path)
+    vectors = [{**vector, 'metadata': {'n': i}} for i, vector in enumerate(_vectors(["a", "b", "c", "d", "e"]))]
+    store.upsert_sync(vectors)
+    store.delete_sync(["b"])
+
+    reopened = _store(tmp_path)
+    matches = reopened.query_sync(np.ones(DIMENSION, dtype=np.float32), 10, include_metadata=True)
+    assert sorted(match.id for match in matches) == ["a", "c", "d", "e"]
+    assert {match.id: match.metadata['n'] for match in matches}["e"] == 4
@@ -0,0 +1,59 @@
+# tests/test_video_embedding_cache.py
+import asyncio
+import numpy as np
+from services import ml_consumer
+from services.video_embedding_cache import VideoEmbeddingCache
+
+DIMENSION = 8
+
+def _cache(capacity: int = 4) -> VideoEmbeddingCache:
+    return VideoEmbeddingCache(capacity=capacity, dimension=DIMENSION, quantization="none")
+
+def _embeddings(*values: float) -> np.ndarray:
+    return np.stack([np.full(DIMENSION, value, dtype=np.float32) for value in values])
+
+def test_get_many_splits_cached_and_missing():
+    cache = _cache()
+    cache.put_many(["v1", "v2"], _embeddings(1, 2))
+    found, matrix, missing = cache.get_many(["v2", "v3", "v1"])
+    assert found == ["v2", "v1"]
+    assert np.allclose(matrix, _embeddings(2, 1))
+    assert missing == ["v3"]
+
+def test_fill_many_skips_videos_invalidated_during_the_read():
+    cache = _cache()
+    token = cache.fill_token()
+    cache.invalidate(["v1"])
+    assert cache.fill_many(["v1", "v2"], _embeddings(1, 2), token) == ["v2"]
+    assert cache.get_many(["v1", "v2"])[2] == ["v1"]
+
+def test_fill_many_after_clear_is_skipped():
+    cache = _cache()
+    token = cache.fill_token()
+    cache.clear()
+    assert cache.fill_many(["v1"], _embeddings(1), token) == []
+    # A fill that starts after the clear is cached
+    assert cache.fill_many(["v1"], _embeddings(1), cache.fill_token()) == ["v1"]
+
+def test_full_cache_evicts_least_used_video():
+    cache = _cache(capacity=2)
+    cache.put_many(["v1", "v2"], _embeddings(1, 2))
+    cache.get_many(["v1"])
+    cache.put_many(["v3"], _embeddings(3))
+    assert cache.get_many(["v1", "v2", "v3"])[2] == ["v2"]
+
+def test_matrix_does_not_cache_embedding_invalidated_during_read(monkeypatch):
+    cache = _cache()
+    monkeypatch.setattr(ml_consumer, "get_video_embedding_cache", lambda: cache)
+
+    async def get_video_embeddings(video_ids):
+        # The update notification lands while the query is running
+        cache.invalidate(["v1"])
+        return [{"id": "v1", "embedding": np.full(DIMENSION, 1, dtype=np.float32)}]
+
+    monkeypatch.setattr(ml_consumer, "get_video_embeddings", get_video_embeddings)
+    video_rows, matrix = asyncio.run(ml_consumer.get_video_embedding_matrix(["v1"]))
+    # The caller still gets what it read, the cache does not keep it
+    assert video_rows == {"v1": 0}
+    assert np.allclose(matrix, _embeddings(1))
+    assert cache.get_many(["v1"])[2] == ["v1"]
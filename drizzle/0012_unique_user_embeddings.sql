@@ -0,0 +1,2 @@
+DELETE FROM "user_embeddings" "a" USING "user_embeddings" "b" WHERE "a"."user_id" = "b"."user_id" AND ("a"."updated_at", "a"."id") < ("b"."updated_at", "b"."id");--> statement-breakpoint
+ALTER TABLE "user_embeddings" ADD CONSTRAINT "user_embeddings_user_id_unique" UNIQUE("user_id");
\ No newline at end of file
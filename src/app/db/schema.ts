@@ -59,6 +59,7 @@ export const userEmbeddings = pgTable("user_embeddings", {
   id: uuid("id").primaryKey().defaultRandom().notNull(),
   userId: text("user_id")
     .notNull()
+    .unique() // One row per user, target of the bulk upsert
     .references(() => Users.id),
   embedding: vector("embedding").notNull(), // Store as JSON array initially, can move to pgvector later
   updatedAt: timestamp("updated_at")